@@ -9,6 +9,8 @@ const fileMsg = document.getElementById('file-msg');
 const transcribeBtn = document.getElementById('transcribe-btn');
 const outputContainer = document.getElementById('output-container');
 const statusMsg = document.getElementById('status-msg');
+const speakerControls = document.getElementById('speaker-controls');
+const transcriptionBox = document.getElementById('transcript-container');
 
 let currentFile = null;
 
@@ -82,44 +84,198 @@ function updateFileUI(filename) {
 }
 
 let transcriptData = null; // Global storage for JSON data
+let pagedClient = null; // Gradio client that fetches pages of a stored result
+
+// Long transcripts are virtualized: the segments are grouped into pages of
+// RENDER_PAGE_SIZE and only pages near the visible part of the list hold
+// rows. A page that scrolls far away keeps its measured height as an empty
+// placeholder and hands its rows to a pool for reuse. Results stored on the
+// server (format "paged", e.g. jobs) are fetched a page at a time from //segments.
+const RENDER_PAGE_SIZE = 200;
+const ESTIMATED_ROW_PX = 100;
+const pages = []; // { index, element, rows, mounted }
+const rowPool = [];
+const remotePages = new Map(); // page index -> segments, or 'loading'
+let renderGeneration = 0; // bumped per transcript so late page fetches are dropped
+
+const pageObserver = new IntersectionObserver((entries) => {
+    entries.forEach(entry => {
+        const page = pages[Number(entry.target.dataset.page)];
+        if (!page || page.element !== entry.target) return;
+        if (entry.isIntersecting) mountPage(page);
+        else unmountPage(page);
+    });
+}, { root: transcriptionBox, rootMargin: '1200px 0px' });
 
-// Helper: Format speakers into dynamic HTML blocks
-function renderTranscript() {
-    const transcriptionBox = document.getElementById('transcript-container');
-    transcriptionBox.innerHTML = '';
+function formatTime(seconds) {
+    const mins = Math.floor(seconds / 60);
+    const secs = Math.floor(seconds % 60);
+    return `${String(mins).padStart(2, '0')}:${String(secs).padStart(2, '0')}`;
+}
+
+// Results come as a list of segment objects, in the compact columnar
+// format (start/end/speaker index/text arrays, used for long files) or as
+// the first page of a result stored on the server (format "paged")
+function segmentCount() {
+    if (transcriptData.format === 'paged') return transcriptData.total;
+    return transcriptData.segments ? transcriptData.segments.length : transcriptData.start.length;
+}
+
+function segmentAt(index) {
+    if (transcriptData.segments) return transcriptData.segments[index];
+    const start = transcriptData.start[index];
+    return {
+        start,
+        end: transcriptData.end[index],
+        speaker: transcriptData.unique_speakers[transcriptData.speaker[index]],
+        text: transcriptData.text[index],
+        formatted_time: formatTime(start),
+    };
+}
+
+// Segments of one page, or null while a stored page is still being fetched
+function pageSegments(pageIndex) {
+    const from = pageIndex * RENDER_PAGE_SIZE;
+    if (transcriptData.format === 'paged') {
+        const page = remotePages.get(pageIndex);
+        if (Array.isArray(page)) return page;
+        if (!page) fetchPage(pageIndex, from);
+        return null;
+    }
+    const to = Math.min(segmentCount(), from + RENDER_PAGE_SIZE);
+    const segments = [];
+    for (let index = from; index < to; index++) segments.push(segmentAt(index));
+    return segments;
+}
 
-    transcriptData.segments.forEach((seg, index) => {
-        const block = document.createElement('div');
-        block.className = 'transcript-block';
-        block.dataset.speaker = seg.speaker;
-
-        const header = document.createElement('div');
-        header.className = 'transcript-header';
-
-        const speakerLabel = document.createElement('span');
-        speakerLabel.className = 'speaker-label';
-        // Check if there is a custom name stored for this speaker key, or use default
-        const customName = document.getElementById(`input-${seg.speaker}`)?.value || seg.speaker;
-        speakerLabel.textContent = customName;
-        speakerLabel.id = `label-${seg.speaker}-${index}`; // Unique ID helper
-
-        const timeLabel = document.createElement('span');
-        timeLabel.className = 'timestamp';
-        // seg.formatted_time should come from backend
-        timeLabel.textContent = seg.formatted_time || "";
-
-        header.appendChild(speakerLabel);
-        header.appendChild(timeLabel);
-
-        const textP = document.createElement('div');
-        textP.className = 'transcript-text';
-        textP.textContent = seg.text;
-
-        block.appendChild(header);
-        block.appendChild(textP);
-        const transcriptionBox = document.getElementById('transcript-container');
-        transcriptionBox.appendChild(block);
+async function fetchPage(pageIndex, from) {
+    const generation = renderGeneration;
+    remotePages.set(pageIndex, 'loading');
+    try {
+        const page = (await pagedClient.predict("//segments", [
+            transcriptData.result_id, from, RENDER_PAGE_SIZE, null, null,
+        ])).data[0];
+        if (generation !== renderGeneration) return;
+        if (page.error) throw new Error(page.error);
+        remotePages.set(pageIndex, page.segments);
+        if (pages[pageIndex]?.mounted) fillPage(pages[pageIndex]);
+    } catch (error) {
+        if (generation !== renderGeneration) return;
+        // Tried again when the page next scrolls into view
+        remotePages.delete(pageIndex);
+        showStatus(`Fel: ${error.message}`, 'error');
+    }
+}
+
+function speakerName(speaker) {
+    // Custom name from the speaker controls, or the speaker key
+    return document.getElementById(`input-${speaker}`)?.value || speaker;
+}
+
+function createSegmentBlock() {
+    const block = document.createElement('div');
+    block.className = 'transcript-block';
+
+    const header = document.createElement('div');
+    header.className = 'transcript-header';
+
+    const speakerLabel = document.createElement('span');
+    speakerLabel.className = 'speaker-label';
+
+    const timeLabel = document.createElement('span');
+    timeLabel.className = 'timestamp';
+
+    header.appendChild(speakerLabel);
+    header.appendChild(timeLabel);
+
+    const textP = document.createElement('div');
+    textP.className = 'transcript-text';
+
+    block.appendChild(header);
+    block.appendChild(textP);
+    block.parts = { speakerLabel, timeLabel, textP };
+    return block;
+}
+
+function fillSegmentBlock(block, seg) {
+    block.dataset.speaker = seg.speaker;
+    block.parts.speakerLabel.textContent = speakerName(seg.speaker);
+    block.parts.timeLabel.textContent = seg.formatted_time || formatTime(seg.start);
+    block.parts.textP.textContent = seg.text;
+}
+
+function releaseRows(page) {
+    page.rows.forEach(row => {
+        row.remove();
+        rowPool.push(row);
+    });
+    page.rows = [];
+}
+
+function fillPage(page) {
+    const segments = pageSegments(page.index);
+    if (!segments) return; // keeps its placeholder height until the page arrives
+    releaseRows(page);
+    const fragment = document.createDocumentFragment();
+    segments.forEach(seg => {
+        const row = rowPool.pop() || createSegmentBlock();
+        fillSegmentBlock(row, seg);
+        page.rows.push(row);
+        fragment.appendChild(row);
     });
+    page.element.appendChild(fragment);
+    page.element.style.height = '';
+}
+
+function mountPage(page) {
+    page.mounted = true;
+    fillPage(page);
+}
+
+function unmountPage(page) {
+    if (!page.mounted) return;
+    page.mounted = false;
+    // Keep the space it took so the scroll position does not jump
+    if (page.rows.length) page.element.style.height = `${page.element.offsetHeight}px`;
+    releaseRows(page);
+}
+
+function estimatedHeight(pageIndex) {
+    const rows = Math.min(RENDER_PAGE_SIZE, segmentCount() - pageIndex * RENDER_PAGE_SIZE);
+    return `${rows * ESTIMATED_ROW_PX}px`;
+}
+
+function resetTranscript() {
+    renderGeneration++;
+    pages.forEach(page => {
+        pageObserver.unobserve(page.element);
+        releaseRows(page);
+    });
+    pages.length = 0;
+    remotePages.clear();
+    transcriptionBox.innerHTML = '';
+}
+
+// Helper: Format speakers into dynamic HTML blocks
+// Pages from fromIndex on are refreshed (streaming updates change the tail);
+// pages that do not exist yet are added as placeholders.
+function renderTranscript(fromIndex = 0) {
+    const count = Math.ceil(segmentCount() / RENDER_PAGE_SIZE);
+    for (let index = pages.length; index < count; index++) {
+        const element = document.createElement('div');
+        element.className = 'transcript-page';
+        element.dataset.page = index;
+        element.style.height = estimatedHeight(index);
+        pages.push({ index, element, rows: [], mounted: false });
+        transcriptionBox.appendChild(element);
+        // Reports right away whether the page is near the viewport
+        pageObserver.observe(element);
+    }
+    for (let index = Math.floor(fromIndex / RENDER_PAGE_SIZE); index < count; index++) {
+        const page = pages[index];
+        if (page.mounted) fillPage(page);
+        else page.element.style.height = estimatedHeight(index);
+    }
 }
 
 function renderSpeakerControls() {
@@ -160,8 +316,10 @@ function showResult(data) {
     }
 
     // Store data globally
-    // Data expected: { "segments": [...], "unique_speakers": [...] }
+    // Data expected: { "segments": [...], "unique_speakers": [...] }, the compact or the paged format
+    resetTranscript();
     transcriptData = data;
+    if (data.format === 'paged') remotePages.set(0, data.segments);
 
     // Render UI
     renderSpeakerControls();
@@ -174,6 +332,83 @@ function showResult(data) {
     outputContainer.scrollIntoView({ behavior: 'smooth' });
 }
 
+// Partial result while streaming: append new segments, speakers come at the end
+function showPartialResult(data) {
+    // Each message carries only the segments from data.start_index on;
+    // start_index 0 replaces the transcript (e.g. once speakers are known)
+    const firstUpdate = !transcriptData;
+    const from = data.start_index || 0;
+    if (firstUpdate || from === 0) {
+        transcriptData = { segments: data.segments, unique_speakers: data.unique_speakers };
+    } else {
+        transcriptData.segments.splice(from, Infinity, ...data.segments);
+        const speakers = new Set([...transcriptData.unique_speakers, ...data.unique_speakers]);
+        transcriptData.unique_speakers = [...speakers].sort();
+    }
+
+    if (firstUpdate) {
+        outputContainer.classList.add('visible');
+        outputContainer.style.display = 'block';
+    }
+    renderTranscript(from);
+}
+
+const JOB_MODE_MIN_BYTES = 25 * 1024 * 1024;
+const JOB_POLL_INTERVAL_MS = 3000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function transcribeStreaming(client) {
+    showStatus('Transkriberar... Texten visas efter hand.');
+
+    // Stream partial results: the generator endpoint yields the new segments
+    // after every 30 s window and a final result with speakers.
+    // Endpoint uses a double slash, same as //transcribe_v2 (backend config)
+    const job = client.submit("//transcribe_stream", [
+        currentFile,
+    ]);
+
+    for await (const msg of job) {
+        if (msg.type === 'status' && msg.stage === 'error') {
+            throw new Error(msg.message || 'Okänt fel från servern');
+        }
+        if (msg.type !== 'data') continue;
+
+        const responseData = msg.data[0];
+        if (responseData.error) throw new Error(responseData.error);
+
+        if (responseData.done) return responseData;
+        showPartialResult(responseData);
+        showStatus(`Transkriberar... ${Math.round((responseData.progress || 0) * 100)}%`);
+    }
+    throw new Error('Inget resultat mottogs');
+}
+
+async function transcribeAsJob(client) {
+    showStatus('Laddar upp filen...');
+    const submitted = (await client.predict("//job_submit", [currentFile])).data[0];
+    if (submitted.error) throw new Error(submitted.error);
+
+    // Poll until the worker is done; the server keeps the result for an hour
+    while (true) {
+        await sleep(JOB_POLL_INTERVAL_MS);
+        const status = (await client.predict("//job_status", [submitted.job_id])).data[0];
+        if (status.status === 'unknown') throw new Error(status.error);
+
+        if (status.status === 'queued') {
+            showStatus(`I kö (plats ${status.position})...`);
+        } else if (status.status === 'running') {
+            showStatus(`Transkriberar i bakgrunden... (${Math.round(status.elapsed_s)} s)`);
+        } else {
+            break;
+        }
+    }
+
+    const result = (await client.predict("//job_result", [submitted.job_id])).data[0];
+    if (result.error) throw new Error(result.error);
+    return result;
+}
+
 async function startTranscription() {
     if (!currentFile) {
         showStatus('Vänligen välj en ljudfil', 'error');
@@ -184,33 +419,22 @@ async function startTranscription() {
     setLoading(true);
     outputContainer.classList.remove('visible');
     speakerControls.innerHTML = ''; // Clear prev
-    transcriptionBox.innerHTML = ''; // Clear prev
+    resetTranscript(); // Clear prev
+    transcriptData = null;
     showStatus('Ansluter till Hugging Face...');
 
     try {
         // Connect to the Hugging Face Space
         const client = await Client.connect("zpo685d/svensk-transkribering");
+        pagedClient = client;
 
-        showStatus('Transkriberar... (Detta kan ta några minuter för långa filer)');
-
-        // Run prediction
-        // The API returns an object with 'data' array. Logic depends on app.py return type.
-        // Gradio Interface usually returns data[0] as the output.
-        // Endpoint found via client.view_api() is //transcribe_v2 (double slash required due to backend config)
-        const result = await client.predict("//transcribe_v2", [
-            currentFile,
-        ]);
-
-        const responseData = result.data[0];
-        // Check if response is JSON (obj) or error string
-        if (typeof responseData === 'string') {
-            // Fallback if backend returned string error
-            if (responseData.includes("❌")) throw new Error(responseData);
-            // Should not happen with new JSON backend, but handle legacy:
-            console.warn("Received string response, anticipated JSON.");
-        }
+        // Long recordings go through the background job queue instead of
+        // holding one streaming connection open for the whole run
+        const finalData = currentFile.size > JOB_MODE_MIN_BYTES
+            ? await transcribeAsJob(client)
+            : await transcribeStreaming(client);
 
-        showResult(responseData);
+        showResult(finalData);
         showStatus('Transkribering klar!');
 
     } catch (error) {
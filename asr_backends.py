@@ -0,0 +1,58 @@
+import os
+
+# Inference backends for the Whisper stage, chosen at startup with ASR_BACKEND:
+#   fp32  - plain PyTorch (reference)
+#   sdpa  - PyTorch with scaled_dot_product_attention kernels
+#   int8  - dynamic int8 quantization of all Linear layers (CPU)
+#   onnx  - ONNX Runtime export via optimum (optional dependency)
+ASR_BACKENDS = ("fp32", "sdpa", "int8", "onnx")
+
+# Exported ONNX models are kept here so the export only happens once
+ONNX_EXPORT_DIR = os.environ.get("ONNX_EXPORT_DIR", os.path.join(os.path.expanduser("~"), ".cache", "svensk-transkribering-onnx"))
+
+def build_asr_pipeline(model_name, backend="fp32", device="cpu"):
+    """
+    Build a transformers ASR pipeline for `model_name` on the given backend.
+    All backends return the same pipeline interface (raw arrays in,
+    text + timestamped chunks out).
+    """
+    from transformers import pipeline
+
+    if backend not in ASR_BACKENDS:
+        raise ValueError(f"Unknown ASR backend '{backend}', expected one of {', '.join(ASR_BACKENDS)}")
+
+    if backend == "fp32":
+        return pipeline("automatic-speech-recognition", model=model_name, device=device)
+
+    if backend == "sdpa":
+        return pipeline(
+            "automatic-speech-recognition", model=model_name, device=device,
+            model_kwargs={"attn_implementation": "sdpa"}
+        )
+
+    if backend == "int8":
+        import torch
+        asr = pipeline("automatic-speech-recognition", model=model_name, device=device)
+        asr.model = torch.ao.quantization.quantize_dynamic(asr.model, {torch.nn.Linear}, dtype=torch.qint8)
+        return asr
+
+    # onnx
+    try:
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+    except ImportError as e:
+        raise RuntimeError("ASR backend 'onnx' requires: pip install optimum[onnxruntime]") from e
+    from transformers import AutoProcessor
+
+    export_dir = os.path.join(ONNX_EXPORT_DIR, model_name.replace("/", "--"))
+    if os.path.isdir(export_dir):
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(export_dir)
+    else:
+        print(f"Exporting {model_name} to ONNX in {export_dir} (one-time)...", flush=True)
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(model_name, export=True)
+        model.save_pretrained(export_dir)
+    processor = AutoProcessor.from_pretrained(model_name)
+    return pipeline(
+        "automatic-speech-recognition", model=model,
+        tokenizer=processor.tokenizer, feature_extractor=processor.feature_extractor,
+        device=device
+    )
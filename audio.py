@@ -0,0 +1,100 @@
+import subprocess
+
+import imageio_ffmpeg
+import numpy as np
+
+# Both Whisper and pyannote work on 16 kHz mono
+SAMPLE_RATE = 16000
+
+def load_audio(audio_file, sr=SAMPLE_RATE):
+    """
+    Decode and resample an audio file once with ffmpeg.
+    Returns a writable 1-D float32 array (mono, `sr` Hz).
+    """
+    cmd = [
+        imageio_ffmpeg.get_ffmpeg_exe(),
+        "-nostdin", "-loglevel", "error",
+        "-i", audio_file,
+        "-f", "f32le", "-acodec", "pcm_f32le",
+        "-ac", "1", "-ar", str(sr),
+        "-",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    # Read straight into one growing buffer so the samples are not copied again
+    buf = bytearray()
+    while True:
+        block = proc.stdout.read(1 << 20)
+        if not block:
+            break
+        buf += block
+    err = proc.stderr.read()
+    proc.wait()
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode {audio_file}: {err.decode(errors='replace').strip()}")
+    if not buf:
+        raise RuntimeError(f"ffmpeg returned no audio for {audio_file}")
+
+    return np.frombuffer(buf, dtype=np.float32)
+
+def diarization_input(waveform, sr=SAMPLE_RATE):
+    # pyannote accepts an in-memory {"waveform": (channel, time) tensor, "sample_rate"} dict.
+    # torch.from_numpy shares the buffer with the numpy array.
+    try:
+        import torch
+    except ImportError:
+        # Only the stub pipelines (stub_models.py) run without torch
+        return {"waveform": waveform[np.newaxis, :], "sample_rate": sr}
+    return {"waveform": torch.from_numpy(waveform).unsqueeze(0), "sample_rate": sr}
+
+def speech_regions(waveform, sr=SAMPLE_RATE, frame_s=0.03, margin_db=12.0, floor_db=-60.0,
+                   min_speech_s=0.25, min_silence_s=1.0, pad_s=0.2):
+    """
+    Lightweight energy-based voice activity detection.
+    Returns a sorted list of (start, end) seconds that contain speech.
+
+    A frame counts as speech when its energy is `margin_db` above the
+    recording's noise floor (10th percentile of frame energies), or
+    close to its loud level when there are no real pauses. Pauses
+    shorter than `min_silence_s` are bridged, blips shorter than
+    `min_speech_s` are dropped and every region is padded by `pad_s`
+    so word onsets are not clipped.
+    """
+    frame = max(1, int(frame_s * sr))
+    num_frames = len(waveform) // frame
+    if num_frames == 0:
+        return [(0.0, len(waveform) / sr)] if len(waveform) else []
+
+    frames = waveform[:num_frames * frame].reshape(num_frames, frame)
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    noise_db, loud_db = np.percentile(energy_db, [10, 90])
+    # Recordings without real pauses (small dynamic range) count as all speech
+    threshold = max(min(noise_db + margin_db, loud_db - 6.0), floor_db)
+    is_speech = energy_db > threshold
+
+    # Edges of runs of speech frames
+    padded = np.concatenate(([False], is_speech, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    runs = [(float(s) * frame / sr, float(e) * frame / sr) for s, e in zip(edges[::2], edges[1::2])]
+
+    # Bridge short pauses, then drop short blips
+    merged = []
+    for start, end in runs:
+        if merged and start - merged[-1][1] < min_silence_s:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    merged = [(s, e) for s, e in merged if e - s >= min_speech_s]
+
+    # Pad and clip to the recording, merging regions that now touch
+    duration = len(waveform) / sr
+    regions = []
+    for start, end in merged:
+        start = max(0.0, start - pad_s)
+        end = min(duration, end + pad_s)
+        if regions and start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    return regions
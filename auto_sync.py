@@ -1,52 +1,236 @@
-import time
+import ctypes
+import ctypes.util
 import os
+import select
+import struct
 import subprocess
+import sys
+import time
 from datetime import datetime
 
 WATCH_DIR = "."
-POLL_INTERVAL = 10  # Check every 10 seconds
-
-def get_last_modified_time():
-    last_mtime = 0
-    for root, dirs, files in os.walk(WATCH_DIR):
-        if ".git" in dirs:
-            dirs.remove(".git")
-        for f in files:
-            path = os.path.join(root, f)
+POLL_INTERVAL = 10  # Fallback: check `git status` every 10 seconds
+DEBOUNCE_S = 2      # Sync once no file has changed for this long...
+MAX_WAIT_S = 30     # ...but at the latest this long after the first change
+GIT_ARGS_BATCH = 500  # Paths per `git add` call (command line length)
+
+# inotify(7) constants
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ATTRIB
+EVENT_HEADER = struct.Struct("iIII")
+
+def git(*args, input=None):
+    return subprocess.run(["git", *args], cwd=WATCH_DIR, input=input, capture_output=True)
+
+def filter_ignored(paths):
+    # Drop paths matched by .gitignore (one `git check-ignore` call per batch)
+    paths = sorted(set(paths))
+    if not paths:
+        return []
+    result = git("check-ignore", "--stdin", "-z", input="\0".join(paths).encode())
+    ignored = set(result.stdout.decode(errors="surrogateescape").split("\0"))
+    return [p for p in paths if p not in ignored]
+
+def git_status_paths():
+    # Changed, deleted and untracked (not ignored) files according to git
+    result = git("status", "--porcelain", "-z", "--untracked-files=all")
+    entries = result.stdout.decode(errors="surrogateescape").split("\0")
+    paths = []
+    i = 0
+    while i < len(entries):
+        entry = entries[i]
+        if len(entry) > 3:
+            paths.append(entry[3:])
+            # Renames are followed by the old path
+            if entry[0] in "RC":
+                i += 1
+                paths.append(entries[i])
+        i += 1
+    return paths
+
+class InotifyWatcher:
+    """
+    Recursive watcher on top of Linux inotify (through ctypes). Keeps one
+    watch per directory, skipping .git and ignored directories, and
+    returns the relative paths that changed.
+    """
+
+    def __init__(self, root):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = os.path.abspath(root)
+        self.dirs = {}  # watch descriptor -> relative directory
+        self.overflowed = False
+        self.watch_tree("")
+
+    def watch_tree(self, rel_dir):
+        # Watch rel_dir and its subdirectories; returns the files found in
+        # them, which may have been written before their watch existed
+        found = []
+        for root, dirs, files in os.walk(os.path.join(self.root, rel_dir)):
+            rel_root = os.path.relpath(root, self.root)
+            rel_root = "" if rel_root == "." else rel_root
+            if ".git" in dirs:
+                dirs.remove(".git")
+            # Do not descend into ignored directories (caches, uploads, venvs)
+            keep = set(filter_ignored([os.path.join(rel_root, d) + "/" for d in dirs]))
+            dirs[:] = [d for d in dirs if os.path.join(rel_root, d) + "/" in keep]
+            wd = self._add_watch(self.fd, root.encode(errors="surrogateescape"), WATCH_MASK)
+            if wd < 0:
+                print(f"Cannot watch {root}: {os.strerror(ctypes.get_errno())}")
+                continue
+            self.dirs[wd] = rel_root
+            found += [os.path.join(rel_root, f) for f in files]
+        return found
+
+    def wait(self, timeout):
+        # Changed paths within `timeout` seconds (empty list on timeout)
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        changed = []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0").decode(errors="surrogateescape")
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; the caller rescans with git status
+                self.overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            rel_dir = self.dirs.get(wd)
+            if rel_dir is None or not name:
+                continue
+            path = os.path.join(rel_dir, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and filter_ignored([path + "/"]):
+                    changed += self.watch_tree(path)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    # Files inside are reported to git as deleted
+                    changed.append(path)
+                continue
+            changed.append(path)
+        return changed
+
+class PollingWatcher:
+    # Fallback without inotify (Windows, macOS): let git find the changes.
+    # git status only stats tracked files against its index and honors
+    # .gitignore, so this is far cheaper than walking the tree.
+    def __init__(self, root):
+        self.overflowed = False
+        self.last = self._snapshot()
+
+    def _snapshot(self):
+        # Dirty path -> mtime, so further edits to an already dirty file count too
+        snapshot = {}
+        for path in git_status_paths():
             try:
-                mtime = os.path.getmtime(path)
-                if mtime > last_mtime:
-                    last_mtime = mtime
+                snapshot[path] = os.path.getmtime(os.path.join(WATCH_DIR, path))
             except OSError:
-                continue
-    return last_mtime
+                snapshot[path] = None
+        return snapshot
 
-def git_push():
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}] Changes detected. Syncing...")
-    
-    # Git commands
-    commands = [
-        ['git', 'add', '.'],
-        ['git', 'commit', '-m', f"Auto-sync: {timestamp}"],
-        ['git', 'push', 'origin', 'main']
-    ]
-    
-    for cmd in commands:
+    def wait(self, timeout):
+        time.sleep(min(timeout, POLL_INTERVAL) if timeout is not None else POLL_INTERVAL)
+        current = self._snapshot()
+        # New or re-modified changes, and paths that are clean again (e.g. reverted)
+        changed = [p for p, mtime in current.items() if self.last.get(p, -1) != mtime]
+        changed += [p for p in self.last if p not in current]
+        self.last = current
+        return changed
+
+def make_watcher(root):
+    if sys.platform.startswith("linux"):
         try:
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except subprocess.CalledProcessError:
-            pass # Ignore errors (e.g. nothing to commit)
-
-print("Starting Auto-Sync Watcher...")
-last_known_mtime = get_last_modified_time()
-
-while True:
-    time.sleep(POLL_INTERVAL)
-    current_mtime = get_last_modified_time()
-    
-    if current_mtime > last_known_mtime:
-        # Wait a bit more to ensure writes are finished
-        time.sleep(2)
-        git_push()
-        last_known_mtime = get_last_modified_time()
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print(f"inotify unavailable ({e}), polling git status every {POLL_INTERVAL}s")
+    return PollingWatcher(root)
+
+def stageable(paths):
+    # A pathspec that matches nothing makes `git add` fail, so drop files
+    # that were created and deleted again (editor temp files) before a sync
+    missing = [p for p in paths if not os.path.lexists(os.path.join(WATCH_DIR, p))]
+    if not missing:
+        return paths
+    tracked = git("ls-files", "-z", "--", *missing).stdout.decode(errors="surrogateescape").split("\0")
+    known = {p for p in missing if any(t == p or t.startswith(p.rstrip("/") + "/") for t in tracked if t)}
+    return [p for p in paths if p not in missing or p in known]
+
+def git_push(paths):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    paths = stageable(paths)
+    if not paths:
+        return
+    print(f"[{timestamp}] {len(paths)} changed file(s). Syncing...")
+
+    # Stage only what changed; -A also records deletions of these paths
+    for i in range(0, len(paths), GIT_ARGS_BATCH):
+        git("add", "-A", "--", *paths[i:i + GIT_ARGS_BATCH])
+
+    if git("diff", "--cached", "--quiet").returncode == 0:
+        return  # Nothing to commit (e.g. files written back unchanged)
+
+    for cmd in (["commit", "-m", f"Auto-sync: {timestamp}"], ["push", "origin", "main"]):
+        result = git(*cmd)
+        if result.returncode != 0:
+            print(f"git {cmd[0]} failed: {result.stderr.decode(errors='replace').strip()}")
+            return
+
+def main():
+    print("Starting Auto-Sync Watcher...")
+    watcher = make_watcher(WATCH_DIR)
+    print(f"Watching with {type(watcher).__name__}")
+
+    pending = set()
+    first_change = last_change = None
+    while True:
+        if pending:
+            timeout = max(0.0, min(last_change + DEBOUNCE_S, first_change + MAX_WAIT_S) - time.monotonic())
+        else:
+            timeout = None
+        changed = watcher.wait(timeout)
+
+        if watcher.overflowed:
+            watcher.overflowed = False
+            changed += git_status_paths()
+        if changed:
+            now = time.monotonic()
+            pending.update(changed)
+            first_change = first_change or now
+            last_change = now
+
+        # Quiet for DEBOUNCE_S, or MAX_WAIT_S of continuous writes: sync the batch
+        if pending and time.monotonic() >= min(last_change + DEBOUNCE_S, first_change + MAX_WAIT_S):
+            paths = filter_ignored(pending)
+            pending.clear()
+            first_change = last_change = None
+            if paths:
+                git_push(paths)
+
+if __name__ == "__main__":
+    main()
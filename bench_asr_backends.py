@@ -0,0 +1,170 @@
+"""
+Accuracy/latency benchmark for the Whisper inference backends.
+
+Runs every backend in asr_backends.py over a fixed Swedish test set and
+reports real-time factor (processing time / audio duration) and word error
+rate, both against the reference transcripts and relative to fp32.
+
+The test set is a JSONL manifest with one {"audio": path, "text": reference}
+per line (relative paths are resolved against the manifest), or a directory
+where every audio file has a .txt reference with the same name.
+
+Usage: python bench_asr_backends.py TEST_SET [--backends fp32 int8 sdpa onnx] [--json out.json]
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from asr_backends import ASR_BACKENDS, build_asr_pipeline
+from audio import SAMPLE_RATE, load_audio
+from transcriber import ASR_BATCH_SIZE, MODEL_NAME
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm")
+
+def load_test_set(path):
+    items = []
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            stem, ext = os.path.splitext(name)
+            ref_path = os.path.join(path, stem + ".txt")
+            if ext.lower() in AUDIO_EXTENSIONS and os.path.exists(ref_path):
+                with open(ref_path, encoding="utf-8") as f:
+                    items.append({"audio": os.path.join(path, name), "text": f.read()})
+    else:
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    item["audio"] = os.path.join(base, item["audio"])
+                    items.append(item)
+    if not items:
+        raise SystemExit(f"No audio/reference pairs found in {path}")
+    return items
+
+def normalize(text):
+    # Lowercase, drop punctuation, keep Swedish letters and digits
+    text = text.lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return text.split()
+
+def word_errors(reference, hypothesis):
+    # Levenshtein distance over words (substitutions + insertions + deletions)
+    ref = normalize(reference)
+    hyp = normalize(hypothesis)
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1], len(ref)
+
+def run_backend(backend, test_set, waveforms, threads):
+    import torch
+    torch.set_num_threads(threads)
+
+    t0 = time.perf_counter()
+    asr = build_asr_pipeline(MODEL_NAME, backend)
+    load_s = time.perf_counter() - t0
+
+    # One untimed pass so lazy initialisation does not count against the first file
+    asr(waveforms[0][:SAMPLE_RATE], return_timestamps=True)
+
+    hypotheses = []
+    processing_s = 0.0
+    for waveform in waveforms:
+        t0 = time.perf_counter()
+        result = asr(waveform, chunk_length_s=30, batch_size=ASR_BATCH_SIZE, return_timestamps=True)
+        processing_s += time.perf_counter() - t0
+        hypotheses.append(result.get("text", ""))
+
+    errors = words = 0
+    for item, hyp in zip(test_set, hypotheses):
+        e, n = word_errors(item["text"], hyp)
+        errors += e
+        words += n
+
+    audio_s = sum(len(w) for w in waveforms) / SAMPLE_RATE
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "processing_s": round(processing_s, 2),
+        "rtf": processing_s / audio_s,
+        "wer": errors / max(words, 1),
+    }, hypotheses
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("test_set", help="JSONL manifest or directory with audio + .txt references")
+    parser.add_argument("--backends", nargs="+", default=list(ASR_BACKENDS), choices=ASR_BACKENDS)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="torch intra-op threads")
+    parser.add_argument("--max-wer-increase", type=float, default=0.01,
+                        help="Largest absolute WER increase over fp32 accepted when recommending a backend")
+    parser.add_argument("--json", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    test_set = load_test_set(args.test_set)
+    waveforms = [load_audio(item["audio"]) for item in test_set]
+    audio_s = sum(len(w) for w in waveforms) / SAMPLE_RATE
+    print(f"{len(test_set)} files, {audio_s / 60:.1f} min audio, model {MODEL_NAME}, {args.threads} threads")
+
+    backends = list(args.backends)
+    if "fp32" not in backends:
+        backends.insert(0, "fp32")  # baseline is always needed
+    else:
+        backends.sort(key=lambda b: b != "fp32")
+
+    rows = []
+    baseline_hyps = None
+    for backend in backends:
+        try:
+            row, hyps = run_backend(backend, test_set, waveforms, args.threads)
+        except Exception as e:
+            # Every comparison is relative to fp32; without it there is nothing to report
+            if backend == "fp32":
+                raise SystemExit(f"fp32 baseline failed: {e}")
+            print(f"{backend:>6}: skipped ({e})")
+            rows.append({"backend": backend, "error": str(e)})
+            continue
+
+        if backend == "fp32":
+            baseline_hyps = hyps
+        # WER of this backend's output against the fp32 output
+        errors = words = 0
+        for ref, hyp in zip(baseline_hyps, hyps):
+            e, n = word_errors(ref, hyp)
+            errors += e
+            words += n
+        row["wer_vs_fp32"] = errors / max(words, 1)
+        rows.append(row)
+
+    baseline = rows[0]
+    print(f"\n{'backend':>8} {'load s':>8} {'RTF':>7} {'speedup':>8} {'WER':>7} {'vs fp32':>8}")
+    for row in rows:
+        if "error" in row:
+            continue
+        speedup = baseline["rtf"] / row["rtf"]
+        print(f"{row['backend']:>8} {row['load_s']:>8.1f} {row['rtf']:>7.3f} {speedup:>7.2f}x "
+              f"{row['wer'] * 100:>6.2f}% {row['wer_vs_fp32'] * 100:>7.2f}%")
+
+    acceptable = [r for r in rows if "error" not in r and r["wer"] <= baseline["wer"] + args.max_wer_increase]
+    recommended = min(acceptable, key=lambda r: r["rtf"])["backend"]
+    print(f"\nFastest backend within +{args.max_wer_increase * 100:.1f}% WER of fp32: {recommended}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "benchmark": "asr_backends",
+                "model": MODEL_NAME,
+                "files": len(test_set),
+                "audio_s": audio_s,
+                "threads": args.threads,
+                "results": rows,
+                "recommended": recommended,
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark for merge_transcription.
+
+Compares the indexed merge in merge.py against the original nested-loop
+version on synthetic meetings with a growing number of diarization turns,
+and checks that both produce exactly the same JSON.
+
+Usage: python bench_merge.py [--turns 1000 10000 50000] [--json out.json]
+"""
+import argparse
+import json
+import random
+import time
+from collections import namedtuple
+
+from merge import format_time, merge_transcription
+
+Turn = namedtuple("Turn", ["start", "end"])
+
+class FakeAnnotation:
+    # Minimal stand-in for pyannote.core.Annotation (sorted itertracks)
+    def __init__(self, turns):
+        self.turns = sorted(turns, key=lambda t: (t[0], t[1]))
+
+    def __len__(self):
+        return len(self.turns)
+
+    def itertracks(self, yield_label=False):
+        for i, (start, end, speaker) in enumerate(self.turns):
+            yield Turn(start, end), i, speaker
+
+def merge_transcription_legacy(whisper_chunks, diarization):
+    # Original O(chunks x turns) implementation, kept as the reference
+    segments = []
+    unique_speakers = set()
+
+    for chunk in whisper_chunks:
+        text = chunk.get("text", "").strip()
+        start = chunk.get("timestamp", [0, 0])[0]
+        end = chunk.get("timestamp", [0, 0])[1]
+
+        if end is None: end = start + 2.0
+
+        speaking_durations = {}
+        if diarization:
+            for turn, _, speaker in diarization.itertracks(yield_label=True):
+                overlap_start = max(start, turn.start)
+                overlap_end = min(end, turn.end)
+                if overlap_end > overlap_start:
+                    dur = overlap_end - overlap_start
+                    speaking_durations[speaker] = speaking_durations.get(speaker, 0) + dur
+
+        if speaking_durations:
+            best_speaker = max(speaking_durations, key=speaking_durations.get)
+        else:
+            best_speaker = "Unknown"
+
+        unique_speakers.add(best_speaker)
+        segments.append({
+            "start": start,
+            "end": end,
+            "speaker": best_speaker,
+            "text": text,
+            "formatted_time": format_time(start)
+        })
+
+    return {
+        "segments": segments,
+        "unique_speakers": sorted(list(unique_speakers))
+    }
+
+def synthetic_meeting(num_turns, num_speakers=6, seed=0):
+    # Alternating turns of 0.5-8 s with occasional overlapping speech
+    rng = random.Random(seed)
+    turns = []
+    t = 0.0
+    for _ in range(num_turns):
+        dur = rng.uniform(0.5, 8.0)
+        speaker = f"SPEAKER_{rng.randrange(num_speakers):02d}"
+        turns.append((t, t + dur, speaker))
+        if rng.random() < 0.15:
+            t += dur * rng.uniform(0.3, 0.9)  # overlap with the next turn
+        else:
+            t += dur + rng.uniform(0.0, 1.5)
+    duration = t
+
+    # Whisper-like chunks of 1-10 s, last one with an open end
+    chunks = []
+    t = 0.0
+    while t < duration:
+        dur = rng.uniform(1.0, 10.0)
+        chunks.append({"timestamp": (round(t, 2), round(t + dur, 2)), "text": " lorem ipsum"})
+        t += dur
+    if chunks:
+        chunks[-1]["timestamp"] = (chunks[-1]["timestamp"][0], None)
+    return chunks, FakeAnnotation(turns), duration
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[100, 1000, 5000, 20000, 50000])
+    parser.add_argument("--legacy-max-turns", type=int, default=5000,
+                        help="Skip the slow reference implementation above this size")
+    parser.add_argument("--json", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    rows = []
+    print(f"{'turns':>8} {'chunks':>8} {'audio':>8} {'legacy s':>10} {'indexed s':>10} {'speedup':>8}")
+    for num_turns in args.turns:
+        chunks, annotation, duration = synthetic_meeting(num_turns)
+        new_result, new_time = timed(merge_transcription, chunks, annotation)
+
+        legacy_time = None
+        if num_turns <= args.legacy_max_turns:
+            legacy_result, legacy_time = timed(merge_transcription_legacy, chunks, annotation)
+            if legacy_result != new_result:
+                raise SystemExit(f"Output mismatch at {num_turns} turns")
+
+        rows.append({
+            "turns": num_turns,
+            "chunks": len(chunks),
+            "audio_hours": round(duration / 3600, 2),
+            "legacy_s": legacy_time,
+            "indexed_s": new_time,
+        })
+        speedup = f"{legacy_time / new_time:.0f}x" if legacy_time else "-"
+        legacy_str = f"{legacy_time:.3f}" if legacy_time else "-"
+        print(f"{num_turns:>8} {len(chunks):>8} {duration / 3600:>7.1f}h {legacy_str:>10} {new_time:>10.4f} {speedup:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "merge_transcription", "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
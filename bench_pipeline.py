@@ -0,0 +1,186 @@
+"""
+Offline per-stage benchmark for the transcription pipeline.
+
+Generates synthetic multi-speaker recordings of the requested lengths,
+writes them to WAV and times each stage of transcribe_audio on them:
+decode (ffmpeg), vad, asr, diarization and merge_transcription. Runs with
+the real models or with the deterministic stubs from stub_models.py.
+
+Results are written as JSON so runs can be compared between commits:
+
+    python bench_pipeline.py --stub --json bench.json
+    python bench_pipeline.py --stub --compare bench.json   # after a change
+
+Usage: python bench_pipeline.py [--stub] [--durations 60 600 3600] [--speakers 3]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+
+def synthetic_meeting_audio(duration_s, num_speakers=3, seed=0):
+    """
+    Speech-like test signal: each speaker is a harmonic tone complex with
+    its own pitch, amplitude-modulated at a syllable rate, taking turns
+    with short pauses and background noise. Returns (waveform, turns).
+    """
+    rng = np.random.default_rng(seed)
+    total = int(duration_s * SAMPLE_RATE)
+    waveform = (rng.standard_normal(total) * 0.002).astype(np.float32)
+    pitches = [110 + 45 * i for i in range(num_speakers)]
+
+    turns = []
+    t = 0.0
+    while t < duration_s:
+        speaker = int(rng.integers(num_speakers))
+        turn_s = float(rng.uniform(2.0, 12.0))
+        start, end = t, min(duration_s, t + turn_s)
+        n = int(end * SAMPLE_RATE) - int(start * SAMPLE_RATE)
+        tt = np.arange(n) / SAMPLE_RATE
+        f0 = pitches[speaker] * (1 + 0.05 * np.sin(2 * np.pi * 0.3 * tt))
+        phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+        voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * 4.0 * tt)) ** 2
+        begin = int(start * SAMPLE_RATE)
+        waveform[begin:begin + n] += (0.08 * voice * envelope).astype(np.float32)
+        turns.append((start, end, f"SPEAKER_{speaker:02d}"))
+        t = end + float(rng.uniform(0.2, 3.0))
+    return waveform, turns
+
+def write_wav(path, waveform):
+    pcm = (np.clip(waveform, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm.tobytes())
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def timed(timings, name, fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    timings[name] = time.perf_counter() - t0
+    return result
+
+def bench_file(transcriber, path, duration_s):
+    from audio import load_audio, speech_regions
+    from merge import extract_turns, merge_transcription
+
+    timings = {}
+    waveform = timed(timings, "decode", load_audio, path)
+    timed(timings, "vad", lambda w: speech_regions(w, **transcriber.VAD_PARAMS), waveform)
+    whisper_result = timed(timings, "asr", transcriber.run_asr, waveform)
+    diarization = timed(timings, "diarization", transcriber.run_diarization, waveform)
+    turns = extract_turns(diarization)
+
+    result = timed(timings, "merge", merge_transcription, whisper_result.get("chunks", []), turns)
+
+    return {
+        "duration_s": duration_s,
+        "segments": len(result["segments"]),
+        "turns": len(turns),
+        "stages_s": {k: round(v, 4) for k, v in timings.items()},
+        "rtf": {k: v / duration_s for k, v in timings.items()},
+    }
+
+def compare(previous_path, runs, tolerance, min_seconds):
+    with open(previous_path) as f:
+        previous = {r["duration_s"]: r for r in json.load(f)["runs"]}
+    regressions = []
+    for run in runs:
+        old = previous.get(run["duration_s"])
+        if not old:
+            continue
+        for stage, rtf in run["rtf"].items():
+            old_rtf = old["rtf"].get(stage)
+            # Ignore stages too fast to time reliably
+            if old_rtf and run["stages_s"][stage] >= min_seconds and rtf > old_rtf * (1 + tolerance):
+                regressions.append(f"{run['duration_s']}s {stage}: RTF {old_rtf:.4f} -> {rtf:.4f} (+{(rtf / old_rtf - 1) * 100:.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stub", action="store_true", help="Use the deterministic stub models")
+    parser.add_argument("--durations", type=float, nargs="+", default=[60, 600, 1800])
+    parser.add_argument("--speakers", type=int, default=3)
+    parser.add_argument("--json", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Previous JSON result to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative RTF increase per stage")
+    parser.add_argument("--min-seconds", type=float, default=0.1, help="Stages faster than this are not compared")
+    parser.add_argument("--repeat", type=int, default=1, help="Run each length N times and keep the fastest stage times")
+    args = parser.parse_args()
+
+    # Benchmarks never read or fill the result cache
+    os.environ["CACHE_DIR"] = ""
+    if args.stub:
+        os.environ["STUB_MODELS"] = "1"
+    import transcriber
+
+    t0 = time.perf_counter()
+    transcriber.load_models()
+    load_s = time.perf_counter() - t0
+    if transcriber.pipe is None:
+        raise SystemExit(f"Models failed to load: {transcriber.model_status.get('error')}")
+    if transcriber.diarization_pipe is None:
+        raise SystemExit("Diarization pipeline not available (check HF_TOKEN)")
+
+    runs = []
+    print(f"{'audio':>8} " + " ".join(f"{s:>12}" for s in ("decode", "vad", "asr", "diarization", "merge")) + "   (seconds / RTF)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration_s in args.durations:
+            waveform, _ = synthetic_meeting_audio(duration_s, args.speakers)
+            path = os.path.join(tmp, f"meeting_{int(duration_s)}s.wav")
+            write_wav(path, waveform)
+            del waveform
+
+            attempts = [bench_file(transcriber, path, duration_s) for _ in range(max(1, args.repeat))]
+            run = attempts[0]
+            for stage in run["stages_s"]:
+                best = min(a["stages_s"][stage] for a in attempts)
+                run["stages_s"][stage] = best
+                run["rtf"][stage] = best / duration_s
+            runs.append(run)
+            print(f"{duration_s:>7.0f}s " + " ".join(
+                f"{run['stages_s'][s]:>6.2f}/{run['rtf'][s]:<5.3f}" for s in ("decode", "vad", "asr", "diarization", "merge")
+            ))
+
+    report = {
+        "benchmark": "pipeline",
+        "commit": git_commit(),
+        "mode": "stub" if args.stub else "real",
+        "asr_backend": transcriber.model_status.get("asr_backend"),
+        "model": transcriber.MODEL_NAME,
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "model_load_s": load_s,
+        "runs": runs,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        regressions = compare(args.compare, runs, args.tolerance, args.min_seconds)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Speedup of sharded long-file transcription (sharding.py) versus cores.
+
+Transcribes one synthetic recording in a single process (run_asr with all
+ASR threads), then sharded across 1, 2, 4, ... worker processes that
+split the same cores between them. Reports wall time, RTF, speedup over
+the single process and parallel efficiency (speedup / workers), and
+checks that the stitched timeline has no duplicated or out-of-order
+chunks.
+
+With --stub the model time is simulated (stub_models.py), so the numbers
+only show scheduling and stitching overhead; use the real model to
+measure actual scaling.
+
+Usage: python bench_sharding.py [--stub] [--duration 3600] [--workers 1 2 4] [--shard-s 600] [--overlap-s 30]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from bench_pipeline import git_commit, synthetic_meeting_audio, write_wav
+
+def check_timeline(chunks):
+    # Stitched chunks must be in order and must not repeat across seams
+    problems = 0
+    for prev, chunk in zip(chunks, chunks[1:]):
+        if chunk["timestamp"][0] < prev["timestamp"][0]:
+            problems += 1
+        elif chunk["text"].strip() == prev["text"].strip() and chunk["timestamp"][0] < (prev["timestamp"][1] or 0):
+            problems += 1
+    return problems
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    default_workers = [n for n in (1, 2, 4, 8, 16) if n <= cpu_count] or [1]
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stub", action="store_true", help="Use the deterministic stub models")
+    parser.add_argument("--duration", type=float, default=3600, help="Length of the synthetic recording in seconds")
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers)
+    parser.add_argument("--shard-s", type=float, default=600)
+    parser.add_argument("--overlap-s", type=float, default=30)
+    parser.add_argument("--json", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    # Benchmarks never read or fill the result cache
+    os.environ["CACHE_DIR"] = ""
+    os.environ["SHARD_WORKERS"] = "0"
+    # The single-process baseline gets every core
+    os.environ["TORCH_THREADS"] = str(cpu_count)
+    os.environ["ASR_WORKERS"] = "1"
+    if args.stub:
+        os.environ["STUB_MODELS"] = "1"
+    import transcriber
+    from audio import load_audio
+    from sharding import ShardedASR
+
+    transcriber.load_models(diarization=False)
+    if transcriber.pipe is None:
+        raise SystemExit(f"Models failed to load: {transcriber.model_status.get('error')}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "long.wav")
+        waveform, _ = synthetic_meeting_audio(args.duration)
+        write_wav(path, waveform)
+        waveform = load_audio(path)
+
+    # Baseline: the whole file in this process with every core
+    t0 = time.perf_counter()
+    baseline = transcriber.run_asr(waveform)
+    baseline_s = time.perf_counter() - t0
+    print(f"{'workers':>8} {'threads':>8} {'wall_s':>8} {'rtf':>7} {'speedup':>8} {'eff':>5} {'chunks':>7}")
+    print(f"{'single':>8} {cpu_count:>8} {baseline_s:>8.2f} {baseline_s / args.duration:>7.4f} {1.0:>8.2f} {'':>5} {len(baseline['chunks']):>7}")
+
+    runs = []
+    for num_workers in args.workers:
+        threads = max(1, cpu_count // num_workers)
+        sharded = ShardedASR(num_workers, threads)
+        # Start the workers (and load their models) outside the timed run
+        sharded.transcribe(waveform[:transcriber.SAMPLE_RATE], args.shard_s, args.overlap_s)
+
+        t0 = time.perf_counter()
+        result = sharded.transcribe(waveform, args.shard_s, args.overlap_s)
+        wall_s = time.perf_counter() - t0
+        sharded.shutdown()
+
+        speedup = baseline_s / wall_s
+        run = {
+            "workers": num_workers,
+            "threads_per_worker": threads,
+            "wall_s": round(wall_s, 3),
+            "rtf": wall_s / args.duration,
+            "speedup": round(speedup, 2),
+            "efficiency": round(speedup / num_workers, 2),
+            "chunks": len(result["chunks"]),
+            "timeline_problems": check_timeline(result["chunks"]),
+        }
+        runs.append(run)
+        print(f"{num_workers:>8} {threads:>8} {wall_s:>8.2f} {run['rtf']:>7.4f} {speedup:>8.2f} {run['efficiency']:>5.2f} {run['chunks']:>7}")
+
+    problems = sum(run["timeline_problems"] for run in runs)
+    print("Stitched timelines OK" if not problems else f"{problems} out-of-order or duplicated chunks")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "benchmark": "sharding",
+                "commit": git_commit(),
+                "mode": "stub" if args.stub else "real",
+                "model": transcriber.MODEL_NAME,
+                "python": sys.version.split()[0],
+                "machine": platform.machine(),
+                "cpu_count": cpu_count,
+                "duration_s": args.duration,
+                "shard_s": args.shard_s,
+                "overlap_s": args.overlap_s,
+                "single_process_s": baseline_s,
+                "runs": runs,
+            }, f, indent=2)
+    if problems:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
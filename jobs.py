@@ -0,0 +1,173 @@
+"""
+Background transcription jobs served by a pool of worker processes.
+
+submit() copies the upload, queues it and returns a job id right away;
+status() and result() are polled by the client. Each worker process
+loads the models once (see _worker_init) and then runs
+transcriber.transcribe_audio for one job at a time, so a long recording
+no longer holds an HTTP connection or a Gradio worker for its runtime.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Keep finished jobs around this long for the client to fetch the result
+JOB_RESULT_TTL_S = 3600
+
+def _worker_init(num_threads):
+    # Runs once in every worker process, before the first job. The thread
+    # budget is set before transcriber is imported so its defaults use it;
+    # Whisper and diarization run side by side, so each gets half.
+    os.environ["TORCH_THREADS"] = str(max(1, num_threads // 2))
+    # A worker runs one job at a time: one pass per stage
+    os.environ["ASR_WORKERS"] = os.environ["DIARIZATION_WORKERS"] = "1"
+    # A job never starts shard workers of its own
+    os.environ["SHARD_WORKERS"] = "0"
+    import transcriber
+    transcriber.load_models()
+
+def _worker_transcribe(audio_file):
+    # Jobs are long recordings: the first page plus a result id to fetch the
+    # rest with (compact columnar format when the result cache is off)
+    import transcriber
+    return transcriber.transcribe_paged(audio_file)
+
+class JobManager:
+    """
+    Job registry in front of a lazily started process pool. At most
+    `num_workers` jobs run at once and at most `max_queued` wait in our own
+    FIFO queue; further submissions are rejected until it drains
+    (backpressure). Jobs are only handed to the pool when a worker is free,
+    so queued/running states and queue positions are exact.
+    """
+
+    def __init__(self, num_workers, max_queued, job_dir=None):
+        self.num_workers = num_workers
+        self.max_queued = max_queued
+        self.job_dir = job_dir or tempfile.mkdtemp(prefix="transcribe-jobs-")
+        self.threads_per_worker = max(1, (os.cpu_count() or 1) // num_workers)
+        self.jobs = {}
+        self.pending = deque()
+        # Re-entrant: a done callback can fire inside _dispatch
+        self.lock = threading.RLock()
+        self.executor = None
+
+    def _get_executor(self):
+        # Workers (and their models) are only started when the first job arrives
+        if self.executor is None:
+            print(f"Starting {self.num_workers} job worker(s), {self.threads_per_worker} threads each", flush=True)
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(self.threads_per_worker,),
+            )
+        return self.executor
+
+    def _state(self, job):
+        future = job["future"]
+        if future is None:
+            return "queued"
+        if not future.done():
+            return "running"
+        return "failed" if future.exception() or "error" in future.result() else "done"
+
+    def _running(self):
+        return sum(1 for job in self.jobs.values() if job["future"] is not None and not job["future"].done())
+
+    def _dispatch(self):
+        # Hand queued jobs to the pool while workers are free
+        while self.pending and self._running() < self.num_workers:
+            job_id = self.pending.popleft()
+            job = self.jobs[job_id]
+            try:
+                future = self._get_executor().submit(_worker_transcribe, job["path"])
+            except BrokenProcessPool:
+                # A crashed worker breaks the whole pool; start a fresh one
+                self.executor = None
+                future = self._get_executor().submit(_worker_transcribe, job["path"])
+            job["future"] = future
+            job["started_at"] = time.time()
+            future.add_done_callback(lambda _, job_id=job_id: self._on_done(job_id))
+
+    def _on_done(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job:
+                job["finished_at"] = time.time()
+                if os.path.exists(job["path"]):
+                    os.remove(job["path"])
+            self._dispatch()
+
+    def _prune(self):
+        now = time.time()
+        for job_id in [j for j, job in self.jobs.items()
+                       if job.get("finished_at") and now - job["finished_at"] > JOB_RESULT_TTL_S]:
+            del self.jobs[job_id]
+
+    def submit(self, audio_file):
+        if audio_file is None:
+            return {"error": "Ingen fil uppladdad"}
+
+        with self.lock:
+            self._prune()
+            if len(self.pending) >= self.max_queued and self._running() >= self.num_workers:
+                return {"error": "Kön är full, försök igen om en stund", "status": "rejected",
+                        "queue_length": len(self.pending)}
+
+            # Own copy of the upload; the web framework may clean up its temp file
+            job_id = uuid.uuid4().hex
+            path = os.path.join(self.job_dir, job_id + os.path.splitext(audio_file)[1])
+            shutil.copyfile(audio_file, path)
+
+            self.jobs[job_id] = {
+                "future": None,
+                "file": os.path.basename(audio_file),
+                "path": path,
+                "submitted_at": time.time(),
+                "started_at": None,
+            }
+            self.pending.append(job_id)
+            print(f"Job {job_id} queued ({os.path.basename(audio_file)})", flush=True)
+            self._dispatch()
+            return self.status(job_id)
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return {"error": "Okänt jobb-id", "job_id": job_id, "status": "unknown"}
+
+            state = self._state(job)
+            info = {
+                "job_id": job_id,
+                "status": state,
+                "file": job["file"],
+                "elapsed_s": round(time.time() - job["submitted_at"], 1),
+            }
+            if state == "queued":
+                info["position"] = self.pending.index(job_id) + 1
+            elif job["started_at"]:
+                info["queue_wait_s"] = round(job["started_at"] - job["submitted_at"], 1)
+            return info
+
+    def result(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return {"error": "Okänt jobb-id", "job_id": job_id, "status": "unknown"}
+            if job["future"] is None or not job["future"].done():
+                return self.status(job_id)
+
+        try:
+            result = job["future"].result()
+        except Exception as e:
+            result = {"error": f"Jobbet misslyckades: {e}"}
+        return {**result, "job_id": job_id, "status": self._state(job)}
@@ -0,0 +1,457 @@
+"""
+Live microphone transcription.
+
+Microphone chunks arrive at the browser's sample rate and are resampled
+to 16 kHz into a fixed-size ring buffer, so a session never holds more
+than `buffer_s` seconds of audio however long it runs. Whisper re-reads
+the uncommitted tail of the buffer (at most `window_s` seconds) every
+`step_s` seconds of new audio. Text is committed once two consecutive
+passes agree on it (LocalAgreement-2, as in whisper_streaming), after a
+pause, or when the window is full; the rest is shown as tentative. The
+window shrinks while passes take longer than the latency target and grows
+back when they are fast. Diarization runs in the background over the
+buffered audio every `diarization_every_s` seconds and relabels the text
+it covers; speaker names are carried over between runs by overlap.
+Finished segments beyond the newest `max_segments` move to a temporary
+file, so memory and the size of each update stay bounded as well; the
+full transcript is read back once the session finishes.
+"""
+import json
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio import SAMPLE_RATE, speech_regions
+from merge import TurnIndex, extract_turns, format_time
+
+# Windows quieter than this hold no speech worth a Whisper pass
+SILENCE_DB = -50.0
+# Words this far apart, or with another speaker, start a new segment
+SEGMENT_GAP_S = 1.0
+
+def to_mono_float(data):
+    # Gradio hands over int16 (or float) samples, (n,) or (n, channels)
+    data = np.asarray(data)
+    if np.issubdtype(data.dtype, np.integer):
+        data = data.astype(np.float32) / np.iinfo(data.dtype).max
+    else:
+        data = data.astype(np.float32, copy=False)
+    if data.ndim == 2:
+        data = data.mean(axis=1)
+    return data
+
+class LinearResampler:
+    """
+    Streaming linear-interpolation resampler. Keeps the last input sample
+    and the fractional read position between calls, so chunk borders do
+    not click or drift.
+    """
+
+    def __init__(self, src_rate, dst_rate=SAMPLE_RATE):
+        self.step = src_rate / dst_rate
+        self.pos = 0.0     # next output position relative to the next new input sample
+        self.prev = None
+        self.width = int(self.step) if self.step > 1.0 else 1
+        self.tail = np.zeros(self.width - 1, dtype=np.float32)
+
+    def __call__(self, samples):
+        if self.step == 1.0 or not len(samples):
+            return samples
+        if self.width > 1:
+            # Moving average over the decimation factor limits aliasing;
+            # the previous chunk's tail keeps it continuous across chunks
+            padded = np.concatenate((self.tail, samples))
+            self.tail = padded[-(self.width - 1):]
+            samples = np.convolve(padded, np.full(self.width, 1.0 / self.width, dtype=np.float32), mode="valid")
+        if self.prev is None:
+            ext, offset = samples, 0
+        else:
+            ext, offset = np.concatenate(([self.prev], samples)), 1
+        start = self.pos + offset
+        last = len(ext) - 1
+        count = int(np.floor((last - start) / self.step)) + 1 if start <= last else 0
+        positions = start + np.arange(count) * self.step
+        out = np.interp(positions, np.arange(len(ext)), ext).astype(np.float32)
+        self.pos = start + count * self.step - len(ext)
+        self.prev = ext[-1]
+        return out
+
+class RingBuffer:
+    """
+    The last `capacity` samples of an endless stream. Positions are
+    absolute sample indices since the start of the stream.
+    """
+
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.end = 0   # absolute index one past the newest sample
+
+    @property
+    def start(self):
+        return max(0, self.end - self.capacity)
+
+    def write(self, samples):
+        samples = samples[-self.capacity:]
+        first = self.end % self.capacity
+        split = min(len(samples), self.capacity - first)
+        self.data[first:first + split] = samples[:split]
+        self.data[:len(samples) - split] = samples[split:]
+        self.end += len(samples)
+
+    def read(self, start, end):
+        # Copy of [start, end), clipped to what is still buffered
+        start = max(start, self.start)
+        end = min(end, self.end)
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+        first, last = start % self.capacity, end % self.capacity
+        if first < last or last == 0:
+            return self.data[first:last or self.capacity].copy()
+        return np.concatenate((self.data[first:], self.data[:last]))
+
+def _norm(text):
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+def _carry_names(new_turns, old_turns):
+    """
+    Rename the speakers of a new diarization run after the speakers of
+    the previous run they overlap most with, so labels stay stable while
+    the buffer slides. Unmatched speakers get fresh names.
+    """
+    overlap = {}
+    for n_start, n_end, n_speaker in new_turns:
+        for o_start, o_end, o_speaker in old_turns:
+            shared = min(n_end, o_end) - max(n_start, o_start)
+            if shared > 0:
+                overlap[(n_speaker, o_speaker)] = overlap.get((n_speaker, o_speaker), 0.0) + shared
+
+    names = {}
+    taken = set()
+    for (new, old), _ in sorted(overlap.items(), key=lambda item: -item[1]):
+        if new not in names and old not in taken:
+            names[new] = old
+            taken.add(old)
+    used = {speaker for _, _, speaker in old_turns} | taken
+    for _, _, speaker in new_turns:
+        if speaker not in names:
+            i = 0
+            while f"SPEAKER_{i:02d}" in used:
+                i += 1
+            names[speaker] = f"SPEAKER_{i:02d}"
+            used.add(names[speaker])
+    return [(start, end, names[speaker]) for start, end, speaker in new_turns]
+
+class LiveSession:
+    """
+    State of one live transcription. feed() takes a microphone chunk and
+    returns the transcript so far; finish() flushes the rest.
+    `asr` is a transformers-style ASR pipeline, `diarize` a function from
+    a 16 kHz waveform to turns (or None to skip diarization).
+    """
+
+    def __init__(self, asr, diarize=None, buffer_s=300.0, window_s=15.0, min_window_s=4.0, step_s=0.5,
+                 silence_s=0.8, latency_target_s=2.0, diarization_every_s=30.0, max_segments=500):
+        self.asr = asr
+        self.diarize = diarize
+        self.buffer = RingBuffer(int(buffer_s * SAMPLE_RATE))
+        self.max_window_s = window_s
+        self.window_s = window_s
+        self.min_window_s = min_window_s
+        self.step_s = step_s
+        self.silence_s = silence_s
+        self.latency_target_s = latency_target_s
+        self.diarization_every_s = diarization_every_s
+        self.max_segments = max(1, max_segments)
+
+        self.resampler = None
+        self.src_rate = None
+        self.word_timestamps = True
+        self.arrivals = deque()          # (absolute end sample, wall time) per chunk
+        self.committed_until = 0.0       # seconds; audio before this is final text
+        self.last_pass_end = 0           # buffer position of the last Whisper pass
+        self.previous = []               # uncommitted words of the last pass
+        self.tentative = []
+        self.words = []                  # committed words that diarization may still relabel
+        self.segments = []               # finished segments, older than the buffer
+        self.history = None              # JSONL file of the segments flushed out of `segments`
+        self.flushed = 0                 # how many segments went there
+        self.flushed_speakers = set()
+        self.turns = []
+
+        self.latencies = deque(maxlen=200)
+        self.pass_times = deque(maxlen=200)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1) if diarize else None
+        self.diarization_future = None
+        self.last_diarization_end = 0
+
+    # --- audio in ---
+
+    def _append(self, rate, data):
+        samples = to_mono_float(data)
+        if rate != self.src_rate:
+            self.src_rate = rate
+            self.resampler = LinearResampler(rate)
+        samples = self.resampler(samples)
+        self.buffer.write(samples)
+        self.arrivals.append((self.buffer.end, time.monotonic()))
+        while self.arrivals and self.arrivals[0][0] < self.buffer.start:
+            self.arrivals.popleft()
+
+    def _arrival(self, seconds):
+        # Wall time at which the audio at `seconds` had reached the server
+        sample = int(seconds * SAMPLE_RATE)
+        ends = [end for end, _ in self.arrivals]
+        i = min(bisect_left(ends, sample), len(self.arrivals) - 1)
+        return self.arrivals[i][1]
+
+    # --- Whisper ---
+
+    def _hypothesis(self, audio, offset_s):
+        # Words (or chunks, if the model cannot time words) on the absolute timeline
+        output = None
+        if self.word_timestamps:
+            try:
+                output = self.asr(audio, return_timestamps="word")
+            except Exception as e:
+                print(f"Live: word timestamps unavailable ({e}), using chunk timestamps", flush=True)
+                self.word_timestamps = False
+        if output is None:
+            output = self.asr(audio, return_timestamps=True)
+        duration = len(audio) / SAMPLE_RATE
+        words = []
+        for chunk in output.get("chunks", []):
+            text = chunk.get("text", "").strip()
+            start, end = chunk.get("timestamp", (0.0, None))
+            start = start or 0.0
+            end = duration if end is None else min(end, duration)
+            if text:
+                words.append({"start": offset_s + start, "end": offset_s + max(end, start), "text": text})
+        return words
+
+    def _commit(self, words):
+        if not words:
+            return
+        index = TurnIndex(self.turns) if self.turns else None
+        for word in words:
+            word["speaker"] = self._speaker(index, word)
+            self.words.append(word)
+        self.committed_until = max(self.committed_until, words[-1]["end"])
+        now = time.monotonic()
+        for word in words:
+            self.latencies.append(now - self._arrival(word["end"]))
+
+    def _speaker(self, index, word):
+        if index is None:
+            return "Unknown"
+        durations = index.speaking_durations(word["start"], max(word["end"], word["start"] + 0.01))
+        return max(durations, key=durations.get) if durations else "Unknown"
+
+    def _pass(self, final=False):
+        end_s = self.buffer.end / SAMPLE_RATE
+        start_s = max(self.committed_until, self.buffer.start / SAMPLE_RATE)
+        audio = self.buffer.read(int(start_s * SAMPLE_RATE), self.buffer.end)
+        self.last_pass_end = self.buffer.end
+        if len(audio) < SAMPLE_RATE * 0.1:
+            if final:
+                self._commit(self.previous)
+                self.previous = self.tentative = []
+            return
+
+        # Nothing but silence: whatever was tentative is final, and no pass is needed
+        if 10 * np.log10(np.mean(audio * audio) + 1e-10) < SILENCE_DB:
+            self._commit(self.previous)
+            self.previous = self.tentative = []
+            self.committed_until = end_s
+            return
+
+        t0 = time.perf_counter()
+        words = self._hypothesis(audio, start_s)
+        pass_s = time.perf_counter() - t0
+        self.pass_times.append(pass_s)
+
+        # LocalAgreement-2: the prefix this pass shares with the last one is stable
+        agreed = 0
+        while (agreed < min(len(words), len(self.previous))
+               and _norm(words[agreed]["text"]) == _norm(self.previous[agreed]["text"])):
+            agreed += 1
+
+        regions = speech_regions(audio)
+        paused = not regions or regions[-1][1] < len(audio) / SAMPLE_RATE - self.silence_s
+        if final or paused:
+            # After a pause (or at the end) nothing more will change these words
+            agreed = len(words)
+        elif end_s - start_s > self.window_s:
+            # Window full without agreement: keep only the newest word open,
+            # unless that word itself is older than the window
+            agreed = max(agreed, len(words) - 1)
+            if agreed < len(words) and words[agreed]["start"] < end_s - self.window_s:
+                agreed = len(words)
+
+        self._commit(words[:agreed])
+        self.previous = self.tentative = words[agreed:]
+        if paused and not final:
+            self.committed_until = max(self.committed_until, start_s + (regions[-1][1] if regions else 0.0))
+        if end_s - self.committed_until > self.window_s and not self.tentative:
+            # Long stretch without words (noise): do not read it again
+            self.committed_until = end_s - self.window_s / 2
+
+        # Stay within the latency target: shorter windows mean shorter passes
+        if pass_s > self.latency_target_s:
+            self.window_s = max(self.min_window_s, self.window_s * 0.8)
+        elif pass_s < self.latency_target_s / 2:
+            self.window_s = min(self.max_window_s, self.window_s * 1.1)
+
+    # --- diarization ---
+
+    def _diarize(self, start, audio):
+        turns = extract_turns(self.diarize(audio)) or []
+        offset = start / SAMPLE_RATE
+        return start, [(s + offset, e + offset, speaker) for s, e, speaker in turns]
+
+    def _apply_diarization(self, wait=False):
+        future = self.diarization_future
+        if future is None or not (wait or future.done()):
+            return
+        self.diarization_future = None
+        try:
+            start, turns = future.result()
+        except Exception as e:
+            print(f"Live diarization failed: {e}", flush=True)
+            return
+        if not turns:
+            return
+        start_s = start / SAMPLE_RATE
+        # Keep the older turns the new run does not cover
+        self.turns = [t for t in self.turns if t[1] <= start_s] + _carry_names(turns, self.turns)
+        index = TurnIndex(self.turns)
+        for word in self.words:
+            if word["end"] > start_s:
+                word["speaker"] = self._speaker(index, word)
+
+    def _maybe_diarize(self, force=False):
+        if not self.executor or self.diarization_future is not None:
+            return
+        if force or self.buffer.end - self.last_diarization_end >= self.diarization_every_s * SAMPLE_RATE:
+            start = self.buffer.start
+            self.last_diarization_end = self.buffer.end
+            self.diarization_future = self.executor.submit(self._diarize, start, self.buffer.read(start, self.buffer.end))
+
+    # --- transcript out ---
+
+    def _finalize_old(self):
+        # Words that left the buffer can no longer be relabelled; group them for good
+        cutoff = self.buffer.start / SAMPLE_RATE
+        old = 0
+        while old < len(self.words) and self.words[old]["end"] <= cutoff:
+            old += 1
+        if old:
+            self._group(self.words[:old], self.segments)
+            del self.words[:old]
+        self.turns = [t for t in self.turns if t[1] > cutoff]
+        self._flush_segments()
+
+    def _flush_segments(self):
+        # Keep the newest max_segments in memory; the last one may still grow
+        excess = len(self.segments) - self.max_segments
+        if excess <= 0:
+            return
+        if self.history is None:
+            self.history = tempfile.TemporaryFile("w+", encoding="utf-8")
+        for seg in self.segments[:excess]:
+            self.history.write(json.dumps(seg, ensure_ascii=False) + "\n")
+            self.flushed_speakers.add(seg["speaker"])
+        del self.segments[:excess]
+        self.flushed += excess
+
+    def _read_history(self):
+        if self.history is None:
+            return []
+        self.history.seek(0)
+        segments = [json.loads(line) for line in self.history]
+        self.history.close()
+        self.history = None
+        return segments
+
+    def _group(self, words, segments):
+        # Append words to `segments`, continuing its last segment where they belong
+        for word in words:
+            last = segments[-1] if segments else None
+            if last and last["speaker"] == word["speaker"] and word["start"] - last["end"] < SEGMENT_GAP_S:
+                last["text"] += " " + word["text"]
+                last["end"] = word["end"]
+            else:
+                segments.append({"start": word["start"], "end": word["end"], "speaker": word["speaker"],
+                                 "text": word["text"], "formatted_time": format_time(word["start"])})
+        return segments
+
+    def _percentile(self, values, q):
+        return round(float(np.percentile(list(values), q)), 3) if values else None
+
+    def result(self, done=False):
+        """
+        The transcript from segment `start_index` on: while recording, the
+        segments flushed to the history file are left out; once done, it
+        is read back and the whole transcript is returned.
+        """
+        # The finished segments stay untouched; the live words may extend a copy of the last one
+        segments = self.segments[:-1] + self._group(self.words, [dict(seg) for seg in self.segments[-1:]])
+        start_index = self.flushed
+        if done:
+            segments = self._read_history() + segments
+            start_index = 0
+        return {
+            "start_index": start_index,
+            "total": start_index + len(segments),
+            "segments": segments,
+            "unique_speakers": sorted({seg["speaker"] for seg in segments} | self.flushed_speakers),
+            "tentative": " ".join(word["text"] for word in self.tentative),
+            "done": done,
+            "stats": {
+                "audio_s": round(self.buffer.end / SAMPLE_RATE, 2),
+                "buffered_s": round((self.buffer.end - self.buffer.start) / SAMPLE_RATE, 2),
+                "window_s": round(self.window_s, 2),
+                "commit_latency_p50_s": self._percentile(self.latencies, 50),
+                "commit_latency_p95_s": self._percentile(self.latencies, 95),
+                "pass_p50_s": self._percentile(self.pass_times, 50),
+                "latency_target_s": self.latency_target_s,
+            },
+        }
+
+    def feed(self, rate, data):
+        with self.lock:
+            self._append(rate, data)
+            self._apply_diarization()
+            # Whisper runs once per step_s of new audio, not once per chunk
+            if self.buffer.end - self.last_pass_end >= self.step_s * SAMPLE_RATE:
+                self._pass()
+                self._maybe_diarize()
+                self._finalize_old()
+            return self.result()
+
+    def close(self):
+        # Dropped without finish() (e.g. the browser tab was closed): free
+        # the diarization thread and the history file
+        with self.lock:
+            if self.executor:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            if self.history is not None:
+                self.history.close()
+                self.history = None
+
+    def finish(self):
+        with self.lock:
+            self._pass(final=True)
+            if self.executor:
+                # One last run over the whole buffer labels the end of the session
+                self._apply_diarization(wait=True)
+                self._maybe_diarize(force=True)
+                self._apply_diarization(wait=True)
+                self.executor.shutdown(wait=False)
+            return self.result(done=True)
@@ -0,0 +1,163 @@
+"""
+Load test for the Gradio API in app.py with stub models.
+
+Starts app.py's Blocks app in this process with STUB_MODELS=1 (model time
+simulated at --asr-rtf / --diarization-rtf seconds per audio second, see
+stub_models.py) and the Gradio queue set to --concurrency. It then drives
+/transcribe_v2 with N concurrent gradio_client clients, each uploading
+--requests files picked from --files synthetic recordings. The result
+cache is off, so every request runs the full pipeline.
+
+For every client count in --clients it reports throughput, p50/p95/p99
+latency, the error rate and two kinds of waiting. "gradio" is the client
+latency minus the server-side request time (ATTACH_METRICS): Gradio's
+queue plus the upload. "stage" is the time the request's ASR and
+diarization passes waited for a free executor worker (the asr_wait and
+diarization_wait stages; the longer of the two, as they wait side by
+side). Running it for a few --concurrency / --workers values shows where
+latency starts to collapse.
+
+Usage: python loadtest_app.py [--clients 1 4 8] [--requests 4] [--concurrency 2] [--workers 2]
+       [--duration 60] [--files 4] [--asr-rtf 0.05] [--diarization-rtf 0.03]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench_pipeline import git_commit, synthetic_meeting_audio, write_wav
+from loadtest_proxy import free_port, percentile, wait_for_port
+
+def client(url, files, num_requests, first, results):
+    from gradio_client import Client, handle_file
+
+    gradio = Client(url, verbose=False)
+    for i in range(num_requests):
+        path = files[(first + i) % len(files)]
+        t0 = time.perf_counter()
+        try:
+            result = gradio.predict(handle_file(path), api_name="//transcribe_v2")  # app.py names it "/transcribe_v2"; Gradio adds a slash
+            error = result.get("error") if isinstance(result, dict) else "unexpected response"
+        except Exception as e:
+            result, error = {}, f"{type(e).__name__}: {e}"
+        latency = time.perf_counter() - t0
+        metrics = (result.get("metrics") or {}) if not error else {}
+        stages = metrics.get("stages", {})
+        stage_wait_s = max(stages.get(f"{name}_wait", {}).get("wall_s", 0.0) for name in ("asr", "diarization"))
+        results.append({"latency_s": latency, "server_s": metrics.get("wall_s"), "stage_wait_s": stage_wait_s,
+                        "error": error})
+        if error:
+            print(f"Request failed: {error}", flush=True)
+
+def fmt(value):
+    return f"{value:7.2f}" if value is not None else f"{'-':>7}"
+
+def run_level(url, files, num_clients, num_requests, duration_s):
+    results = []
+    threads = [threading.Thread(target=client, args=(url, files, num_requests, c, results))
+               for c in range(num_clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall_s = time.perf_counter() - t0
+
+    ok = [r for r in results if not r["error"]]
+    latencies = [r["latency_s"] for r in ok]
+    gradio_waits = [r["latency_s"] - r["server_s"] for r in ok if r["server_s"] is not None]
+    stage_waits = [r["stage_wait_s"] for r in ok if r["server_s"] is not None]
+    return {
+        "clients": num_clients,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_rate": round((len(results) - len(ok)) / max(1, len(results)), 4),
+        "wall_s": round(wall_s, 2),
+        "requests_per_s": round(len(ok) / wall_s, 3),
+        "audio_s_per_s": round(len(ok) * duration_s / wall_s, 1),
+        "latency_s": {f"p{p}": percentile(latencies, p) for p in (50, 95, 99)},
+        "gradio_wait_s": {f"p{p}": percentile(gradio_waits, p) for p in (50, 95, 99)},
+        "stage_wait_s": {f"p{p}": percentile(stage_waits, p) for p in (50, 95, 99)},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 8], help="Concurrent clients per level")
+    parser.add_argument("--requests", type=int, default=4, help="Requests per client")
+    parser.add_argument("--concurrency", type=int, default=1, help="GRADIO_CONCURRENCY for the app")
+    parser.add_argument("--workers", type=int, default=1, help="ASR_WORKERS and DIARIZATION_WORKERS for the app")
+    parser.add_argument("--duration", type=float, default=60, help="Length of each test recording in seconds")
+    parser.add_argument("--files", type=int, default=4, help="Distinct test recordings")
+    parser.add_argument("--asr-rtf", type=float, default=0.05)
+    parser.add_argument("--diarization-rtf", type=float, default=0.03)
+    parser.add_argument("--json", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    # Read by transcriber and app at import
+    os.environ.update({
+        "STUB_MODELS": "1",
+        "STUB_ASR_RTF": str(args.asr_rtf),
+        "STUB_DIARIZATION_RTF": str(args.diarization_rtf),
+        "CACHE_DIR": "",
+        "ATTACH_METRICS": "1",
+        "GRADIO_CONCURRENCY": str(args.concurrency),
+        "ASR_WORKERS": str(args.workers),
+        "DIARIZATION_WORKERS": str(args.workers),
+        "GRADIO_ANALYTICS_ENABLED": "False",
+    })
+    import app
+    import transcriber
+
+    port = free_port()
+    app.demo.launch(server_name="127.0.0.1", server_port=port, prevent_thread_lock=True, quiet=True)
+    wait_for_port(port)
+    transcriber.models_ready.wait()
+    url = f"http://127.0.0.1:{port}/"
+
+    levels = []
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for i in range(args.files):
+            waveform, _ = synthetic_meeting_audio(args.duration, seed=i)
+            files.append(os.path.join(tmp, f"meeting{i}.wav"))
+            write_wav(files[-1], waveform)
+
+        print(f"GRADIO_CONCURRENCY={args.concurrency}, workers={args.workers}, {args.duration:g}s files, "
+              f"stub rtf asr={args.asr_rtf} diarization={args.diarization_rtf}")
+        print(f"{'clients':>7} {'req':>5} {'err%':>6} {'req/s':>7} {'audio/s':>8} "
+              f"{'p50':>7} {'p95':>7} {'p99':>7} {'gradio50':>8} {'gradio95':>8} {'stage50':>7} {'stage95':>7}")
+        try:
+            for num_clients in args.clients:
+                level = run_level(url, files, num_clients, args.requests, args.duration)
+                levels.append(level)
+                lat, gradio, stage = level["latency_s"], level["gradio_wait_s"], level["stage_wait_s"]
+                print(f"{num_clients:>7} {level['requests']:>5} {level['error_rate'] * 100:>6.1f} "
+                      f"{level['requests_per_s']:>7.2f} {level['audio_s_per_s']:>8.1f} "
+                      f"{fmt(lat['p50'])} {fmt(lat['p95'])} {fmt(lat['p99'])} "
+                      f"{fmt(gradio['p50']):>8} {fmt(gradio['p95']):>8} {fmt(stage['p50'])} {fmt(stage['p95'])}",
+                      flush=True)
+        finally:
+            app.demo.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "benchmark": "app_load",
+                "commit": git_commit(),
+                "concurrency": args.concurrency,
+                "workers": args.workers,
+                "duration_s": args.duration,
+                "files": args.files,
+                "requests_per_client": args.requests,
+                "asr_rtf": args.asr_rtf,
+                "diarization_rtf": args.diarization_rtf,
+                "levels": levels,
+            }, f, indent=2)
+    if any(level["errors"] for level in levels):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Load test for the proxy in server.py against a local stub upstream.
+
+Starts a stub transcription endpoint that reads the upload, waits
+--upstream-delay seconds and answers with JSON, runs server.py in a
+subprocess pointed at it and drives both with concurrent keep-alive
+clients that upload --upload-mb each and fetch a static file in between.
+
+Reports throughput, latency percentiles, how many upstream connections
+the proxy opened (fewer than requests means keep-alive reuse) and the
+proxy's peak RSS, which should stay flat as --upload-mb grows.
+
+With --transcode the clients upload 48 kHz stereo WAVs and the proxy
+re-encodes them (TRANSCODE_FORMAT) before forwarding; the bytes saved are
+read back from the proxy's /api/metrics.
+
+Usage: python loadtest_proxy.py [--clients 8] [--requests 5] [--upload-mb 50] [--upstream-delay 0.5] [--transcode]
+"""
+import argparse
+import http.client
+import http.server
+import json
+import math
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+class StubUpstream(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay_s = 0.0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubUpstream.lock:
+            StubUpstream.connections += 1
+
+    def do_POST(self):
+        received = 0
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                received += len(self.rfile.read(size))
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("Content-Length", 0))
+            while remaining > 0:
+                block = self.rfile.read(min(remaining, 1 << 16))
+                if not block:
+                    break
+                received += len(block)
+                remaining -= len(block)
+
+        time.sleep(self.delay_s)
+        body = json.dumps({"text": "hej hej", "bytes": received}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("", 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"Proxy did not start on port {port}")
+
+def peak_rss_mb(pid):
+    # VmHWM is the peak resident set size of the process (Linux only)
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def upload_body(size, block=b"\0" * (1 << 16)):
+    # Generated on the fly so the clients do not hold the uploads in memory either
+    remaining = size
+    while remaining > 0:
+        yield block[:min(remaining, len(block))]
+        remaining -= len(block)
+
+def wav_upload_body(size, rate=48000, channels=2):
+    # 16-bit stereo WAV of `size` bytes: a tone with noise, one second repeated
+    data_size = size - 44
+    yield b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+    yield b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, rate, rate * channels * 2, channels * 2, 16)
+    yield b"data" + struct.pack("<I", data_size)
+    rng = random.Random(0)
+    second = b"".join(
+        struct.pack("<h", int(3000 * math.sin(2 * math.pi * 220 * i / rate) + rng.gauss(0, 300))) * channels
+        for i in range(rate)
+    )
+    yield from upload_body(data_size, second)
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def client(port, num_requests, upload_bytes, results, wav=False):
+    conn = http.client.HTTPConnection("localhost", port, timeout=600)
+    for _ in range(num_requests):
+        t0 = time.perf_counter()
+        try:
+            body = wav_upload_body(upload_bytes) if wav else upload_body(upload_bytes)
+            conn.request("POST", "/api/transcribe", body=body,
+                         headers={"Content-Type": "audio/wav", "Content-Length": str(upload_bytes)})
+            response = conn.getresponse()
+            data = json.loads(response.read())
+            # Transcoded uploads arrive smaller than they were sent
+            ok = response.status == 200 and (0 < data.get("bytes", 0) <= upload_bytes if wav
+                                             else data.get("bytes") == upload_bytes)
+        except Exception as e:
+            print(f"Request failed: {e}", flush=True)
+            conn.close()
+            conn = http.client.HTTPConnection("localhost", port, timeout=600)
+            ok = False
+        results["upload"].append((time.perf_counter() - t0, ok))
+
+        # A static file while other clients' uploads are in flight
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", "/index.html")
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except Exception:
+            conn.close()
+            conn = http.client.HTTPConnection("localhost", port, timeout=600)
+            ok = False
+        results["static"].append((time.perf_counter() - t0, ok))
+    conn.close()
+
+def read_metrics(port):
+    # Unlabelled samples from the proxy's Prometheus endpoint
+    conn = http.client.HTTPConnection("localhost", port, timeout=10)
+    conn.request("GET", "/api/metrics")
+    values = {}
+    for line in conn.getresponse().read().decode().splitlines():
+        if line and not line.startswith("#") and "{" not in line:
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value)
+    conn.close()
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=5, help="Uploads per client")
+    parser.add_argument("--upload-mb", type=float, default=50)
+    parser.add_argument("--upstream-delay", type=float, default=0.5, help="Simulated transcription time per request")
+    parser.add_argument("--transcode", action="store_true", help="Upload WAVs and let the proxy transcode them")
+    parser.add_argument("--json", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    StubUpstream.delay_s = args.upstream_delay
+    upstream = http.server.ThreadingHTTPServer(("localhost", 0), StubUpstream)
+    upstream.daemon_threads = True
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), TARGET_URL=f"http://localhost:{upstream.server_address[1]}/models/stub",
+               TRANSCODE="1" if args.transcode else "0")
+    proxy = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")],
+                             env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        upload_bytes = int(args.upload_mb * 1024 * 1024)
+        results = {"upload": [], "static": []}
+        threads = [threading.Thread(target=client, args=(port, args.requests, upload_bytes, results, args.transcode))
+                   for _ in range(args.clients)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall_s = time.perf_counter() - t0
+        rss = peak_rss_mb(proxy.pid)
+        proxy_metrics = read_metrics(port)
+    finally:
+        proxy.terminate()
+        proxy.wait()
+        upstream.shutdown()
+
+    uploads = [s for s, ok in results["upload"] if ok]
+    static = [s for s, ok in results["static"] if ok]
+    total = len(results["upload"])
+    report = {
+        "clients": args.clients,
+        "requests": total,
+        "errors": total - len(uploads) + len(results["static"]) - len(static),
+        "upload_mb": args.upload_mb,
+        "upstream_delay_s": args.upstream_delay,
+        "wall_s": round(wall_s, 2),
+        "requests_per_s": round(len(uploads) / wall_s, 2),
+        "throughput_mb_s": round(len(uploads) * args.upload_mb / wall_s, 1),
+        "upload_latency_s": {f"p{p}": percentile(uploads, p) for p in (50, 95, 99)},
+        "static_latency_s": {f"p{p}": percentile(static, p) for p in (50, 95, 99)},
+        "upstream_connections": StubUpstream.connections,
+        "proxy_peak_rss_mb": rss,
+        "transcode": args.transcode,
+        "upstream_bytes_sent": proxy_metrics.get("proxy_upload_bytes_sent_total"),
+        "bytes_saved": proxy_metrics.get("proxy_transcode_bytes_saved_total"),
+        # A proxy that handles one request at a time needs at least this long
+        "serial_lower_bound_s": round(total * args.upstream_delay, 2),
+    }
+
+    print(f"{total} uploads of {args.upload_mb:g} MB from {args.clients} clients in {wall_s:.1f}s "
+          f"({report['requests_per_s']} req/s, {report['throughput_mb_s']} MB/s, {report['errors']} errors)")
+    print("upload latency  " + "  ".join(f"{k}={v:.2f}s" for k, v in report["upload_latency_s"].items() if v is not None))
+    print("static latency  " + "  ".join(f"{k}={v * 1000:.0f}ms" for k, v in report["static_latency_s"].items() if v is not None))
+    print(f"upstream connections opened: {StubUpstream.connections} for {total} requests")
+    if rss is not None:
+        print(f"proxy peak RSS: {rss:.0f} MB")
+    print(f"serial lower bound: {report['serial_lower_bound_s']}s")
+    if args.transcode and report["bytes_saved"] is not None:
+        received = report["upstream_bytes_sent"] + report["bytes_saved"]
+        print(f"transcoding: {received / 1e6:.0f} MB received, {report['upstream_bytes_sent'] / 1e6:.0f} MB sent upstream "
+              f"({report['bytes_saved'] / max(received, 1) * 100:.0f}% saved)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if report["errors"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import html
+from bisect import bisect_left, bisect_right
+
+# Bump when the merge output changes so cached results are rebuilt
+MERGE_VERSION = 1
+
+def format_time(seconds):
+    mins = int(seconds // 60)
+    secs = int(seconds % 60)
+    return f"{mins:02d}:{secs:02d}"
+
+def shift_chunks(chunks, offset):
+    # Move Whisper chunks from a slice of the audio back onto the full timeline
+    shifted = []
+    for chunk in chunks:
+        start, end = chunk.get("timestamp", [0, 0])
+        shifted.append({
+            "text": chunk.get("text", ""),
+            "timestamp": (
+                start + offset if start is not None else offset,
+                end + offset if end is not None else None,
+            ),
+        })
+    return shifted
+
+def _normalize_text(text):
+    return " ".join(text.lower().split())
+
+def stitch_shards(shards, stitched=None):
+    """
+    Join the chunks of overlapping shards into one timeline. `shards` is a
+    list of (keep_from, keep_to, chunks) with absolute timestamps; each
+    shard keeps the chunks whose midpoint falls in its keep range (the
+    overlaps are split at their midpoint, away from the cut-off shard
+    edges). A chunk repeating the previous one across a seam is dropped.
+    Pass the list returned so far as `stitched` to add shards one at a
+    time; it is extended in place.
+    """
+    if stitched is None:
+        stitched = []
+    for keep_from, keep_to, chunks in shards:
+        for chunk in chunks:
+            start, end = chunk["timestamp"]
+            mid = start if end is None else (start + end) / 2
+            if not keep_from <= mid < keep_to:
+                continue
+            if stitched:
+                prev_start, prev_end = stitched[-1]["timestamp"]
+                prev_end = prev_start if prev_end is None else prev_end
+                # Same words, overlapping in time: both shards heard this sentence
+                if start < prev_end and _normalize_text(chunk["text"]) == _normalize_text(stitched[-1]["text"]):
+                    continue
+            stitched.append(chunk)
+    return stitched
+
+def extract_turns(diarization):
+    # Pull (start, end, speaker) out of a pyannote Annotation once.
+    # Lists of (start, end, speaker) turns are passed through unchanged.
+    if not diarization:
+        return []
+    if hasattr(diarization, "itertracks"):
+        return [(turn.start, turn.end, speaker)
+                for turn, _, speaker in diarization.itertracks(yield_label=True)]
+    return [(start, end, speaker) for start, end, speaker in diarization]
+
+class TurnIndex:
+    """
+    Diarization turns sorted by start time, with a running maximum of the
+    end times so that the turns overlapping a window can be found with a
+    binary search instead of scanning every turn.
+    """
+
+    def __init__(self, turns):
+        # Stable sort keeps itertracks order for equal starts, so overlaps
+        # are summed in the same order as before (identical float results).
+        order = sorted(range(len(turns)), key=lambda i: turns[i][0])
+        self.starts = [turns[i][0] for i in order]
+        self.ends = [turns[i][1] for i in order]
+        self.speakers = [turns[i][2] for i in order]
+
+        self.max_ends = []
+        running = float("-inf")
+        for end in self.ends:
+            running = max(running, end)
+            self.max_ends.append(running)
+
+    def speaking_durations(self, start, end):
+        durations = {}
+        # Turns starting at or after `end` cannot overlap
+        hi = bisect_left(self.starts, end)
+        # Turns before `lo` all end at or before `start`
+        lo = bisect_left(self.max_ends, start, 0, hi)
+        while lo < hi and self.max_ends[lo] <= start:
+            lo += 1
+
+        for i in range(lo, hi):
+            overlap_start = max(start, self.starts[i])
+            overlap_end = min(end, self.ends[i])
+
+            if overlap_end > overlap_start:
+                dur = overlap_end - overlap_start
+                speaker = self.speakers[i]
+                durations[speaker] = durations.get(speaker, 0) + dur
+        return durations
+
+def merge_transcription(whisper_chunks, diarization):
+    # Merge Whisper chunks with Diarization speakers
+    segments = []
+    unique_speakers = set()
+
+    # Index the turns once instead of re-walking the annotation per chunk
+    index = TurnIndex(extract_turns(diarization))
+
+    # Iterate over whisper chunks
+    for chunk in whisper_chunks:
+        text = chunk.get("text", "").strip()
+        start = chunk.get("timestamp", [0, 0])[0]
+        end = chunk.get("timestamp", [0, 0])[1]
+
+        if end is None: end = start + 2.0 # Fallback
+
+        # Find dominant speaker in this timeframe
+        speaking_durations = index.speaking_durations(start, end)
+
+        # Find max
+        if speaking_durations:
+            best_speaker = max(speaking_durations, key=speaking_durations.get)
+        else:
+            best_speaker = "Unknown"
+
+        unique_speakers.add(best_speaker)
+        segments.append({
+            "start": start,
+            "end": end,
+            "speaker": best_speaker,
+            "text": text,
+            "formatted_time": format_time(start)
+        })
+
+    return {
+        "segments": segments,
+        "unique_speakers": sorted(list(unique_speakers))
+    }
+
+def compact_result(result):
+    """
+    Columnar form of a merge_transcription result for large transcripts:
+    parallel start/end/speaker/text arrays, with speakers as indices into
+    unique_speakers and no per-segment formatted_time.
+    """
+    speakers = result["unique_speakers"]
+    index = {speaker: i for i, speaker in enumerate(speakers)}
+    segments = result["segments"]
+    return {
+        "format": "compact",
+        "unique_speakers": speakers,
+        "start": [round(seg["start"], 2) for seg in segments],
+        "end": [round(seg["end"], 2) for seg in segments],
+        "speaker": [index[seg["speaker"]] for seg in segments],
+        "text": [seg["text"] for seg in segments],
+    }
+
+def segment_range(result, start_index=0, count=None, start_s=None, end_s=None):
+    """
+    A page of segments, either by index (start_index, count) or by time:
+    with start_s/end_s the page starts at the segment playing at start_s
+    and stops before the first segment starting at or after end_s.
+    """
+    segments = result["segments"]
+    if start_s is not None:
+        starts = [seg["start"] for seg in segments]
+        start_index = max(0, bisect_right(starts, start_s) - 1)
+        if end_s is not None:
+            count = max(0, bisect_left(starts, end_s, start_index) - start_index)
+    start_index = max(0, int(start_index))
+    end_index = len(segments) if count is None else min(len(segments), start_index + int(count))
+    return {
+        "total": len(segments),
+        "start_index": start_index,
+        "segments": segments[start_index:end_index],
+    }
+
+def _subtitle_time(seconds, separator):
+    millis = int(round(max(0.0, seconds) * 1000))
+    hours, millis = divmod(millis, 3600_000)
+    mins, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{mins:02d}:{secs:02d}{separator}{millis:03d}"
+
+def to_srt(result):
+    # SubRip subtitles from merge_transcription segments, speaker as a prefix
+    cues = []
+    for i, seg in enumerate(s for s in result["segments"] if s["text"]):
+        cues.append(f"{i + 1}\n"
+                    f"{_subtitle_time(seg['start'], ',')} --> {_subtitle_time(seg['end'], ',')}\n"
+                    f"{seg['speaker']}: {seg['text']}\n")
+    return "\n".join(cues)
+
+def to_vtt(result):
+    # WebVTT subtitles; the speaker goes in a voice tag
+    cues = ["WEBVTT\n"]
+    for seg in result["segments"]:
+        if seg["text"]:
+            cues.append(f"{_subtitle_time(seg['start'], '.')} --> {_subtitle_time(seg['end'], '.')}\n"
+                        f"<v {seg['speaker']}>{html.escape(seg['text'], quote=False)}\n")
+    return "\n".join(cues)
@@ -0,0 +1,293 @@
+"""
+Per-request instrumentation and a Prometheus-style metrics registry.
+
+RequestMetrics records wall and CPU time per stage, audio duration,
+real-time factor and peak RSS for one request. Finished requests are
+aggregated into REGISTRY, which renders the Prometheus text format for
+the /metrics endpoint (start_metrics_server) or the Gradio debug tab.
+"""
+import http.server
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Histogram buckets in seconds (stage latency) and as ratios (real-time factor)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+
+def current_rss_bytes():
+    # Resident set size of this process, or None if it cannot be read
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+def peak_rss_bytes():
+    # Lifetime peak RSS of the process (ru_maxrss is KiB on Linux)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class _RSSSampler:
+    # Samples RSS in the background to find the peak during one request
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = None
+        if self.peak is not None:
+            self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss_bytes()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        rss = current_rss_bytes()
+        if rss is not None and self.peak is not None:
+            self.peak = max(self.peak, rss)
+        return self.peak
+
+class RequestMetrics:
+    """
+    Instrumentation for one request. Use `with metrics.stage("asr"):`
+    around each stage, then `finish()` once the request is done.
+
+    CPU time is process CPU time (all threads) while the stage ran, so
+    stages that run concurrently both include each other's CPU time.
+    """
+
+    def __init__(self, endpoint, registry=None):
+        self.endpoint = endpoint
+        self.registry = registry if registry is not None else REGISTRY
+        self.stages = {}
+        self.audio_s = None
+        self.cache = None
+        self._t_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._rss = _RSSSampler()
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        cpu0 = time.process_time()
+        try:
+            yield
+        finally:
+            self.stages[name] = {
+                "wall_s": time.perf_counter() - t0,
+                "cpu_s": time.process_time() - cpu0,
+            }
+
+    def record(self, name, wall_s, cpu_s=0.0):
+        # For stages timed by the caller (e.g. summed over streaming windows)
+        self.stages[name] = {"wall_s": wall_s, "cpu_s": cpu_s}
+
+    def add_wait(self, name, seconds):
+        # Time the stage queued for its executor behind other requests,
+        # summed when a request submits it more than once (stream windows)
+        stage = self.stages.setdefault(f"{name}_wait", {"wall_s": 0.0, "cpu_s": 0.0})
+        stage["wall_s"] += seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self._t_start
+
+    def finish(self, status="ok"):
+        wall_s = time.perf_counter() - self._t_start
+        summary = {
+            "endpoint": self.endpoint,
+            "status": status,
+            "wall_s": round(wall_s, 4),
+            "cpu_s": round(time.process_time() - self._cpu_start, 4),
+            "stages": {k: {m: round(v, 4) for m, v in s.items()} for k, s in self.stages.items()},
+            "peak_rss_mb": None,
+        }
+        peak = self._rss.stop()
+        if peak is not None:
+            summary["peak_rss_mb"] = round(peak / (1024 * 1024), 1)
+        if self.cache:
+            summary["cache"] = self.cache
+        if self.audio_s:
+            summary["audio_s"] = round(self.audio_s, 2)
+            summary["rtf"] = round(wall_s / self.audio_s, 4)
+        self.registry.observe_request(summary)
+        return summary
+
+    def log_line(self, summary):
+        parts = [f"{k}={v['wall_s']:.2f}s" for k, v in summary["stages"].items()]
+        parts.append(f"total={summary['wall_s']:.2f}s")
+        if "rtf" in summary:
+            parts.append(f"rtf={summary['rtf']:.3f}")
+        if summary["peak_rss_mb"] is not None:
+            parts.append(f"peak_rss={summary['peak_rss_mb']:.0f}MB")
+        return "Stage timings: " + ", ".join(parts)
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+class MetricsRegistry:
+    """
+    Aggregates finished requests. Gauges that live elsewhere (model load
+    times, readiness) are added with add_collector(fn), where fn returns
+    a list of (name, help, type, [(labels dict, value)]).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}       # (endpoint, status) -> count
+        self.stage_wall = {}     # (endpoint, stage) -> histogram
+        self.stage_cpu = {}      # (endpoint, stage) -> total seconds
+        self.request_wall = {}   # endpoint -> histogram
+        self.rtf = {}            # endpoint -> histogram
+        self.audio_s = {}        # endpoint -> total seconds
+        self.cache_hits = {}     # (endpoint, kind) -> count
+        self.last_peak_rss = None
+        self.collectors = []
+
+    def add_collector(self, fn):
+        self.collectors.append(fn)
+
+    def observe_request(self, summary):
+        endpoint = summary["endpoint"]
+        with self.lock:
+            key = (endpoint, summary["status"])
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_wall.setdefault(endpoint, _Histogram(LATENCY_BUCKETS)).observe(summary["wall_s"])
+            for stage, values in summary["stages"].items():
+                self.stage_wall.setdefault((endpoint, stage), _Histogram(LATENCY_BUCKETS)).observe(values["wall_s"])
+                self.stage_cpu[(endpoint, stage)] = self.stage_cpu.get((endpoint, stage), 0.0) + values["cpu_s"]
+            if "audio_s" in summary:
+                self.audio_s[endpoint] = self.audio_s.get(endpoint, 0.0) + summary["audio_s"]
+                self.rtf.setdefault(endpoint, _Histogram(RTF_BUCKETS)).observe(summary["rtf"])
+            if summary.get("cache"):
+                key = (endpoint, summary["cache"])
+                self.cache_hits[key] = self.cache_hits.get(key, 0) + 1
+            if summary["peak_rss_mb"] is not None:
+                self.last_peak_rss = summary["peak_rss_mb"] * 1024 * 1024
+
+    def _render_histogram(self, lines, name, hist, **labels):
+        # observe() already counts cumulatively
+        for bound, count in zip(hist.buckets, hist.counts):
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {hist.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines += ["# HELP transcriber_requests_total Finished requests by endpoint and status",
+                      "# TYPE transcriber_requests_total counter"]
+            for (endpoint, status), count in sorted(self.requests.items()):
+                lines.append(f"transcriber_requests_total{_labels(endpoint=endpoint, status=status)} {count}")
+
+            lines += ["# HELP transcriber_request_seconds Wall time per request",
+                      "# TYPE transcriber_request_seconds histogram"]
+            for endpoint, hist in sorted(self.request_wall.items()):
+                self._render_histogram(lines, "transcriber_request_seconds", hist, endpoint=endpoint)
+
+            lines += ["# HELP transcriber_stage_seconds Wall time per pipeline stage",
+                      "# TYPE transcriber_stage_seconds histogram"]
+            for (endpoint, stage), hist in sorted(self.stage_wall.items()):
+                self._render_histogram(lines, "transcriber_stage_seconds", hist, endpoint=endpoint, stage=stage)
+
+            lines += ["# HELP transcriber_stage_cpu_seconds_total Process CPU time while each stage ran",
+                      "# TYPE transcriber_stage_cpu_seconds_total counter"]
+            for (endpoint, stage), total in sorted(self.stage_cpu.items()):
+                lines.append(f"transcriber_stage_cpu_seconds_total{_labels(endpoint=endpoint, stage=stage)} {total}")
+
+            lines += ["# HELP transcriber_audio_seconds_total Audio processed",
+                      "# TYPE transcriber_audio_seconds_total counter"]
+            for endpoint, total in sorted(self.audio_s.items()):
+                lines.append(f"transcriber_audio_seconds_total{_labels(endpoint=endpoint)} {total}")
+
+            lines += ["# HELP transcriber_real_time_factor Request wall time divided by audio duration",
+                      "# TYPE transcriber_real_time_factor histogram"]
+            for endpoint, hist in sorted(self.rtf.items()):
+                self._render_histogram(lines, "transcriber_real_time_factor", hist, endpoint=endpoint)
+
+            lines += ["# HELP transcriber_cache_hits_total Requests answered (partly) from the result cache",
+                      "# TYPE transcriber_cache_hits_total counter"]
+            for (endpoint, kind), count in sorted(self.cache_hits.items()):
+                lines.append(f"transcriber_cache_hits_total{_labels(endpoint=endpoint, kind=kind)} {count}")
+
+            if self.last_peak_rss is not None:
+                lines += ["# HELP transcriber_request_peak_rss_bytes Peak RSS during the last finished request",
+                          "# TYPE transcriber_request_peak_rss_bytes gauge",
+                          f"transcriber_request_peak_rss_bytes {self.last_peak_rss}"]
+
+        rss = current_rss_bytes()
+        if rss is not None:
+            lines += ["# HELP process_resident_memory_bytes Current RSS",
+                      "# TYPE process_resident_memory_bytes gauge",
+                      f"process_resident_memory_bytes {rss}"]
+        peak = peak_rss_bytes()
+        if peak is not None:
+            lines += ["# HELP process_peak_resident_memory_bytes Lifetime peak RSS",
+                      "# TYPE process_peak_resident_memory_bytes gauge",
+                      f"process_peak_resident_memory_bytes {peak}"]
+
+        for collector in self.collectors:
+            for name, help_text, kind, samples in collector():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(**labels) if labels else ''} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404, "Not Found")
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Scrapes are too frequent to log
+
+def start_metrics_server(port):
+    # Plain HTTP /metrics for Prometheus, next to the Gradio server
+    httpd = http.server.ThreadingHTTPServer(("", port), _MetricsHandler)
+    threading.Thread(target=httpd.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics endpoint: http://localhost:{port}/metrics", flush=True)
+    return httpd
@@ -0,0 +1,8 @@
+import os
+
+# Model ids shared by the app and the tools that prepare its models
+# (model_store.py); this module must stay free of heavy imports
+MODEL_NAME = "KBLab/kb-whisper-small"
+DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+# Larger model for the two-tier mode (/transcribe_refine)
+REFINE_MODEL_NAME = os.environ.get("REFINE_MODEL_NAME", "KBLab/kb-whisper-large")
@@ -0,0 +1,345 @@
+"""
+Local, versioned model store with memory-mapped weights.
+
+`python model_store.py materialize` downloads Whisper and the pyannote
+diarization pipeline once (needs network and HF_TOKEN) and writes them to
+a new version directory under MODEL_STORE:
+
+    <store>/CURRENT                         name of the active version
+    <store>/<version>/manifest.json         models, revisions, file hashes
+    <store>/<version>/whisper/<model>/      config, tokenizer, model.safetensors
+    <store>/<version>/diarization/<model>/  config.yaml, segmentation/, embedding/
+
+Versions are never modified after they are written; CURRENT is switched
+atomically once a version is complete. Loading from the store needs
+neither the Hub nor a token. The weights are read through a read-only
+mmap of the safetensors files and assigned to the modules without a copy,
+so processes on one host (Gradio app, job, shard and CLI workers) share
+the page cache instead of each holding a private copy of the model.
+
+Usage: python model_store.py materialize [--store DIR] [--whisper NAME ...] [--diarization NAME]
+       python model_store.py verify [--store DIR] [--version V]
+       python model_store.py list [--store DIR]
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+DEFAULT_STORE = os.path.join(os.path.expanduser("~"), ".cache", "svensk-transkribering-models")
+
+# safetensors dtype -> numpy dtype; BF16 has none and is reinterpreted in torch
+SAFETENSORS_DTYPES = {
+    "F64": np.float64, "F32": np.float32, "F16": np.float16, "BF16": np.uint16,
+    "I64": np.int64, "I32": np.int32, "I16": np.int16, "I8": np.int8, "U8": np.uint8, "BOOL": np.bool_,
+}
+
+def use_offline_hub():
+    """
+    Keep huggingface_hub and transformers off the network. They read these
+    variables when they are first imported (gradio imports huggingface_hub
+    too), so this has to run before any of them is.
+    """
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+def _slug(name):
+    return name.replace("/", "--")
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _hash_tree(root):
+    # Relative path -> SHA-256 of every file below root
+    hashes = {}
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            hashes[os.path.relpath(path, root).replace(os.sep, "/")] = _sha256(path)
+    return dict(sorted(hashes.items()))
+
+def mmap_safetensors(path):
+    """
+    Arrays for every tensor in a .safetensors file, as read-only views of
+    one shared mmap of the file (nothing is copied or read up front).
+    Returns {name: (numpy array, safetensors dtype)}.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header_len, = struct.unpack("<Q", mm[:8])
+    header = json.loads(mm[8:8 + header_len])
+    base = 8 + header_len
+    arrays = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = np.dtype(SAFETENSORS_DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        array = np.frombuffer(mm, dtype=dtype, count=(end - start) // dtype.itemsize, offset=base + start)
+        arrays[name] = (array.reshape(info["shape"]), info["dtype"])
+    return arrays
+
+def mmap_state_dict(paths):
+    # torch tensors sharing the mmapped pages of the given safetensors files
+    import torch
+    state = {}
+    with warnings.catch_warnings():
+        # The views are read-only; inference never writes to the weights
+        warnings.simplefilter("ignore", UserWarning)
+        for path in paths:
+            for name, (array, dtype) in mmap_safetensors(path).items():
+                tensor = torch.from_numpy(array)
+                state[name] = tensor.view(torch.bfloat16) if dtype == "BF16" else tensor
+    return state
+
+def assign_weights(module, state):
+    """
+    Point the parameters and buffers of `module` at the tensors in `state`
+    (no copy). Returns the names that were not in `state`.
+    """
+    missing, _ = module.load_state_dict(state, strict=False, assign=True)
+    for param in module.parameters():
+        param.requires_grad_(False)
+    return missing
+
+class ModelStore:
+    """
+    One version of a materialized store, read-only. `version` defaults to
+    the one named in <root>/CURRENT.
+    """
+
+    def __init__(self, root, version=None):
+        self.root = root
+        if version is None:
+            current = os.path.join(root, "CURRENT")
+            if not os.path.exists(current):
+                raise RuntimeError(f"No model store in {root}; run: python model_store.py materialize --store {root}")
+            with open(current) as f:
+                version = f.read().strip()
+        self.version = version
+        self.path = os.path.join(root, version)
+        with open(os.path.join(self.path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+
+    def has(self, name):
+        return name in self.manifest["models"]
+
+    def model_dir(self, name):
+        if not self.has(name):
+            raise RuntimeError(f"{name} is not in model store version {self.version}; "
+                               f"run: python model_store.py materialize --store {self.root}")
+        return os.path.join(self.path, self.manifest["models"][name]["path"])
+
+    def whisper(self, name, backend="fp32", device="cpu"):
+        """
+        ASR pipeline for `name` from the store. fp32, sdpa and int8 build the
+        model on the meta device and map the weights in; int8 then quantizes
+        (the quantized Linear weights are private to the process, the rest
+        stays shared). onnx exports from the local copy as usual.
+        """
+        from asr_backends import build_asr_pipeline
+        path = self.model_dir(name)
+        if backend == "onnx":
+            return build_asr_pipeline(path, backend, device)
+
+        from transformers import AutoProcessor, pipeline
+        try:
+            model = self._mmap_whisper(path, backend)
+        except Exception as e:
+            # Still local and offline, just with a private copy of the weights
+            print(f"Memory-mapped load of {name} failed ({e}), loading a private copy", flush=True)
+            return build_asr_pipeline(path, backend, device)
+
+        if backend == "int8":
+            import torch
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        processor = AutoProcessor.from_pretrained(path)
+        return pipeline("automatic-speech-recognition", model=model, tokenizer=processor.tokenizer,
+                        feature_extractor=processor.feature_extractor, device=device)
+
+    def _mmap_whisper(self, path, backend):
+        import torch
+        from transformers import AutoConfig, AutoModelForSpeechSeq2Seq, GenerationConfig
+
+        config = AutoConfig.from_pretrained(path)
+        kwargs = {"attn_implementation": "sdpa"} if backend == "sdpa" else {}
+        # No memory is allocated for the weights; they come from the mmap
+        with torch.device("meta"):
+            model = AutoModelForSpeechSeq2Seq.from_config(config, **kwargs)
+        files = sorted(f for f in os.listdir(path) if f.endswith(".safetensors"))
+        assign_weights(model, mmap_state_dict([os.path.join(path, f) for f in files]))
+        # The output projection shares the token embedding and is not stored separately
+        model.tie_weights()
+        left = [n for n, t in list(model.named_parameters()) + list(model.named_buffers()) if t.is_meta]
+        if left:
+            raise RuntimeError(f"weights missing from the store: {', '.join(left[:5])}")
+        model.generation_config = GenerationConfig.from_pretrained(path)
+        return model.eval()
+
+    def diarization(self, name):
+        """
+        pyannote pipeline for `name` from the store. The pipeline is built
+        from the stored config and checkpoints, then its two networks are
+        pointed at the mmapped safetensors copies of their weights.
+        """
+        from pyannote.audio import Pipeline
+        path = self.model_dir(name)
+
+        # The stored config refers to the checkpoints relative to itself
+        with open(os.path.join(path, "config.yaml")) as f:
+            config = f.read()
+        for component in ("segmentation", "embedding"):
+            config = config.replace(f"./{component}/", os.path.join(path, component) + os.sep)
+        with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+            f.write(config)
+        try:
+            loaded = Pipeline.from_pretrained(f.name)
+        finally:
+            os.remove(f.name)
+
+        # pyannote 3.1 attribute names; if they move we keep the checkpoint weights
+        try:
+            for module, component in ((loaded._segmentation.model, "segmentation"), (loaded._embedding.model_, "embedding")):
+                missing = assign_weights(module, mmap_state_dict([os.path.join(path, component, "model.safetensors")]))
+                if missing:
+                    raise RuntimeError(f"{component} weights missing from the store: {', '.join(missing[:5])}")
+        except Exception as e:
+            print(f"Memory-mapped diarization weights not used ({e})", flush=True)
+        return loaded
+
+    def verify(self):
+        # Files whose hash no longer matches the manifest (empty when intact)
+        problems = []
+        for name, entry in self.manifest["models"].items():
+            actual = _hash_tree(os.path.join(self.path, entry["path"]))
+            for rel, digest in entry["files"].items():
+                if actual.get(rel) != digest:
+                    problems.append(f"{name}: {rel}")
+        return problems
+
+def _materialize_whisper(name, target, token):
+    from huggingface_hub import HfApi
+    from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor
+
+    revision = HfApi().model_info(name, token=token).sha
+    model = AutoModelForSpeechSeq2Seq.from_pretrained(name, revision=revision, token=token)
+    model.save_pretrained(target, safe_serialization=True)
+    AutoProcessor.from_pretrained(name, revision=revision, token=token).save_pretrained(target)
+    return revision
+
+def _materialize_diarization(name, target, token):
+    import torch
+    import yaml
+    from huggingface_hub import HfApi, hf_hub_download
+    from safetensors.torch import save_file
+
+    api = HfApi()
+    revision = api.model_info(name, token=token).sha
+    with open(hf_hub_download(name, "config.yaml", revision=revision, token=token)) as f:
+        config = yaml.safe_load(f)
+
+    params = config["pipeline"]["params"]
+    components = {}
+    for component in ("segmentation", "embedding"):
+        repo = params[component]
+        component_revision = api.model_info(repo, token=token).sha
+        checkpoint = hf_hub_download(repo, "pytorch_model.bin", revision=component_revision, token=token)
+        os.makedirs(os.path.join(target, component))
+        shutil.copyfile(checkpoint, os.path.join(target, component, "pytorch_model.bin"))
+        # Lightning checkpoint keys are the module's state_dict keys
+        state = torch.load(checkpoint, map_location="cpu", weights_only=False)["state_dict"]
+        save_file({k: v.contiguous() for k, v in state.items()}, os.path.join(target, component, "model.safetensors"))
+        params[component] = f"./{component}/pytorch_model.bin"
+        components[component] = {"name": repo, "revision": component_revision}
+
+    with open(os.path.join(target, "config.yaml"), "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return revision, components
+
+def materialize(root, whisper_models, diarization_model, token):
+    """
+    Write a new version with the given models and make it current.
+    Returns the version name.
+    """
+    version = time.strftime("%Y%m%d-%H%M%S")
+    os.makedirs(root, exist_ok=True)
+    # Built next to its final place and renamed, so a version dir is always complete
+    staging = tempfile.mkdtemp(prefix=f".{version}-", dir=root)
+    try:
+        models = {}
+        for name in whisper_models:
+            rel = f"whisper/{_slug(name)}"
+            print(f"Materializing {name}...", flush=True)
+            revision = _materialize_whisper(name, os.path.join(staging, rel), token)
+            models[name] = {"kind": "whisper", "revision": revision, "path": rel}
+        if diarization_model:
+            rel = f"diarization/{_slug(diarization_model)}"
+            print(f"Materializing {diarization_model}...", flush=True)
+            revision, components = _materialize_diarization(diarization_model, os.path.join(staging, rel), token)
+            models[diarization_model] = {"kind": "diarization", "revision": revision, "path": rel,
+                                         "components": components}
+        for entry in models.values():
+            entry["files"] = _hash_tree(os.path.join(staging, entry["path"]))
+
+        with open(os.path.join(staging, "manifest.json"), "w") as f:
+            json.dump({"version": version, "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "models": models}, f, indent=2)
+        os.rename(staging, os.path.join(root, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    current = os.path.join(root, "CURRENT")
+    with open(current + ".tmp", "w") as f:
+        f.write(version + "\n")
+    os.replace(current + ".tmp", current)
+    return version
+
+def main():
+    # Defaults come from the same settings the app loads with
+    from model_names import DIARIZATION_MODEL, MODEL_NAME
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["materialize", "verify", "list"])
+    parser.add_argument("--store", default=os.environ.get("MODEL_STORE") or DEFAULT_STORE)
+    parser.add_argument("--version", help="Version to verify (default: current)")
+    parser.add_argument("--whisper", nargs="+", default=[MODEL_NAME],
+                        help="Whisper models to include, e.g. also the REFINE_MODEL_NAME")
+    parser.add_argument("--diarization", default=DIARIZATION_MODEL, help="pyannote pipeline ('' to skip)")
+    args = parser.parse_args()
+
+    if args.command == "materialize":
+        version = materialize(args.store, args.whisper, args.diarization, os.environ.get("HF_TOKEN"))
+        print(f"Model store version {version} is current in {args.store}")
+        print(f"Start the app with MODEL_STORE={args.store} to load it offline")
+    elif args.command == "verify":
+        store = ModelStore(args.store, args.version)
+        problems = store.verify()
+        for problem in problems:
+            print(f"Changed or missing: {problem}")
+        print(f"Version {store.version}: " + ("OK" if not problems else f"{len(problems)} problem(s)"))
+        if problems:
+            sys.exit(1)
+    else:
+        current = ModelStore(args.store).version if os.path.exists(os.path.join(args.store, "CURRENT")) else None
+        for version in sorted(v for v in os.listdir(args.store) if not v.startswith(".") and
+                              os.path.isdir(os.path.join(args.store, v))):
+            with open(os.path.join(args.store, version, "manifest.json")) as f:
+                models = json.load(f)["models"]
+            marker = "*" if version == current else " "
+            print(f"{marker} {version}: " + ", ".join(f"{n}@{e['revision'][:8]}" for n, e in models.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Confidence scoring and selective re-transcription for the two-tier mode.
+
+The draft comes from the small Whisper model. Each of its segments is
+scored by the gzip compression ratio of its text (high for the repetition
+loops Whisper produces on hard audio) and, optionally, by the average
+log-probability the small model assigns to its own text (teacher forcing,
+one extra forward pass per segment). Only low-confidence segments are
+re-transcribed with the larger model, over their whole length.
+"""
+import zlib
+
+from audio import SAMPLE_RATE
+
+# Whisper's own fallback thresholds (openai/whisper transcribe.py)
+DEFAULT_MIN_LOGPROB = -1.0
+DEFAULT_MAX_COMPRESSION = 2.4
+
+# Whisper sees at most 30 s of audio at a time
+MAX_SEGMENT_S = 30.0
+# Bump when the refined output changes so cached results are rebuilt
+REFINE_VERSION = 1
+
+def compression_ratio(text):
+    data = text.encode("utf-8")
+    if not data:
+        return 0.0
+    return len(data) / len(zlib.compress(data))
+
+def _segment_audio(waveform, segment):
+    start = int(segment["start"] * SAMPLE_RATE)
+    end = int(segment["end"] * SAMPLE_RATE)
+    return waveform[start:max(end, start + 1)]
+
+def avg_logprob(asr, audio, text):
+    """
+    Mean log-probability per token of `text` given `audio` under the ASR
+    pipeline's Whisper model, with the same prompt the pipeline decodes
+    with (Swedish, transcribe, no timestamps). Text tokens and end-of-text
+    are scored; the prompt tokens are not.
+    """
+    import torch
+
+    tokenizer = asr.tokenizer
+    prompt = tokenizer.convert_tokens_to_ids(["<|startoftranscript|>", "<|sv|>", "<|transcribe|>", "<|notimestamps|>"])
+    tokens = prompt + tokenizer.encode(" " + text.strip(), add_special_tokens=False) + [tokenizer.eos_token_id]
+
+    features = asr.feature_extractor(audio, sampling_rate=SAMPLE_RATE, return_tensors="pt").input_features
+    features = features.to(asr.model.device, dtype=asr.model.dtype)
+    ids = torch.tensor([tokens], device=asr.model.device)
+    with torch.no_grad():
+        logits = asr.model(input_features=features, decoder_input_ids=ids[:, :-1]).logits
+    logprobs = torch.log_softmax(logits.float(), dim=-1)[0]
+    targets = ids[0, 1:]
+    token_logprobs = logprobs.gather(1, targets.unsqueeze(1)).squeeze(1)
+    return float(token_logprobs[len(prompt) - 1:].mean())
+
+def score_segments(asr, waveform, segments, method):
+    """
+    One score dict per segment: always the compression ratio, plus the
+    average log-prob when method == "logprob" for segments that fit in one
+    Whisper window (the teacher-forced pass sees a single window).
+    """
+    scores = []
+    for segment in segments:
+        score = {"compression_ratio": round(compression_ratio(segment["text"]), 3)}
+        if (method == "logprob" and segment["text"].strip()
+                and segment["end"] - segment["start"] <= MAX_SEGMENT_S):
+            score["avg_logprob"] = round(avg_logprob(asr, _segment_audio(waveform, segment), segment["text"]), 3)
+        scores.append(score)
+    return scores
+
+def low_confidence(score, min_logprob=DEFAULT_MIN_LOGPROB, max_compression=DEFAULT_MAX_COMPRESSION):
+    if score["compression_ratio"] > max_compression:
+        return True
+    return score.get("avg_logprob", 0.0) < min_logprob
+
+def refine_segments(refine_asr, waveform, result, indices, batch_size):
+    """
+    Re-transcribe the segments at `indices` with the larger model and
+    return a copy of `result` with their text replaced. Timestamps and
+    speakers stay as they are. Segments longer than one Whisper window are
+    decoded in 30 s chunks, so none of their text is lost.
+    """
+    segments = [dict(seg) for seg in result["segments"]]
+    if indices:
+        pieces = [_segment_audio(waveform, segments[i]) for i in indices]
+        outputs = refine_asr(pieces, batch_size=batch_size, chunk_length_s=MAX_SEGMENT_S)
+        for i, output in zip(indices, outputs):
+            text = output.get("text", "").strip()
+            if text:
+                segments[i]["text"] = text
+                segments[i]["refined"] = True
+    return {**result, "segments": segments}
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+# Evicted entries are renamed to this prefix before they are deleted
+TRASH_PREFIX = ".evicted-"
+
+class ResultCache:
+    """
+    Content-addressed on-disk cache for transcription results.
+
+    Each recording gets a directory named after the SHA-256 of its bytes.
+    Inside it every stage (Whisper chunks, diarization turns, merged result)
+    is stored as its own JSON file, keyed by a hash of the parameters that
+    produced it. Changing e.g. only the merge logic therefore reuses the
+    stored inference output. Whole recordings are evicted least recently
+    used first once the directory grows past `max_bytes`.
+
+    The directory is shared by the app, job, shard and CLI processes.
+    Every file is written to a temp file and renamed into place, and an
+    evicted entry is first renamed away and only then deleted, so a
+    process never reads a partial file or writes into a half-deleted
+    entry. Each process keeps a running estimate of the total size and
+    only walks the directory when the estimate passes `max_bytes` or
+    every `rescan_s` seconds (to see what the other processes wrote).
+    """
+
+    def __init__(self, directory, max_bytes, rescan_s=60.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_s = rescan_s
+        self.lock = threading.Lock()
+        self.evicting = threading.Lock()
+        self.total = None       # estimated bytes on disk; None until the first scan
+        self.scanned_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def audio_key(self, audio_file):
+        digest = hashlib.sha256()
+        with open(audio_file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _path(self, key, stage, params):
+        params_hash = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, key, f"{stage}-{params_hash}.json")
+
+    def get(self, key, stage, params):
+        path = self._path(key, stage, params)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Mark the recording as recently used
+        try:
+            os.utime(os.path.dirname(path))
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, stage, params, value):
+        # A failed write only costs a later cache miss, never the request
+        path = self._path(key, stage, params)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        try:
+            replaced = self._write(path, data)
+        except OSError as e:
+            print(f"Cache write failed for {key[:12]}: {e}", flush=True)
+            return
+
+        with self.lock:
+            if self.total is not None:
+                self.total += len(data) - replaced
+            due = (self.total is None or self.total > self.max_bytes
+                   or time.monotonic() - self.scanned_at > self.rescan_s)
+        if due:
+            self._evict(keep=key)
+
+    def _write(self, path, data):
+        # Returns the size of the file it replaced. Another process may evict
+        # the entry directory at any moment; then the write starts over once.
+        entry_dir = os.path.dirname(path)
+        for attempt in range(2):
+            try:
+                os.makedirs(entry_dir, exist_ok=True)
+                try:
+                    replaced = os.path.getsize(path)
+                except OSError:
+                    replaced = 0
+                fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+                    raise
+                os.utime(entry_dir)
+                return replaced
+            except FileNotFoundError:
+                if attempt:
+                    raise
+
+    def _scan(self):
+        # (last access, name, bytes) per entry; also clears out trash that a
+        # crashed process left behind
+        entries = []
+        for name in os.listdir(self.directory):
+            entry_dir = os.path.join(self.directory, name)
+            if name.startswith(TRASH_PREFIX):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            try:
+                mtime = os.path.getmtime(entry_dir)
+                files = os.listdir(entry_dir)
+            except OSError:
+                continue  # a file, or evicted by another process meanwhile
+            size = 0
+            for f in files:
+                try:
+                    size += os.path.getsize(os.path.join(entry_dir, f))
+                except OSError:
+                    continue
+            entries.append((mtime, name, size))
+        return entries
+
+    def _evict(self, keep=None):
+        # One scan at a time per process; a put arriving meanwhile skips it
+        if not self.evicting.acquire(blocking=False):
+            return
+        try:
+            entries = self._scan()
+            total = sum(size for _, _, size in entries)
+
+            # Oldest access first
+            for _, name, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if name == keep:
+                    continue
+                # Rename first: a writer in another process then recreates
+                # the entry instead of writing into a directory being deleted
+                trash = os.path.join(self.directory, f"{TRASH_PREFIX}{name}-{uuid.uuid4().hex[:8]}")
+                try:
+                    os.rename(os.path.join(self.directory, name), trash)
+                except OSError:
+                    continue  # already evicted by another process
+                shutil.rmtree(trash, ignore_errors=True)
+                total -= size
+                print(f"Cache evicted {name[:12]} ({size} bytes)", flush=True)
+
+            with self.lock:
+                self.total = total
+                self.scanned_at = time.monotonic()
+        finally:
+            self.evicting.release()
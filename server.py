@@ -1,78 +1,902 @@
-
+import http.client
 import http.server
-import socketserver
-import urllib.request
-import urllib.parse
 import json
 import os
-import sys
+import queue
+import select
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from collections import deque
+
+from metrics import REGISTRY
+
+try:
+    import imageio_ffmpeg
+except ImportError:
+    imageio_ffmpeg = None
+
+PORT = int(os.environ.get("PORT", 8000))
+TARGET_URL = os.environ.get("TARGET_URL", "https://router.huggingface.co/hf-inference/models/KBLab/whisper-large-v3-swedish")
+
+# Bodies are streamed in blocks of this size, so memory use does not grow with the upload
+CHUNK_SIZE = 64 * 1024
+UPSTREAM_TIMEOUT_S = float(os.environ.get("UPSTREAM_TIMEOUT_S", 600))
+# Idle keep-alive connections to the upstream are kept at most this many / this long
+UPSTREAM_POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", 8))
+UPSTREAM_IDLE_S = 30
+# A request on a reused connection keeps its first blocks (up to this much)
+# to resend if the upstream had closed the connection
+RETRY_BUFFER_BYTES = 1024 * 1024
+
+# Backends tried for each upload, in order of preference: URLs and/or
+# "local" for Whisper in this process (transcriber.py). With more than one,
+# a request still unanswered after the hedge delay is also sent to the next
+# backend and the first good answer wins; errors fail over right away.
+TARGET_URLS = [u.strip() for u in os.environ.get("TARGET_URLS", TARGET_URL).split(",") if u.strip()]
+LOCAL_BACKEND = "local"
+# Total time per backend attempt, one value per backend (default UPSTREAM_TIMEOUT_S)
+BACKEND_TIMEOUTS_S = [float(t) for t in os.environ.get("BACKEND_TIMEOUTS_S", "").split(",") if t.strip()]
+# Socket timeout of a remote attempt beyond its deadline: the handler
+# aborts it at the deadline, the socket timeout is only the backstop
+ATTEMPT_SOCKET_GRACE_S = 5.0
+# Hedge after this percentile of the backend's recent seconds per MB of upload,
+# but not sooner than HEDGE_MIN_DELAY_S; HEDGE_DEFAULT_DELAY_S until
+# HEDGE_MIN_SAMPLES answers have been seen
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 95))
+HEDGE_MIN_DELAY_S = float(os.environ.get("HEDGE_MIN_DELAY_S", 2.0))
+HEDGE_DEFAULT_DELAY_S = float(os.environ.get("HEDGE_DEFAULT_DELAY_S", 30.0))
+HEDGE_MIN_SAMPLES = 10
+LATENCY_WINDOW = 200
+# A backend that failed CIRCUIT_FAILURES times in a row is skipped for
+# CIRCUIT_OPEN_S, then gets a single trial request
+CIRCUIT_FAILURES = int(os.environ.get("CIRCUIT_FAILURES", 5))
+CIRCUIT_OPEN_S = float(os.environ.get("CIRCUIT_OPEN_S", 30))
+
+# Optional: with TRANSCODE=1, uploads of at least TRANSCODE_MIN_MB are
+# re-encoded to 16 kHz mono (TRANSCODE_FORMAT) with ffmpeg before forwarding.
+# Off by default; it trades proxy CPU for upstream bandwidth.
+TRANSCODE = os.environ.get("TRANSCODE", "0") == "1"
+TRANSCODE_MIN_BYTES = int(float(os.environ.get("TRANSCODE_MIN_MB", 2)) * 1024 * 1024)
+TRANSCODE_FORMAT = os.environ.get("TRANSCODE_FORMAT", "flac")
+TRANSCODE_FORMATS = {
+    # Lossless, typically about 1/6 of a 48 kHz stereo WAV
+    "flac": (["-c:a", "flac", "-f", "flac"], "audio/flac"),
+    # Much smaller, lossy; speech-tuned Opus at 32 kbit/s
+    "opus": (["-c:a", "libopus", "-b:a", "32k", "-application", "voip", "-f", "ogg"], "audio/ogg"),
+}
+# Already compressed uploads that a lossless re-encode would only make bigger
+LOSSY_TYPES = ("audio/mpeg", "audio/mp3", "audio/mp4", "audio/x-m4a", "audio/aac",
+               "audio/ogg", "audio/opus", "audio/webm")
+# Spooled uploads stay in memory up to this size, then move to a temp file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+class TranscodeStats:
+    # Counters for GET /api/metrics
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}  # result -> count
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    def record(self, result, bytes_in, bytes_out, seconds=0.0):
+        with self.lock:
+            self.requests[result] = self.requests.get(result, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.seconds += seconds
+
+    def collect(self):
+        with self.lock:
+            return [
+                ("proxy_uploads_total", "Proxied uploads by transcoding result", "counter",
+                 [({"result": result}, count) for result, count in sorted(self.requests.items())]),
+                ("proxy_upload_bytes_received_total", "Upload bytes received from clients", "counter", [({}, self.bytes_in)]),
+                ("proxy_upload_bytes_sent_total", "Upload bytes forwarded upstream", "counter", [({}, self.bytes_out)]),
+                ("proxy_transcode_bytes_saved_total", "Upload bytes saved by transcoding", "counter",
+                 [({}, self.bytes_in - self.bytes_out)]),
+                ("proxy_transcode_seconds_total", "Time spent uploading and transcoding", "counter", [({}, self.seconds)]),
+            ]
+
+TRANSCODE_STATS = TranscodeStats()
+REGISTRY.add_collector(TRANSCODE_STATS.collect)
+
+class TranscodedUpload:
+    """
+    Re-encode an upload to 16 kHz mono with ffmpeg while it is forwarded.
+    A feeder thread writes the upload to ffmpeg and to a spooled copy;
+    iterating yields ffmpeg's output as it is produced, so the upstream
+    request starts long before the upload has finished. If ffmpeg fails
+    before its first output block, the original is sent instead. close()
+    reaps ffmpeg and joins the threads in every case.
+    """
+
+    def __init__(self, blocks, fmt=TRANSCODE_FORMAT):
+        codec_args, self.content_type = TRANSCODE_FORMATS[fmt]
+        self.original = tempfile.SpooledTemporaryFile(SPOOL_MAX_BYTES)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.failed = False
+        self.upload_error = None
+        self.first = b""
+        self.t0 = time.perf_counter()
+        cmd = [
+            imageio_ffmpeg.get_ffmpeg_exe(),
+            "-nostdin", "-loglevel", "error",
+            "-i", "pipe:0",
+            "-vn", "-ac", "1", "-ar", "16000",
+            *codec_args,
+            "pipe:1",
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # stderr is drained in the background so ffmpeg never stalls on a full pipe
+        self.err = []
+        self.threads = [
+            threading.Thread(target=self._feed, args=(blocks,), daemon=True),
+            threading.Thread(target=lambda: self.err.append(self.proc.stderr.read()), daemon=True),
+        ]
+        for t in self.threads:
+            t.start()
+
+    def _feed(self, blocks):
+        feeding = True
+        try:
+            for block in blocks:
+                self.original.write(block)
+                self.bytes_in += len(block)
+                if feeding:
+                    try:
+                        self.proc.stdin.write(block)
+                    except (OSError, ValueError):
+                        # ffmpeg gave up on the input; keep reading the upload for the fallback
+                        feeding = False
+        except Exception as e:
+            # The client went away mid-upload; ffmpeg's output would be truncated
+            self.upload_error = e
+            self.proc.kill()
+        finally:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+
+    def _stderr(self):
+        return (self.err[0] if self.err else b"").decode(errors="replace").strip()
+
+    def start(self):
+        """
+        Wait for ffmpeg's first output block. If there is none, wait for
+        the whole upload and switch to forwarding the original.
+        """
+        self.first = self.proc.stdout.read1(CHUNK_SIZE)
+        if self.first:
+            return
+        self.threads[0].join()
+        if self.upload_error:
+            raise ConnectionError(str(self.upload_error))
+        self.proc.wait()
+        self.failed = True
+        print(f"Transcoding failed, forwarding the original: {self._stderr()[:300]}", flush=True)
+
+    def __iter__(self):
+        if self.failed:
+            self.original.seek(0)
+            for block in iter(lambda: self.original.read(CHUNK_SIZE), b""):
+                self.bytes_out += len(block)
+                yield block
+            return
+
+        block = self.first
+        while block:
+            self.bytes_out += len(block)
+            yield block
+            block = self.proc.stdout.read1(CHUNK_SIZE)
+        self.threads[0].join()
+        if self.upload_error:
+            raise ConnectionError(str(self.upload_error))
+        # Part of the output is already upstream, so there is no falling back now
+        if self.proc.wait() != 0:
+            raise RuntimeError(f"Transcoding failed mid-upload: {self._stderr()[:300]}")
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        # The feeder may still be reading the rest of the upload
+        for t in self.threads:
+            t.join()
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+        self.original.close()
+
+        seconds = time.perf_counter() - self.t0
+        if self.failed:
+            result = "failed"
+        elif self.bytes_out < self.bytes_in:
+            result = "transcoded"
+        else:
+            result = "not_smaller"
+        TRANSCODE_STATS.record(result, self.bytes_in, self.bytes_out, seconds)
+        if result == "transcoded":
+            print(f"Transcoded upload {self.bytes_in / 1e6:.1f} MB -> {self.bytes_out / 1e6:.1f} MB in {seconds:.1f}s", flush=True)
 
-PORT = 8000
-TARGET_URL = "https://router.huggingface.co/hf-inference/models/KBLab/whisper-large-v3-swedish"
+def _spooled_size(f):
+    size = f.seek(0, os.SEEK_END)
+    f.seek(0)
+    return size
+
+class _RecordedBody:
+    """
+    Request body that keeps the first blocks it has handed out in memory,
+    up to RETRY_BUFFER_BYTES. A connection the upstream has closed fails
+    on the first writes, so if a reused one breaks while the copy is still
+    complete, again() sends the same body on a new connection: the copy
+    first, then the rest of the source. Past the cap the copy is dropped
+    and the request fails instead. source_failed tells a broken upload
+    apart from a broken upstream.
+    """
+
+    def __init__(self, source):
+        self.source = iter(source)
+        self.copy = []
+        self.copied = 0
+        self.source_failed = False
+
+    def __iter__(self):
+        try:
+            for block in self.source:
+                if self.copy is not None:
+                    self.copied += len(block)
+                    if self.copied <= RETRY_BUFFER_BYTES:
+                        self.copy.append(block)
+                    else:
+                        self.copy = None
+                yield block
+        except Exception:
+            self.source_failed = True
+            raise
+
+    def replayable(self):
+        return self.copy is not None and not self.source_failed
+
+    def again(self):
+        yield from self.copy
+        yield from self.source
+
+def _closed_by_peer(conn):
+    # An idle keep-alive socket has nothing to read; readable means the
+    # upstream closed it (EOF) or broke the protocol, so it is not reused
+    sock = conn.sock
+    if sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+class UpstreamPool:
+    """
+    Keep-alive connections to one upstream origin. acquire() hands out an
+    idle connection (or a new one), release() puts it back once its
+    response has been read to the end.
+    """
+
+    def __init__(self, target_url, size=UPSTREAM_POOL_SIZE, timeout=UPSTREAM_TIMEOUT_S):
+        self.url = target_url
+        url = urllib.parse.urlsplit(target_url)
+        self.conn_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.host = url.hostname
+        self.port = url.port
+        self.path = url.path or "/"
+        if url.query:
+            self.path += "?" + url.query
+        self.size = size
+        self.timeout = timeout
+        self.idle = []  # (connection, released_at)
+        self.lock = threading.Lock()
+        self.created = 0
+
+    def acquire(self, fresh=False):
+        # Returns (connection, reused); fresh=True skips the idle connections
+        with self.lock:
+            while self.idle and not fresh:
+                conn, released_at = self.idle.pop()
+                # The upstream may already have closed long-idle connections
+                if time.monotonic() - released_at < UPSTREAM_IDLE_S and not _closed_by_peer(conn):
+                    return conn, True
+                conn.close()
+            self.created += 1
+        return self.conn_class(self.host, self.port, timeout=self.timeout), False
+
+    def release(self, conn):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+class Attempt:
+    """
+    One request to one backend. The handler thread cancels attempts that
+    lost the race or ran past their timeout. Closing a socket from another
+    thread does not wake a thread blocked reading it, so remote attempts
+    shut the socket down (_abort), which ends the read right away; their
+    socket timeout only covers the case that fails.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.started = time.monotonic()
+        self.deadline = self.started + backend.timeout_s
+        self.cancelled = None      # None, "timeout" or "lost"
+        self._on_cancel = None
+        self.lock = threading.Lock()
+
+    def on_cancel(self, fn):
+        with self.lock:
+            self._on_cancel = fn
+            cancelled = self.cancelled
+        if cancelled and fn:
+            fn()
+
+    def cancel(self, reason):
+        with self.lock:
+            if self.cancelled:
+                return
+            self.cancelled = reason
+            fn = self._on_cancel
+        if fn:
+            fn()
+
+class Backend:
+    """
+    Latency stats and circuit breaker shared by both backend kinds.
+    Subclasses implement send(attempt, headers, body) -> (status,
+    content type, body bytes).
+    """
+
+    def __init__(self, name, timeout_s):
+        self.name = name
+        self.timeout_s = timeout_s
+        self.lock = threading.Lock()
+        self.seconds_per_mb = deque(maxlen=LATENCY_WINDOW)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.outcomes = {}    # ok / error / timeout / lost / loading -> count
+        self.hedges = 0       # times this backend was started as a hedge
+        self.wins = 0         # hedged races this backend won
+        self.failures = 0     # consecutive
+        self.open_until = 0.0
+        self.trial = False    # a half-open trial request is in flight
+
+    def state(self):
+        if self.failures < CIRCUIT_FAILURES:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half_open"
+
+    def loading(self, status, data):
+        # Is this failed answer the backend warming up? Those fail over like
+        # errors but do not count toward opening the circuit
+        return False
+
+    def acquire(self):
+        # May this backend take a request now? Half-open lets one trial through
+        with self.lock:
+            state = self.state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def record(self, outcome, latency_s=None, size=0):
+        with self.lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self.trial = False
+            if outcome == "ok":
+                self.failures = 0
+                self.latencies.append(latency_s)
+                self.seconds_per_mb.append(latency_s / max(size / 1e6, 0.1))
+            elif outcome in ("error", "timeout"):
+                self.failures += 1
+                if self.failures >= CIRCUIT_FAILURES:
+                    if self.failures == CIRCUIT_FAILURES:
+                        print(f"Circuit open for {self.name} after {self.failures} failures", flush=True)
+                    self.open_until = time.monotonic() + CIRCUIT_OPEN_S
+
+    def hedge_delay(self, size):
+        # How long to wait for this backend before starting the next one
+        with self.lock:
+            samples = list(self.seconds_per_mb)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return min(HEDGE_DEFAULT_DELAY_S, self.timeout_s)
+        samples.sort()
+        per_mb = samples[min(len(samples) - 1, int(HEDGE_PERCENTILE / 100 * len(samples)))]
+        return min(max(HEDGE_MIN_DELAY_S, per_mb * max(size / 1e6, 0.1)), self.timeout_s)
+
+    def _percentile(self, p):
+        values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(p / 100 * len(values)))] if values else None
+
+    def collect(self):
+        labels = {"backend": self.name}
+        with self.lock:
+            return [
+                ("proxy_backend_requests_total", "Backend attempts by outcome", "counter",
+                 [({**labels, "outcome": o}, n) for o, n in sorted(self.outcomes.items())]),
+                ("proxy_backend_hedges_total", "Attempts started as hedges", "counter", [(labels, self.hedges)]),
+                ("proxy_backend_hedge_wins_total", "Races with more than one backend won", "counter", [(labels, self.wins)]),
+                ("proxy_backend_latency_seconds", "Recent successful latency", "gauge",
+                 [({**labels, "quantile": q}, v) for q, v in (("0.5", self._percentile(50)), ("0.95", self._percentile(95)))
+                  if v is not None]),
+                ("proxy_backend_circuit_open", "1 while the circuit breaker skips this backend", "gauge",
+                 [(labels, 1 if self.state() == "open" else 0)]),
+            ]
+
+def _abort(conn):
+    # Unblock a thread reading from `conn`; close() alone would not
+    sock = conn.sock
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    conn.close()
+
+class RemoteBackend(Backend):
+    def __init__(self, url, timeout_s):
+        super().__init__(url, timeout_s)
+        self.pool = UpstreamPool(url, timeout=timeout_s + ATTEMPT_SOCKET_GRACE_S)
+
+    def send(self, attempt, headers, body):
+        conn, _ = self.pool.acquire()
+        attempt.on_cancel(lambda: _abort(conn))
+        try:
+            if conn.sock is None:
+                conn.connect()
+            # Cancelled while connecting, before there was a socket to shut down
+            if attempt.cancelled:
+                raise ConnectionAbortedError(f"attempt {attempt.cancelled}")
+            conn.request("POST", self.pool.path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except Exception:
+            conn.close()
+            raise
+        attempt.on_cancel(None)
+        if response.will_close:
+            conn.close()
+        else:
+            self.pool.release(conn)
+        return response.status, response.getheader("Content-Type", "application/json"), data
+
+class LocalBackend(Backend):
+    """
+    Whisper in this process (transcriber.py), answering like the Hugging
+    Face ASR endpoint: {"text", "chunks"}. It cannot be interrupted, so a
+    cancelled local attempt runs to the end and its answer is dropped.
+    """
+
+    def __init__(self, timeout_s):
+        super().__init__(LOCAL_BACKEND, timeout_s)
+        import transcriber
+        self.transcriber = transcriber
+        transcriber.start_background_loading()
+
+    def send(self, attempt, headers, body):
+        from audio import load_audio
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            for block in body:
+                f.write(block)
+        try:
+            not_ready = self.transcriber.wait_for_models()
+            if not_ready:
+                # Still loading is worth retrying elsewhere; a failed load is an error
+                status = 503 if not_ready["status"] == "warming_up" else 500
+                return status, "application/json", json.dumps(not_ready).encode()
+            waveform = load_audio(f.name)
+            # Queue with the app's other Whisper passes instead of adding one
+            result = self.transcriber.asr_executor.submit(self.transcriber.run_asr, waveform).result()
+        finally:
+            os.remove(f.name)
+        chunks = [{"text": c["text"], "timestamp": list(c["timestamp"])} for c in result.get("chunks", [])]
+        return 200, "application/json", json.dumps({"text": result.get("text", ""), "chunks": chunks}).encode()
+
+    def loading(self, status, data):
+        return status == 503
+
+def make_backends(urls, timeouts=()):
+    backends = []
+    for i, url in enumerate(urls):
+        timeout_s = timeouts[i] if i < len(timeouts) else UPSTREAM_TIMEOUT_S
+        backend = LocalBackend(timeout_s) if url == LOCAL_BACKEND else RemoteBackend(url, timeout_s)
+        REGISTRY.add_collector(backend.collect)
+        backends.append(backend)
+    return backends
+
+def _replay(f, lock):
+    # Independent reader over a shared spooled upload (one per attempt)
+    offset = 0
+    while True:
+        with lock:
+            f.seek(offset)
+            block = f.read(CHUNK_SIZE)
+        if not block:
+            return
+        offset += len(block)
+        yield block
+
+def _run_attempt(attempt, headers, body, size, results):
+    backend = attempt.backend
+    try:
+        status, content_type, data = backend.send(attempt, headers, body)
+        # 429 and 5xx (e.g. 503 "model is loading") are worth another backend; other 4xx are final
+        failed = status == 429 or status >= 500
+        loading = failed and backend.loading(status, data)
+        outcome = (status, content_type, data)
+    except Exception as e:
+        failed = True
+        loading = False
+        outcome = (502, "application/json", json.dumps({"error": f"Upstream unreachable: {e}"}).encode())
+    latency_s = time.monotonic() - attempt.started
+    if attempt.cancelled:
+        backend.record("timeout" if attempt.cancelled == "timeout" else "lost")
+    elif loading:
+        backend.record("loading")
+    else:
+        backend.record("error" if failed else "ok", latency_s, size)
+    results.put((attempt, failed, outcome))
 
 class ProxyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # Keep-alive towards the browser; every response sets Content-Length or uses chunked encoding
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == '/api/metrics':
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            super().do_GET()
+
     def do_POST(self):
         if self.path == '/api/transcribe':
             self.handle_proxy()
         else:
             self.send_error(404, "Not Found")
 
+    def _request_body(self):
+        # Yield the upload in CHUNK_SIZE blocks (plain or chunked transfer encoding)
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    # Skip trailers up to the blank line
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                while size > 0:
+                    block = self.rfile.read(min(size, CHUNK_SIZE))
+                    if not block:
+                        raise ConnectionError("Client closed the connection mid-upload")
+                    size -= len(block)
+                    yield block
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining > 0:
+                block = self.rfile.read(min(remaining, CHUNK_SIZE))
+                if not block:
+                    raise ConnectionError("Client closed the connection mid-upload")
+                remaining -= len(block)
+                yield block
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _transcoded_body(self, headers):
+        """
+        Transcode the upload if enabled and large enough (or of unknown
+        size). Returns (body, objects to close); updates `headers` in place.
+        """
+        chunked_upload = "Content-Length" not in headers
+        size = None if chunked_upload else int(headers["Content-Length"])
+        lossless_of_lossy = (self.server.transcode_format == "flac"
+                             and headers["Content-Type"].split(";")[0].strip().lower() in LOSSY_TYPES)
+        if (not self.server.transcode or lossless_of_lossy
+                or (size is not None and size < TRANSCODE_MIN_BYTES)):
+            if size is not None:
+                TRANSCODE_STATS.record("skipped", size, size)
+            return self._request_body(), []
+
+        upload = TranscodedUpload(self._request_body(), self.server.transcode_format)
+        try:
+            upload.start()
+        except BaseException:
+            upload.close()
+            raise
+        if not upload.failed:
+            # The output size is only known at the end, so it is sent chunked
+            headers["Content-Type"] = upload.content_type
+            headers.pop("Content-Length", None)
+        return upload, [upload]
+
     def handle_proxy(self):
-        content_length = int(self.headers.get('Content-Length', 0))
-        post_data = self.rfile.read(content_length)
-        
+        # One remote backend: stream straight through. Otherwise hedge across backends.
+        upstream = self.server.upstream
+
         # Forward headers
         headers = {
             "Content-Type": self.headers.get("Content-Type", "application/octet-stream"),
         }
-        
+        if "chunked" not in self.headers.get("Transfer-Encoding", "").lower():
+            headers["Content-Length"] = self.headers.get("Content-Length", "0")
+
         auth_header = self.headers.get("Authorization")
         if auth_header:
             headers["Authorization"] = auth_header
 
-        print(f"Proxying request to {TARGET_URL}")
-        
-        req = urllib.request.Request(TARGET_URL, data=post_data, headers=headers, method="POST")
-        
+        spooled = []
         try:
-            with urllib.request.urlopen(req) as response:
-                self.send_response(response.getcode())
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(response.read())
-        except urllib.error.HTTPError as e:
-            self.send_response(e.code)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            
-            error_body = e.read()
-            # Try to parse as JSON to see if we can pass it through
             try:
-                # If it parses, it's safe to send as is
-                json.loads(error_body)
-                self.wfile.write(error_body)
-            except:
-                # If not JSON (likely HTML), wrap it so client doesn't crash on .json()
-                safe_response = {
-                    "error": f"Upstream API Error {e.code}",
-                    "details": error_body.decode('utf-8', errors='replace')[:500] # Truncate to avoid huge HTML
-                }
-                self.wfile.write(json.dumps(safe_response).encode())
+                body, spooled = self._transcoded_body(headers)
+            except ConnectionError as e:
+                print(f"Upload aborted: {e}", flush=True)
+                self.close_connection = True
+                return
+            if upstream is not None:
+                print(f"Proxying request to {upstream.url}", flush=True)
+                self._forward(upstream, headers, body)
+            else:
+                self._hedged(headers, body)
+        finally:
+            for f in spooled:
+                f.close()
+
+    def _forward(self, upstream, headers, body):
+        conn, reused = upstream.acquire()
+        # acquire() skips pooled connections the upstream visibly closed,
+        # but a close can still cross the request on the wire. That shows on
+        # the first writes, so such a request is sent once more on a new
+        # connection from its in-memory start (nothing of the response was
+        # read yet); later failures give a 502
+        recorded = _RecordedBody(body) if reused else None
+        try:
+            try:
+                response = self._request_upstream(conn, upstream, headers, recorded or body)
+            except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError) as e:
+                # RemoteDisconnected is a ConnectionResetError
+                if recorded is None or not recorded.replayable():
+                    raise
+                print(f"Pooled connection to {upstream.url} was closed ({e!r}), retrying on a new one", flush=True)
+                conn.close()
+                conn, _ = upstream.acquire(fresh=True)
+                response = self._request_upstream(conn, upstream, headers, recorded.again())
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
+            conn.close()
+            # The rest of the upload is unread, so this connection cannot be reused
+            self.close_connection = True
+            self.send_json(502, {"error": f"Upstream unreachable: {e}"})
+            return
+
+        try:
+            if response.status >= 400:
+                self.relay_error(response)
+            else:
+                self.relay_response(response)
+        except OSError as e:
+            # Upstream or client dropped mid-response; neither side is reusable
+            print(f"Proxy response aborted: {e}", flush=True)
+            conn.close()
+            self.close_connection = True
+            return
+
+        if response.will_close:
+            conn.close()
+        else:
+            upstream.release(conn)
+
+    def _request_upstream(self, conn, upstream, headers, body):
+        conn.request("POST", upstream.path, body=body, headers=headers,
+                     encode_chunked="Content-Length" not in headers)
+        return conn.getresponse()
+
+    def _hedged(self, headers, body):
+        """
+        Race the backends: start with the first available one, add the next
+        one after the hedge delay or right after a failure, and relay the
+        first good answer. Attempts past their backend's timeout, and the
+        losers once there is a winner, are cancelled.
+        """
+        # Every attempt needs the whole body, so the upload is spooled once
+        spool = tempfile.SpooledTemporaryFile(SPOOL_MAX_BYTES)
+        try:
+            for block in body:
+                spool.write(block)
+        except ConnectionError as e:
+            spool.close()
+            print(f"Upload aborted: {e}", flush=True)
+            self.close_connection = True
+            return
+        size = _spooled_size(spool)
+        headers = {**headers, "Content-Length": str(size)}
+        spool_lock = threading.Lock()
+
+        backends = iter(self.server.backends)
+        results = queue.Queue()
+        running = []
+        started = []
+        last = None
+        winner = None
+        hedge_at = None
+
+        def start_next(hedge):
+            # Next backend whose circuit lets a request through
+            for backend in backends:
+                if backend.acquire():
+                    attempt = Attempt(backend)
+                    running.append(attempt)
+                    started.append(attempt)
+                    if hedge:
+                        with backend.lock:
+                            backend.hedges += 1
+                    print(f"Proxying request to {backend.name}" + (" (hedge)" if hedge else ""), flush=True)
+                    threading.Thread(target=_run_attempt, daemon=True,
+                                     args=(attempt, headers, _replay(spool, spool_lock), size, results)).start()
+                    return backend.hedge_delay(size)
+            return None
+
+        try:
+            delay = start_next(hedge=False)
+            hedge_at = time.monotonic() + delay if delay is not None else None
+            while running:
+                now = time.monotonic()
+                wake = min([a.deadline for a in running] + ([hedge_at] if hedge_at else []))
+                try:
+                    attempt, failed, outcome = results.get(timeout=max(0.0, wake - now))
+                except queue.Empty:
+                    now = time.monotonic()
+                    for attempt in [a for a in running if a.deadline <= now]:
+                        print(f"{attempt.backend.name} timed out after {attempt.backend.timeout_s:g}s", flush=True)
+                        attempt.cancel("timeout")
+                        running.remove(attempt)
+                        last = last or (504, "application/json", json.dumps(
+                            {"error": f"Upstream timeout after {attempt.backend.timeout_s:g}s"}).encode())
+                    if (hedge_at and now >= hedge_at) or not running:
+                        delay = start_next(hedge=bool(running))
+                        hedge_at = now + delay if delay is not None else None
+                    continue
+
+                if attempt not in running:
+                    continue  # already given up on
+                running.remove(attempt)
+                if not failed:
+                    winner = (attempt, outcome)
+                    break
+                last = outcome
+                print(f"{attempt.backend.name} failed with {outcome[0]}, trying the next backend", flush=True)
+                # Fail over without waiting for the hedge delay
+                delay = start_next(hedge=bool(running))
+                hedge_at = time.monotonic() + delay if delay is not None else None
+        finally:
+            for attempt in running:
+                attempt.cancel("lost")
+            # A cancelled attempt still reading the upload fails on the closed spool and is dropped
+            with spool_lock:
+                spool.close()
+
+        if winner:
+            attempt, (status, content_type, data) = winner
+            if len(started) > 1:
+                with attempt.backend.lock:
+                    attempt.backend.wins += 1
+            if status >= 400:
+                # A final client error (bad token, bad request) from the backend
+                self.send_error_body(status, data)
+                return
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
             self.end_headers()
-            error_response = {"error": str(e)}
-            self.wfile.write(json.dumps(error_response).encode())
+            self.wfile.write(data)
+        elif last:
+            self.send_error_body(last[0], last[2])
+        else:
+            self.send_json(503, {"error": "Alla backends är tillfälligt avstängda, försök igen om en stund"})
 
-print(f"Starting server at http://localhost:{PORT}")
-print(f"Proxy endpoint: http://localhost:{PORT}/api/transcribe")
+    def relay_response(self, response):
+        # Stream the upstream body through without buffering it
+        self.send_response(response.status)
+        self.send_header('Content-Type', response.getheader('Content-Type', 'application/json'))
+        length = response.getheader('Content-Length')
+        if length is not None:
+            self.send_header('Content-Length', length)
+        else:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
 
-# Ensure we are in the script's directory
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+        while True:
+            block = response.read(CHUNK_SIZE)
+            if not block:
+                break
+            if length is not None:
+                self.wfile.write(block)
+            else:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(block), block))
+        if length is None:
+            self.wfile.write(b"0\r\n\r\n")
 
-with socketserver.TCPServer(("", PORT), ProxyHTTPRequestHandler) as httpd:
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        print("\nServer stopped.")
+    def relay_error(self, response):
+        # Error bodies are small; read them whole so they can be checked for JSON
+        self.send_error_body(response.status, response.read())
+
+    def send_error_body(self, status, error_body):
+        try:
+            # If it parses, it's safe to send as is
+            json.loads(error_body)
+        except ValueError:
+            # If not JSON (likely HTML), wrap it so client doesn't crash on .json()
+            self.send_json(status, {
+                "error": f"Upstream API Error {status}",
+                "details": error_body.decode('utf-8', errors='replace')[:500] # Truncate to avoid huge HTML
+            })
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(error_body)))
+        self.end_headers()
+        self.wfile.write(error_body)
+
+def make_server(port=PORT, target_url=None, directory=None, transcode=TRANSCODE,
+                transcode_format=TRANSCODE_FORMAT, target_urls=None, timeouts=BACKEND_TIMEOUTS_S):
+    """
+    Threaded proxy + static file server. Each connection gets its own
+    thread, so a slow transcription no longer blocks other users.
+    `target_url` is a single backend; `target_urls` a list to hedge across.
+    """
+    def handler(*args, **kwargs):
+        return ProxyHTTPRequestHandler(*args, directory=directory, **kwargs)
+
+    httpd = http.server.ThreadingHTTPServer(("", port), handler)
+    httpd.daemon_threads = True
+    urls = [target_url] if target_url else (target_urls or TARGET_URLS)
+    httpd.backends = make_backends(urls, timeouts)
+    # A single remote backend keeps the streaming path (no spooling, no hedging)
+    single = len(urls) == 1 and urls[0] != LOCAL_BACKEND
+    httpd.upstream = httpd.backends[0].pool if single else None
+    if transcode and imageio_ffmpeg is None:
+        print("imageio_ffmpeg not installed, uploads are forwarded without transcoding", flush=True)
+        transcode = False
+    httpd.transcode = transcode
+    httpd.transcode_format = transcode_format
+    return httpd
+
+def main():
+    print(f"Starting server at http://localhost:{PORT}")
+    print(f"Proxy endpoint: http://localhost:{PORT}/api/transcribe")
+    print(f"Metrics: http://localhost:{PORT}/api/metrics")
+    print(f"Backends: {', '.join(TARGET_URLS)}")
+
+    # Serve the static files next to this script
+    with make_server(directory=os.path.dirname(os.path.abspath(__file__))) as httpd:
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\nServer stopped.")
+
+if __name__ == "__main__":
+    main()
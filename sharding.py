@@ -0,0 +1,121 @@
+"""
+Sharded Whisper transcription of very long recordings.
+
+The decoded waveform is placed in shared memory once and split into
+overlapping shards of `shard_s` seconds. Worker processes (each with its
+own Whisper pipeline and a slice of the cores) transcribe the shards in
+parallel, and merge.stitch_shards joins their chunks back into one
+timeline, splitting every overlap at its midpoint.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+from merge import shift_chunks, stitch_shards
+
+def shard_bounds(duration_s, shard_s, overlap_s, min_last_s=0.0):
+    """
+    Split [0, duration_s) into shards of shard_s seconds that each extend
+    overlap_s into the next one. Returns (start, end, keep_from, keep_to)
+    per shard; the keep ranges tile the recording without gaps. A last
+    shard shorter than min_last_s is merged into the one before it.
+    """
+    bounds = []
+    start = 0.0
+    while True:
+        end = min(duration_s, start + shard_s + overlap_s)
+        if duration_s - (start + shard_s) < min_last_s:
+            end = duration_s
+        last = end >= duration_s
+        keep_from = 0.0 if not bounds else bounds[-1][3]
+        keep_to = float("inf") if last else start + shard_s + overlap_s / 2
+        bounds.append((start, end, keep_from, keep_to))
+        if last:
+            return bounds
+        start += shard_s
+
+def _worker_init(num_threads):
+    # Runs once per worker: Whisper only, with this worker's share of the cores
+    os.environ["TORCH_THREADS"] = str(num_threads)
+    os.environ["ASR_WORKERS"] = "1"
+    # Shards are never sharded again
+    os.environ["SHARD_WORKERS"] = "0"
+    import transcriber
+    transcriber.load_models(diarization=False)
+
+def _transcribe_shard(shm_name, num_samples, start_s, end_s):
+    import transcriber
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        waveform = np.ndarray((num_samples,), dtype=np.float32, buffer=shm.buf)
+        shard = waveform[int(start_s * SAMPLE_RATE):int(end_s * SAMPLE_RATE)]
+        result = transcriber.run_asr(shard)
+        # run_asr returns plain dicts, so nothing refers to the buffer after this
+        del waveform, shard
+    finally:
+        shm.close()
+
+    chunks = result.get("chunks", [])
+    # A chunk left open at the shard's end closes with the shard
+    if chunks and chunks[-1]["timestamp"][1] is None:
+        chunks[-1]["timestamp"] = (chunks[-1]["timestamp"][0], end_s - start_s)
+    return shift_chunks(chunks, start_s)
+
+class ShardedASR:
+    """
+    Lazily started pool of `num_workers` Whisper processes. transcribe()
+    returns the same {"text", "chunks"} shape as transcriber.run_asr.
+    """
+
+    def __init__(self, num_workers, threads_per_worker):
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker
+        self.executor = None
+
+    def _get_executor(self):
+        if self.executor is None:
+            print(f"Starting {self.num_workers} shard worker(s), {self.threads_per_worker} threads each", flush=True)
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(self.threads_per_worker,),
+            )
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def transcribe(self, waveform, shard_s, overlap_s):
+        duration_s = len(waveform) / SAMPLE_RATE
+        bounds = shard_bounds(duration_s, shard_s, overlap_s)
+        print(f"Sharding {duration_s:.0f}s into {len(bounds)} shards over {self.num_workers} workers", flush=True)
+
+        # One copy into shared memory; the workers only map it
+        shm = shared_memory.SharedMemory(create=True, size=max(1, waveform.nbytes))
+        try:
+            np.ndarray(waveform.shape, dtype=np.float32, buffer=shm.buf)[:] = waveform
+            try:
+                executor = self._get_executor()
+                futures = [executor.submit(_transcribe_shard, shm.name, len(waveform), start, end)
+                           for start, end, _, _ in bounds]
+                shard_chunks = [future.result() for future in futures]
+            except BrokenProcessPool:
+                # A crashed worker breaks the pool; the next request gets a fresh one
+                self.executor = None
+                raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+        chunks = stitch_shards([(keep_from, keep_to, chunks)
+                                for (_, _, keep_from, keep_to), chunks in zip(bounds, shard_chunks)])
+        return {"text": "".join(chunk["text"] for chunk in chunks), "chunks": chunks}
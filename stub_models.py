@@ -0,0 +1,87 @@
+"""
+Deterministic stand-ins for the Whisper and pyannote pipelines.
+
+They take the same inputs and return the same shapes as the real pipelines
+but only sleep for a configurable fraction of the audio duration, so the
+rest of the service (decode, VAD, merge, queueing, HTTP) can be benchmarked
+and load tested without downloading or running any model.
+"""
+import itertools
+import time
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+
+class StubASRPipeline:
+    """
+    Mimics transformers' ASR pipeline: array (or list of arrays) in,
+    {"text", "chunks": [{"timestamp": (start, end), "text"}]} out.
+    `rtf` is the simulated real-time factor (seconds per audio second);
+    `word` tells the output of different stub models apart.
+    """
+
+    def __init__(self, rtf=0.05, chunk_s=4.0, overhead_s=0.0, word="ord"):
+        self.rtf = rtf
+        self.chunk_s = chunk_s
+        self.overhead_s = overhead_s
+        self.word = word
+
+    def _transcribe(self, waveform):
+        duration = len(waveform) / SAMPLE_RATE
+        chunks = []
+        start = 0.0
+        while start < duration:
+            end = min(duration, start + self.chunk_s)
+            chunks.append({"timestamp": (round(start, 2), round(end, 2)), "text": f" {self.word}{len(chunks)}"})
+            start = end
+        return {"text": "".join(c["text"] for c in chunks), "chunks": chunks}
+
+    def __call__(self, inputs, **kwargs):
+        waveforms = inputs if isinstance(inputs, list) else [inputs]
+        audio_s = sum(len(w) for w in waveforms) / SAMPLE_RATE
+        time.sleep(self.overhead_s + self.rtf * audio_s)
+        results = [self._transcribe(w) for w in waveforms]
+        return results if isinstance(inputs, list) else results[0]
+
+class StubDiarizationPipeline:
+    """
+    Mimics pyannote's diarization pipeline on an in-memory waveform dict.
+    Returns a list of (start, end, speaker) turns that rotate between
+    `num_speakers` speakers every `turn_s` seconds. With
+    return_embeddings=True it also returns one embedding per speaker
+    (sorted labels), fixed per speaker so windows can be linked. The
+    noise on it is seeded by the speaker and the call number, so a run
+    is reproducible.
+    """
+
+    def __init__(self, rtf=0.03, num_speakers=3, turn_s=7.0, overhead_s=0.0):
+        self.rtf = rtf
+        self.num_speakers = num_speakers
+        self.turn_s = turn_s
+        self.overhead_s = overhead_s
+        self.calls = itertools.count()
+
+    def __call__(self, file, **kwargs):
+        waveform = np.asarray(file["waveform"])
+        duration = waveform.shape[-1] / file["sample_rate"]
+        time.sleep(self.overhead_s + self.rtf * duration)
+
+        turns = []
+        start = 0.0
+        while start < duration:
+            end = min(duration, start + self.turn_s)
+            turns.append((start, end, f"SPEAKER_{len(turns) % self.num_speakers:02d}"))
+            start = end
+        if kwargs.get("return_embeddings"):
+            labels = sorted({speaker for _, _, speaker in turns})
+            call = next(self.calls)
+            embeddings = np.stack([self._embedding(label, call) for label in labels]) if labels else np.zeros((0, 192))
+            return turns, embeddings
+        return turns
+
+    def _embedding(self, label, call):
+        # Same speaker, same direction; a little noise like a real embedding
+        speaker = int(label.split("_")[-1])
+        base = np.random.default_rng(speaker).standard_normal(192)
+        return base + 0.2 * np.random.default_rng([speaker, call]).standard_normal(192)
@@ -0,0 +1,224 @@
+"""
+Offline batch transcription without the web server.
+
+Transcribes files and directories with a pool of worker processes, each
+loading the models once and running transcriber.transcribe_audio on one
+file at a time. Every finished file is appended to transcripts.jsonl and
+written as .srt/.vtt next to it in the output directory, and then
+recorded in manifest.jsonl. A rerun with the same output directory skips
+files the manifest lists as done (same path, size and mtime), so an
+interrupted overnight run picks up where it stopped. Failed files are
+retried on the next run. Output files keep the source extension
+(talk.mp3 -> talk.mp3.srt), and a file transcribed again replaces its
+earlier line in both JSONL files.
+
+At the end the throughput is reported as audio hours per wall-clock hour.
+
+Usage: python transcribe_cli.py INPUT [INPUT ...] [--out-dir transcripts] [--workers 2]
+       [--formats srt vtt] [--stub]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".webm", ".mp4", ".aac", ".wma")
+
+def _worker_init(num_threads):
+    # Runs once in every worker process. The pool already runs files in
+    # parallel, so each worker keeps its share of the cores and does not
+    # shard long files across processes of its own.
+    os.environ["TORCH_THREADS"] = str(max(1, num_threads // 2))
+    os.environ["ASR_WORKERS"] = os.environ["DIARIZATION_WORKERS"] = "1"
+    os.environ["SHARD_WORKERS"] = "0"
+    os.environ["ATTACH_METRICS"] = "1"
+    import transcriber
+    transcriber.load_models()
+    if transcriber.pipe is None:
+        raise RuntimeError(f"Models failed to load: {transcriber.model_status.get('error')}")
+
+def _worker_transcribe(path):
+    import transcriber
+    t0 = time.perf_counter()
+    result = transcriber.transcribe_audio(path)
+    return result, time.perf_counter() - t0
+
+def find_audio_files(inputs):
+    # Files as given, directories searched recursively; sorted and deduplicated
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                files.update(os.path.join(root, n) for n in names if n.lower().endswith(AUDIO_EXTENSIONS))
+        elif os.path.isfile(item):
+            files.add(item)
+        else:
+            print(f"Skipping {item}: no such file or directory", flush=True)
+    return sorted(os.path.abspath(f) for f in files)
+
+def file_id(path):
+    # A file counts as already done while its size and mtime are unchanged
+    st = os.stat(path)
+    return {"path": path, "size": st.st_size, "mtime": int(st.st_mtime)}
+
+def load_manifest(path):
+    # Latest entry per file. A line cut off by a crash is ignored.
+    entries = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entries[entry["path"]] = entry
+    return entries
+
+def is_done(entry, fid):
+    return (entry is not None and entry.get("status") == "done"
+            and entry.get("size") == fid["size"] and entry.get("mtime") == fid["mtime"])
+
+def append_line(f, record):
+    # One complete line per record, on disk before the next one is written
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+def output_name(path, files_root):
+    # Relative path below the common input root, flattened to one file name;
+    # the extension stays, so talk.wav and talk.mp3 do not share outputs
+    rel = os.path.relpath(path, files_root) if files_root else os.path.basename(path)
+    return rel.replace(os.sep, "__")
+
+def compact_jsonl(path, key):
+    # Keep only the last line per `key`, so a file transcribed again does
+    # not leave its old line behind; rewritten in place atomically
+    if not os.path.exists(path):
+        return
+    last = {}
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            try:
+                last[json.loads(line)[key]] = i
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    keep = set(last.values())
+    tmp_path = path + ".tmp"
+    with open(path, encoding="utf-8") as f, open(tmp_path, "w", encoding="utf-8") as out:
+        for i, line in enumerate(f):
+            if i in keep:
+                out.write(line)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+
+def audio_duration(result):
+    # From the request metrics; a cache hit has none, so fall back to the last segment
+    duration = result.get("metrics", {}).get("audio_s")
+    if duration is None:
+        duration = max((seg["end"] for seg in result.get("segments", [])), default=0.0)
+    return duration
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Audio files and/or directories")
+    parser.add_argument("--out-dir", default="transcripts")
+    parser.add_argument("--workers", type=int, default=max(1, cpu_count // 4),
+                        help="Worker processes; the cores are split between them")
+    parser.add_argument("--formats", nargs="*", default=["srt", "vtt"], choices=["srt", "vtt"],
+                        help="Subtitle files to write per recording")
+    parser.add_argument("--stub", action="store_true", help="Use the deterministic stub models")
+    args = parser.parse_args()
+
+    if args.stub:
+        # Inherited by the spawned workers
+        os.environ["STUB_MODELS"] = "1"
+    from merge import to_srt, to_vtt
+    writers = {"srt": to_srt, "vtt": to_vtt}
+
+    files = find_audio_files(args.inputs)
+    files_root = os.path.commonpath([os.path.dirname(f) for f in files]) if files else None
+    names = {}
+    for path in files:
+        names.setdefault(output_name(path, files_root), []).append(path)
+    clashes = [paths for paths in names.values() if len(paths) > 1]
+    if clashes:
+        raise SystemExit("These files would write the same output files:\n"
+                         + "\n".join("  " + ", ".join(paths) for paths in clashes))
+    os.makedirs(args.out_dir, exist_ok=True)
+    manifest_path = os.path.join(args.out_dir, "manifest.jsonl")
+    transcripts_path = os.path.join(args.out_dir, "transcripts.jsonl")
+    manifest = load_manifest(manifest_path)
+
+    todo = []
+    for path in files:
+        fid = file_id(path)
+        if not is_done(manifest.get(path), fid):
+            todo.append(fid)
+    print(f"{len(files)} file(s), {len(files) - len(todo)} already done, {len(todo)} to transcribe", flush=True)
+    if not todo:
+        return
+
+    num_workers = max(1, min(args.workers, len(todo)))
+    threads = max(1, cpu_count // num_workers)
+    print(f"Starting {num_workers} worker(s), {threads} threads each", flush=True)
+
+    done = failed = 0
+    audio_s = 0.0
+    t0 = time.perf_counter()
+    try:
+        with open(manifest_path, "a", encoding="utf-8") as manifest_file, \
+                open(transcripts_path, "a", encoding="utf-8") as transcripts_file, \
+                ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_worker_init, initargs=(threads,)) as executor:
+            futures = {executor.submit(_worker_transcribe, fid["path"]): fid for fid in todo}
+            try:
+                for future in as_completed(futures):
+                    fid = futures[future]
+                    entry = dict(fid)
+                    try:
+                        result, wall_s = future.result()
+                    except Exception as e:
+                        result, wall_s = {"error": f"{type(e).__name__}: {e}"}, None
+
+                    if "error" in result:
+                        failed += 1
+                        entry.update(status="failed", error=result["error"])
+                        print(f"[{done + failed}/{len(todo)}] FAILED {fid['path']}: {result['error']}", flush=True)
+                    else:
+                        duration = audio_duration(result)
+                        name = output_name(fid["path"], files_root)
+                        for fmt in args.formats:
+                            with open(os.path.join(args.out_dir, f"{name}.{fmt}"), "w", encoding="utf-8") as f:
+                                f.write(writers[fmt](result))
+                        record = {"file": fid["path"], "audio_s": round(duration, 2),
+                                  **{k: v for k, v in result.items() if k != "metrics"}}
+                        append_line(transcripts_file, record)
+
+                        done += 1
+                        audio_s += duration
+                        entry.update(status="done", output=name, audio_s=round(duration, 2), wall_s=round(wall_s, 2))
+                        print(f"[{done + failed}/{len(todo)}] {fid['path']}: {duration:.0f}s audio in {wall_s:.1f}s", flush=True)
+                    # Recorded last, so a file is only skipped once its outputs exist
+                    append_line(manifest_file, entry)
+            except KeyboardInterrupt:
+                print("Interrupted; finished files are in the manifest, rerun to resume", flush=True)
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        # Also after an interrupt: a file transcribed again replaces its old lines
+        compact_jsonl(transcripts_path, "file")
+        compact_jsonl(manifest_path, "path")
+
+    wall_s = time.perf_counter() - t0
+    print(f"Done: {done} transcribed, {failed} failed, {audio_s / 3600:.2f} h audio in {wall_s / 3600:.2f} h "
+          f"({audio_s / wall_s:.1f} audio hours per hour)", flush=True)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
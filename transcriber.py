@@ -0,0 +1,854 @@
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from asr_backends import build_asr_pipeline
+from audio import SAMPLE_RATE, diarization_input, load_audio, speech_regions
+from live import LiveSession
+from merge import (MERGE_VERSION, compact_result, extract_turns, merge_transcription, segment_range,
+                   shift_chunks, stitch_shards)
+from metrics import REGISTRY, RequestMetrics
+from model_names import DIARIZATION_MODEL, MODEL_NAME, REFINE_MODEL_NAME
+from model_store import ModelStore, use_offline_hub
+from refine import REFINE_VERSION, low_confidence, refine_segments, score_segments
+from result_cache import ResultCache
+from sharding import ShardedASR, shard_bounds
+from windowed_diarization import diarize_windowed
+
+# Force CPU for stability on free tier
+device = "cpu" 
+# Whisper inference backend: fp32, sdpa, int8 or onnx (see asr_backends.py)
+ASR_BACKEND = os.environ.get("ASR_BACKEND", "fp32")
+
+# Whisper and diarization run side by side on their own executors
+# (asr_executor, diarization_executor), ASR_WORKERS / DIARIZATION_WORKERS
+# passes at a time. torch's intra-op thread count is process-wide, so it is
+# set once in load_models(); by default the cores are split so that every
+# pass that can run at once gets TORCH_THREADS of them. More workers let
+# concurrent requests (and stream windows) run instead of queueing behind a
+# long upload, but give each pass fewer threads, so a lone request gets
+# slower; one worker per stage gives a single request half the machine.
+CPU_COUNT = os.cpu_count() or 1
+ASR_WORKERS = int(os.environ.get("ASR_WORKERS", max(1, CPU_COUNT // 4)))
+DIARIZATION_WORKERS = int(os.environ.get("DIARIZATION_WORKERS", ASR_WORKERS))
+TORCH_THREADS = int(os.environ.get("TORCH_THREADS", max(1, CPU_COUNT // (ASR_WORKERS + DIARIZATION_WORKERS))))
+# Number of 30 s windows decoded per Whisper forward pass (also across files in /transcribe_batch)
+ASR_BATCH_SIZE = int(os.environ.get("ASR_BATCH_SIZE", 4))
+# Skip silence: only speech regions found by the VAD in audio.py go to Whisper.
+# Off by default until the energy VAD's effect on WER has been measured on
+# real recordings: a clipped quiet word costs more than the silence saves.
+VAD_ENABLED = os.environ.get("VAD_ENABLED", "0") == "1"
+# Settings of audio.speech_regions: pauses shorter than VAD_MIN_SILENCE_S are
+# bridged and every region is padded by VAD_PAD_S
+VAD_PARAMS = {"frame_s": 0.03, "margin_db": 12.0, "floor_db": -60.0, "min_speech_s": 0.25,
+              "min_silence_s": float(os.environ.get("VAD_MIN_SILENCE_S", 1.0)),
+              "pad_s": float(os.environ.get("VAD_PAD_S", 0.2))}
+# Recordings longer than LONG_FILE_S are cut into overlapping shards that
+# SHARD_WORKERS processes transcribe in parallel (see sharding.py). Off by
+# default (0): every worker holds its own copy of Whisper, so turn it on
+# only with the memory for it. Child processes (job, shard and CLI
+# workers) never shard, so the pools cannot nest.
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", 0))
+SHARDING = SHARD_WORKERS > 1 and multiprocessing.parent_process() is None
+SHARD_S = float(os.environ.get("SHARD_S", 600))
+SHARD_OVERLAP_S = float(os.environ.get("SHARD_OVERLAP_S", 30))
+LONG_FILE_S = float(os.environ.get("LONG_FILE_S", 1800))
+# Recordings longer than DIARIZATION_WINDOW_S are diarized window by window
+# with bounded memory and the speakers re-linked by embedding (see
+# windowed_diarization.py); 0 turns this off. DIARIZATION_LINK_THRESHOLD is
+# the cosine distance below which two window speakers are the same person.
+DIARIZATION_WINDOW_S = float(os.environ.get("DIARIZATION_WINDOW_S", 900))
+DIARIZATION_LINK_THRESHOLD = float(os.environ.get("DIARIZATION_LINK_THRESHOLD", 0.7))
+# Windows overlap by DIARIZATION_WINDOW_OVERLAP_S; a last window shorter than
+# DIARIZATION_MIN_LAST_WINDOW_S is merged into the one before it
+DIARIZATION_WINDOW_OVERLAP_S = float(os.environ.get("DIARIZATION_WINDOW_OVERLAP_S", 30))
+DIARIZATION_MIN_LAST_WINDOW_S = float(os.environ.get("DIARIZATION_MIN_LAST_WINDOW_S", 60))
+# Window size for /transcribe_stream: one partial result per window.
+# Consecutive windows overlap by STREAM_OVERLAP_S so no word is cut off at a
+# boundary; the overlap is split at its midpoint like the shards.
+STREAM_WINDOW_S = 30
+STREAM_OVERLAP_S = float(os.environ.get("STREAM_OVERLAP_S", 5))
+# Two-tier mode (/transcribe_refine): segments of the draft below these
+# confidence thresholds are re-transcribed with REFINE_MODEL_NAME, which is
+# only loaded on first use. REFINE_METHOD is "compression" (text only, no
+# model pass) or "logprob" (teacher-forced scoring with the small model:
+# one extra 30 s forward pass per segment, so opt-in).
+REFINE_METHOD = os.environ.get("REFINE_METHOD", "compression")
+# Refined results are kept this long for get_refined
+REFINE_RESULT_TTL_S = 3600
+REFINE_MIN_LOGPROB = float(os.environ.get("REFINE_MIN_LOGPROB", -1.0))
+REFINE_MAX_COMPRESSION = float(os.environ.get("REFINE_MAX_COMPRESSION", 2.4))
+# Live microphone mode (see live.py): audio kept per session, longest
+# Whisper window, new audio between passes, target for a Whisper pass and
+# how often the buffered audio is re-diarized
+LIVE_BUFFER_S = float(os.environ.get("LIVE_BUFFER_S", 300))
+LIVE_WINDOW_S = float(os.environ.get("LIVE_WINDOW_S", 15))
+LIVE_STEP_S = float(os.environ.get("LIVE_STEP_S", 0.5))
+LIVE_LATENCY_TARGET_S = float(os.environ.get("LIVE_LATENCY_TARGET_S", 2.0))
+LIVE_DIARIZATION_EVERY_S = float(os.environ.get("LIVE_DIARIZATION_EVERY_S", 30))
+# Finished live segments kept in memory and sent with each update; older
+# ones wait in a temporary file until the session ends
+LIVE_MAX_SEGMENTS = int(os.environ.get("LIVE_MAX_SEGMENTS", 500))
+# Default page size of /segments
+SEGMENT_PAGE_SIZE = 200
+# Load the models from a local store written by `python model_store.py
+# materialize` instead of the Hugging Face Hub: offline, no HF_TOKEN, and
+# the weights are memory-mapped so processes on one host share them.
+# MODEL_STORE_VERSION pins a version (default: the store's CURRENT).
+MODEL_STORE = os.environ.get("MODEL_STORE", "")
+if MODEL_STORE:
+    use_offline_hub()
+# Deterministic stand-ins instead of the real models (benchmarks and load tests)
+STUB_MODELS = os.environ.get("STUB_MODELS") == "1"
+STUB_ASR_RTF = float(os.environ.get("STUB_ASR_RTF", 0.05))
+STUB_DIARIZATION_RTF = float(os.environ.get("STUB_DIARIZATION_RTF", 0.03))
+# Attach the per-request metrics (stage times, RTF, peak RSS) to the returned JSON
+ATTACH_METRICS = os.environ.get("ATTACH_METRICS") == "1"
+# How long a request waits for the models before getting a "warming up" answer
+MODEL_WAIT_S = float(os.environ.get("MODEL_WAIT_S", 30))
+
+# Result cache (set CACHE_DIR="" to disable)
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "svensk-transkribering"))
+CACHE_MAX_MB = int(os.environ.get("CACHE_MAX_MB", 2048))
+result_cache = ResultCache(CACHE_DIR, CACHE_MAX_MB * 1024 * 1024) if CACHE_DIR else None
+
+# Everything that changes a stage's output goes into its cache key. The
+# stubs and the model store version count as part of the model; settings
+# only known after loading are filled in by _set_cache_param().
+ASR_PARAMS = {"model": MODEL_NAME, "backend": ASR_BACKEND, "stub": STUB_MODELS, "model_store": None,
+              "chunk_length_s": 30, "batch_size": ASR_BATCH_SIZE, "return_timestamps": True,
+              "vad": VAD_PARAMS if VAD_ENABLED else None,
+              "shards": {"shard_s": SHARD_S, "overlap_s": SHARD_OVERLAP_S, "long_file_s": LONG_FILE_S}
+              if SHARDING else None}
+DIARIZATION_PARAMS = {"pipeline": DIARIZATION_MODEL, "stub": STUB_MODELS, "model_store": None,
+                      "window_s": DIARIZATION_WINDOW_S, "link_threshold": DIARIZATION_LINK_THRESHOLD,
+                      "window_overlap_s": DIARIZATION_WINDOW_OVERLAP_S, "min_last_window_s": DIARIZATION_MIN_LAST_WINDOW_S}
+RESULT_PARAMS = {**ASR_PARAMS, **DIARIZATION_PARAMS, "merge_version": MERGE_VERSION}
+STREAM_PARAMS = {**RESULT_PARAMS, "stream_window_s": STREAM_WINDOW_S, "stream_overlap_s": STREAM_OVERLAP_S}
+REFINE_PARAMS = {**RESULT_PARAMS, "refine": REFINE_VERSION, "refine_model": REFINE_MODEL_NAME, "refine_method": REFINE_METHOD,
+                 "min_logprob": REFINE_MIN_LOGPROB, "max_compression": REFINE_MAX_COMPRESSION}
+
+def _set_cache_param(name, value, asr=True, diarization=True):
+    # The merged and refined results depend on both stages
+    stages = ([ASR_PARAMS] if asr else []) + ([DIARIZATION_PARAMS] if diarization else [])
+    for params in stages + [RESULT_PARAMS, STREAM_PARAMS, REFINE_PARAMS]:
+        params[name] = value
+
+# Models are loaded by load_models(), either directly or in the background
+pipe = None
+diarization_pipe = None
+models_ready = threading.Event()
+model_status = {"state": "not_started", "components": {}}
+_loader_lock = threading.Lock()
+refine_pipe = None
+_refine_lock = threading.Lock()
+sharded_asr = None
+_sharded_lock = threading.Lock()
+# At most ASR_WORKERS / DIARIZATION_WORKERS passes per stage: further
+# requests queue here instead of oversubscribing the cores
+asr_executor = ThreadPoolExecutor(max_workers=ASR_WORKERS, thread_name_prefix="asr")
+diarization_executor = ThreadPoolExecutor(max_workers=DIARIZATION_WORKERS, thread_name_prefix="diarization")
+# Refinement runs after the draft has been returned, one draft at a time
+refine_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="refine")
+_refine_results = {}  # refine_id -> {"stage": "refining"} or the refined result
+_refine_results_lock = threading.Lock()
+
+def _timed_component(name, fn):
+    # Load one component and record how long it took
+    model_status["components"][name] = {"state": "loading"}
+    t0 = time.perf_counter()
+    try:
+        value = fn()
+    except Exception as e:
+        model_status["components"][name] = {"state": "failed", "error": str(e), "seconds": round(time.perf_counter() - t0, 2)}
+        raise
+    seconds = time.perf_counter() - t0
+    model_status["components"][name] = {"state": "ready", "seconds": round(seconds, 2)}
+    print(f"[startup] {name}: {seconds:.2f}s", flush=True)
+    return value
+
+def load_models(diarization=True):
+    """
+    Import torch/transformers/pyannote and build both pipelines
+    (Whisper only with diarization=False, as in the shard workers).
+    Safe to call more than once; only the first call loads anything.
+    """
+    global pipe, diarization_pipe
+    with _loader_lock:
+        if model_status["state"] != "not_started":
+            return
+        model_status["state"] = "loading"
+    t_start = time.perf_counter()
+
+    if STUB_MODELS:
+        from stub_models import StubASRPipeline, StubDiarizationPipeline
+        pipe = StubASRPipeline(rtf=STUB_ASR_RTF)
+        if diarization:
+            diarization_pipe = StubDiarizationPipeline(rtf=STUB_DIARIZATION_RTF)
+        model_status["asr_backend"] = "stub"
+        model_status["state"] = "ready"
+        model_status["ready_after_s"] = 0.0
+        print(f"[startup] stub models (ASR rtf={STUB_ASR_RTF}, diarization rtf={STUB_DIARIZATION_RTF})", flush=True)
+        models_ready.set()
+        return
+
+    store = None
+    try:
+        if MODEL_STORE:
+            store = _timed_component("model store", lambda: ModelStore(MODEL_STORE, os.environ.get("MODEL_STORE_VERSION")))
+            model_status["model_store"] = store.version
+            _set_cache_param("model_store", store.version)
+            # Worker processes started later load this same version even if CURRENT moves
+            os.environ["MODEL_STORE_VERSION"] = store.version
+            print(f"Loading models from store {store.path}", flush=True)
+
+        torch = _timed_component("import torch", lambda: __import__("torch"))
+        torch.set_num_threads(TORCH_THREADS)
+        _timed_component("import transformers", lambda: __import__("transformers"))
+
+        # Initialize Whisper model
+        print(f"Loading Whisper model ({ASR_BACKEND})...", flush=True)
+        backend = ASR_BACKEND
+        build = store.whisper if store else build_asr_pipeline
+        try:
+            pipe = _timed_component("whisper", lambda: build(MODEL_NAME, backend, device))
+        except Exception as e:
+            if backend == "fp32":
+                raise
+            # An optimized backend that fails to build must not take the service down
+            print(f"ASR backend '{backend}' failed ({e}), falling back to fp32", flush=True)
+            backend = "fp32"
+            _set_cache_param("backend", backend, diarization=False)
+            pipe = _timed_component("whisper", lambda: build(MODEL_NAME, backend, device))
+        model_status["asr_backend"] = backend
+        print(f"Whisper loaded on {device} ({backend})", flush=True)
+    except Exception as e:
+        print(f"Failed to load Whisper: {e}", flush=True)
+        model_status["state"] = "failed"
+        model_status["error"] = str(e)
+        models_ready.set()
+        return
+
+    # Initialize Diarization Pipeline
+    if diarization:
+        print("Loading Diarization pipeline...", flush=True)
+        auth_token = os.environ.get("HF_TOKEN")
+        try:
+            pyannote_audio = _timed_component("import pyannote.audio", lambda: __import__("pyannote.audio", fromlist=["Pipeline"]))
+            if store:
+                loaded = _timed_component("diarization", lambda: store.diarization(DIARIZATION_MODEL))
+            else:
+                loaded = _timed_component("diarization", lambda: pyannote_audio.Pipeline.from_pretrained(
+                    DIARIZATION_MODEL,
+                    use_auth_token=auth_token
+                ))
+            if loaded:
+                # Move to device (CPU)
+                loaded.to(torch.device(device))
+                diarization_pipe = loaded
+                print("Diarization loaded successfully.", flush=True)
+            else:
+                print("Diarization likely failed to load (None returned). Check HF_TOKEN capabilities.", flush=True)
+        except Exception as e:
+            print(f"Failed to load Diarization: {e}. Check if you accepted terms for '{DIARIZATION_MODEL}' on HF.", flush=True)
+            diarization_pipe = None
+
+    # Warm up: the first forward pass allocates buffers and picks kernels
+    try:
+        _timed_component("warmup", lambda: pipe(np.zeros(SAMPLE_RATE, dtype=np.float32), return_timestamps=True))
+    except Exception as e:
+        print(f"Warmup failed: {e}", flush=True)
+
+    model_status["state"] = "ready"
+    model_status["ready_after_s"] = round(time.perf_counter() - t_start, 2)
+    print(f"[startup] models ready after {model_status['ready_after_s']:.2f}s", flush=True)
+    models_ready.set()
+
+def start_background_loading():
+    # Lets the UI/API bind its port right away while the models load
+    threading.Thread(target=load_models, name="model-loader", daemon=True).start()
+
+def get_refine_pipe():
+    # The larger model is loaded the first time a draft needs refining
+    global refine_pipe
+    with _refine_lock:
+        if refine_pipe is None:
+            if STUB_MODELS:
+                from stub_models import StubASRPipeline
+                refine_pipe = StubASRPipeline(rtf=STUB_ASR_RTF * 4, word="förfinat")
+            else:
+                print(f"Loading refine model {REFINE_MODEL_NAME}...", flush=True)
+                build = ModelStore(MODEL_STORE, model_status.get("model_store")).whisper if MODEL_STORE else build_asr_pipeline
+                refine_pipe = _timed_component("refine model", lambda: build(
+                    REFINE_MODEL_NAME, model_status.get("asr_backend", ASR_BACKEND), device))
+    return refine_pipe
+
+def get_model_status():
+    return {**model_status, "diarization_available": diarization_pipe is not None}
+
+def _model_metrics():
+    # Model load times and readiness for the /metrics endpoint
+    load_times = [({"component": name}, info["seconds"])
+                  for name, info in model_status["components"].items() if "seconds" in info]
+    ready = 1 if models_ready.is_set() and pipe is not None else 0
+    return [
+        ("transcriber_model_load_seconds", "Load time per model component", "gauge", load_times),
+        ("transcriber_models_ready", "1 once the models are loaded", "gauge", [({}, ready)]),
+    ]
+
+REGISTRY.add_collector(_model_metrics)
+
+def wait_for_models(timeout=None):
+    """
+    Block until the models are loaded (at most MODEL_WAIT_S seconds).
+    Returns None when ready, otherwise an error dict for the caller.
+    """
+    if not models_ready.wait(MODEL_WAIT_S if timeout is None else timeout):
+        return {"error": "Modellerna startar fortfarande, försök igen om en stund", "status": "warming_up"}
+    if pipe is None:
+        return {"error": f"Whisper-modellen kunde inte laddas: {model_status.get('error', 'okänt fel')}", "status": "failed"}
+    return None
+
+def submit_stage(executor, name, metrics, fn, *args, **kwargs):
+    # Run one stage on its executor; the time it waits there for a free
+    # worker is recorded as the stage "<name>_wait"
+    submitted = time.perf_counter()
+
+    def run():
+        metrics.add_wait(name, time.perf_counter() - submitted)
+        with metrics.stage(name):
+            return fn(*args, **kwargs)
+    return executor.submit(run)
+
+def run_asr(inputs):
+    # A list of waveforms returns a list of results; their 30 s chunks are
+    # packed into shared batches of ASR_BATCH_SIZE by the pipeline.
+    if not VAD_ENABLED:
+        return pipe(inputs, chunk_length_s=30, batch_size=ASR_BATCH_SIZE, return_timestamps=True)
+
+    single = not isinstance(inputs, list)
+    waveforms = [inputs] if single else inputs
+
+    # Cut every file into its speech regions (views, no copies) and
+    # transcribe all regions together so they still share batches
+    pieces = []
+    owners = []
+    for i, waveform in enumerate(waveforms):
+        for start, end in speech_regions(waveform, **VAD_PARAMS):
+            pieces.append(waveform[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)])
+            owners.append((i, start, end))
+
+    total_s = sum(len(w) for w in waveforms) / SAMPLE_RATE
+    speech_s = sum(len(p) for p in pieces) / SAMPLE_RATE
+    print(f"VAD: {speech_s:.1f}s of {total_s:.1f}s is speech ({len(pieces)} regions)", flush=True)
+
+    results = [{"text": "", "chunks": []} for _ in waveforms]
+    if pieces:
+        outputs = pipe(pieces, chunk_length_s=30, batch_size=ASR_BATCH_SIZE, return_timestamps=True)
+        for (i, start, end), output in zip(owners, outputs):
+            # Map timestamps back onto the original timeline
+            chunks = shift_chunks(output.get("chunks", []), start)
+            # An open end inside a region ends with the region, not start + 2 s
+            if chunks and chunks[-1]["timestamp"][1] is None:
+                chunks[-1]["timestamp"] = (chunks[-1]["timestamp"][0], end)
+            results[i]["chunks"].extend(chunks)
+            results[i]["text"] += output.get("text", "")
+    return results[0] if single else results
+
+def get_sharded_asr():
+    # Created with the first long recording; the workers start with it
+    global sharded_asr
+    with _sharded_lock:
+        if sharded_asr is None:
+            sharded_asr = ShardedASR(SHARD_WORKERS, max(1, TORCH_THREADS // SHARD_WORKERS))
+    return sharded_asr
+
+def run_asr_long(waveform):
+    # Long recordings are sharded across the worker processes
+    if SHARDING and len(waveform) > LONG_FILE_S * SAMPLE_RATE:
+        return get_sharded_asr().transcribe(waveform, SHARD_S, SHARD_OVERLAP_S)
+    return run_asr(waveform)
+
+def run_diarization(waveform):
+    try:
+        if DIARIZATION_WINDOW_S and len(waveform) > DIARIZATION_WINDOW_S * SAMPLE_RATE:
+            return diarize_windowed(diarization_pipe, waveform, DIARIZATION_WINDOW_S, DIARIZATION_LINK_THRESHOLD,
+                                    DIARIZATION_WINDOW_OVERLAP_S, DIARIZATION_MIN_LAST_WINDOW_S)
+        return diarization_pipe(diarization_input(waveform))
+    except Exception as e_dia:
+        print(f"Diarization failed: {e_dia}", flush=True)
+        # Continue without diarization
+        return None
+
+def run_diarization_all(waveforms):
+    return [run_diarization(waveform) for waveform in waveforms]
+
+def finish_request(metrics, result, status="ok"):
+    # Record the request and optionally attach its metrics to the JSON
+    summary = metrics.finish(status)
+    print(metrics.log_line(summary), flush=True)
+    if ATTACH_METRICS and isinstance(result, dict):
+        return {**result, "metrics": summary}
+    return result
+
+def transcribe_audio(audio_file):
+    """
+    Transcribe audio using local KBLab Whisper model + Pyannote Diarization
+    Returns JSON object for frontend processing.
+    """
+    if audio_file is None:
+        return {"error": "Ingen fil uppladdad"}
+
+    metrics = RequestMetrics("transcribe")
+    result, _, status = _transcribe(audio_file, metrics)
+    return finish_request(metrics, result, status)
+
+def _transcribe(audio_file, metrics):
+    """
+    The pipeline behind transcribe_audio. Returns (result, waveform,
+    status); waveform is the decoded audio, or None when the cache made
+    decoding unnecessary.
+    """
+    waveform = None
+    try:
+        # Look up the merged result first, then the individual stages
+        cache_key = None
+        chunks = None
+        turns = None
+        if result_cache:
+            with metrics.stage("cache"):
+                cache_key = result_cache.audio_key(audio_file)
+                cached = result_cache.get(cache_key, "result", RESULT_PARAMS)
+            if cached is not None:
+                print(f"Cache hit for {audio_file}", flush=True)
+                metrics.cache = "result"
+                return {**cached, "result_id": cache_key}, None, "ok"
+
+        # Cached results are served while warming up; anything else needs the models
+        with metrics.stage("wait_for_models"):
+            not_ready = wait_for_models()
+        if not_ready:
+            return not_ready, None, "warming_up"
+
+        if cache_key:
+            chunks = result_cache.get(cache_key, "asr", ASR_PARAMS)
+            turns = result_cache.get(cache_key, "diarization", DIARIZATION_PARAMS)
+            if chunks is not None or turns is not None:
+                metrics.cache = "stage"
+
+        need_asr = chunks is None
+        need_diarization = turns is None and diarization_pipe is not None
+
+        if need_asr or need_diarization:
+            # 0. Decode once (ffmpeg -> 16 kHz mono float32), shared by both models
+            with metrics.stage("decode"):
+                waveform = load_audio(audio_file)
+            metrics.audio_s = len(waveform) / SAMPLE_RATE
+            print(f"Decoded {audio_file}: {metrics.audio_s:.1f}s audio", flush=True)
+
+            # 1 + 2. Transcribe (Whisper) and Diarize (Pyannote) concurrently
+            with metrics.stage("asr+diarization"):
+                asr_future = None
+                if need_asr:
+                    print(f"Starting Whisper transcription for {audio_file}...", flush=True)
+                    asr_future = submit_stage(asr_executor, "asr", metrics, run_asr_long, waveform)
+
+                dia_future = None
+                if need_diarization:
+                    print("Starting Speaker Diarization...", flush=True)
+                    dia_future = submit_stage(diarization_executor, "diarization", metrics, run_diarization, waveform)
+
+                # Merge waits for both stages
+                if asr_future:
+                    whisper_result = asr_future.result()
+                    if not whisper_result.get("text", ""):
+                        return {"error": "Ingen text kunde identifieras"}, waveform, "no_text"
+                    chunks = whisper_result.get("chunks", [])
+                    if cache_key:
+                        result_cache.put(cache_key, "asr", ASR_PARAMS, chunks)
+
+                if dia_future:
+                    diarization = dia_future.result()
+                    # A failed diarization is not cached so the next upload retries it
+                    if diarization is not None:
+                        turns = extract_turns(diarization)
+                        if cache_key:
+                            result_cache.put(cache_key, "diarization", DIARIZATION_PARAMS, turns)
+
+        # 3. Merge & Return JSON
+        with metrics.stage("merge"):
+            result_json = merge_transcription(chunks, turns)
+        if cache_key and turns is not None:
+            result_cache.put(cache_key, "result", RESULT_PARAMS, result_json)
+            # Lets the client page through the stored result with get_segments
+            result_json = {**result_json, "result_id": cache_key}
+
+        return result_json, waveform, "ok"
+
+    except Exception as e:
+        print(f"Error: {e}", flush=True)
+        return {"error": str(e)}, waveform, "error"
+
+def transcribe_compact(audio_file):
+    """
+    transcribe_audio with the segments in the columnar format of
+    merge.compact_result (several times smaller for long recordings).
+    """
+    return _compact(transcribe_audio(audio_file))
+
+def _compact(result):
+    if "segments" not in result:
+        return result
+    extra = {k: v for k, v in result.items() if k not in ("segments", "unique_speakers")}
+    return {**compact_result(result), **extra}
+
+def transcribe_paged(audio_file):
+    """
+    For long recordings: the first SEGMENT_PAGE_SIZE segments, the total
+    and the result id when the result is stored in the cache; the client
+    fetches the other pages with get_segments. Without the cache the whole
+    result comes in the compact format.
+    """
+    result = transcribe_audio(audio_file)
+    if "segments" not in result or "result_id" not in result:
+        return _compact(result)
+    page = segment_range(result, 0, SEGMENT_PAGE_SIZE)
+    extra = {k: v for k, v in result.items() if k not in ("segments", "unique_speakers")}
+    return {"format": "paged", "unique_speakers": result["unique_speakers"], **page, **extra}
+
+def get_segments(result_id, start_index=0, count=SEGMENT_PAGE_SIZE, start_s=None, end_s=None):
+    """
+    A page of a stored result, by index or by time (see merge.segment_range).
+    `result_id` is the one returned with the transcription.
+    """
+    if not result_cache:
+        return {"error": "Resultatcachen är avstängd, sidhämtning stöds inte"}
+    result_id = (result_id or "").strip()
+    # The id is a SHA-256 hex digest and names a cache directory
+    if not re.fullmatch(r"[0-9a-f]{64}", result_id):
+        return {"error": "Ogiltigt resultat-id"}
+    result = result_cache.get(result_id, "result", RESULT_PARAMS)
+    if result is None:
+        return {"error": "Resultatet finns inte längre, transkribera filen igen"}
+    page = segment_range(result, start_index or 0, count, start_s, end_s)
+    return {"result_id": result_id, "unique_speakers": result["unique_speakers"], **page}
+
+def transcribe_refine(audio_file):
+    """
+    Two-tier transcription. Returns the draft from the small model right
+    away ("stage": "draft") with a "refine_id". Its low-confidence segments
+    are re-transcribed by the larger model in the background, one draft
+    at a time; get_refined(refine_id) returns the result once it is done.
+    """
+    if audio_file is None:
+        return {"error": "Ingen fil uppladdad"}
+
+    metrics = RequestMetrics("transcribe_refine")
+    cache_key = None
+    if result_cache:
+        with metrics.stage("cache"):
+            cache_key = result_cache.audio_key(audio_file)
+            cached = result_cache.get(cache_key, "refined", REFINE_PARAMS)
+        if cached is not None:
+            metrics.cache = "result"
+            return finish_request(metrics, {**cached, "result_id": cache_key, "stage": "refined"})
+
+    draft, waveform, status = _transcribe(audio_file, metrics)
+    if "segments" not in draft:
+        return finish_request(metrics, draft, status)
+
+    refine_id = uuid.uuid4().hex
+    with _refine_results_lock:
+        now = time.monotonic()
+        for old_id in [i for i, job in _refine_results.items()
+                       if job.get("finished_at") and now - job["finished_at"] > REFINE_RESULT_TTL_S]:
+            del _refine_results[old_id]
+        _refine_results[refine_id] = {"stage": "refining"}
+    # The draft's waveform is handed over, so the audio is decoded only once
+    refine_executor.submit(_refine, refine_id, audio_file, waveform, draft, cache_key)
+    return finish_request(metrics, {**draft, "stage": "draft", "refine_id": refine_id})
+
+def _refine(refine_id, audio_file, waveform, draft, cache_key):
+    # Runs on refine_executor, after the draft has been returned
+    metrics = RequestMetrics("refine")
+    try:
+        if waveform is None:
+            # The draft came from the cache without decoding anything
+            with metrics.stage("decode"):
+                waveform = load_audio(audio_file)
+        metrics.audio_s = len(waveform) / SAMPLE_RATE
+
+        # Log-prob scoring needs the real model; the stubs only have text
+        method = REFINE_METHOD if hasattr(pipe, "model") else "compression"
+        with metrics.stage("score"):
+            try:
+                scores = score_segments(pipe, waveform, draft["segments"], method)
+            except Exception as e:
+                # e.g. a backend without a teacher-forcing forward pass
+                print(f"Log-prob scoring failed ({e}), using compression ratio", flush=True)
+                scores = score_segments(pipe, waveform, draft["segments"], "compression")
+        indices = [i for i, score in enumerate(scores)
+                   if low_confidence(score, REFINE_MIN_LOGPROB, REFINE_MAX_COMPRESSION)]
+        print(f"Refining {len(indices)} of {len(scores)} segments with {REFINE_MODEL_NAME}", flush=True)
+
+        # Only the transcript itself is cached, not the draft's id or metrics
+        base = {"segments": draft["segments"], "unique_speakers": draft["unique_speakers"]}
+        with metrics.stage("refine"):
+            refined = refine_segments(get_refine_pipe() if indices else None, waveform, base, indices, ASR_BATCH_SIZE)
+        refined["refined_segments"] = len(indices)
+        for segment, score in zip(refined["segments"], scores):
+            segment["confidence"] = score
+        if cache_key:
+            result_cache.put(cache_key, "refined", REFINE_PARAMS, refined)
+            refined["result_id"] = cache_key
+        result = finish_request(metrics, {**refined, "stage": "refined"})
+    except Exception as e:
+        print(f"Error: {e}", flush=True)
+        result = finish_request(metrics, {"error": str(e), "stage": "refined"}, "error")
+
+    with _refine_results_lock:
+        if refine_id in _refine_results:
+            _refine_results[refine_id] = {**result, "finished_at": time.monotonic()}
+
+def get_refined(refine_id):
+    """
+    The refined result for a refine_id from transcribe_refine:
+    {"stage": "refining"} while it is being worked on.
+    """
+    with _refine_results_lock:
+        result = _refine_results.get((refine_id or "").strip())
+    if result is None:
+        return {"error": "Okänt eller utgånget förfinings-id"}
+    return {k: v for k, v in result.items() if k != "finished_at"}
+
+def _first_text(metrics):
+    # Time to the first message that shows the user any text; recorded once
+    if "first_text" not in metrics.stages:
+        metrics.record("first_text", metrics.elapsed())
+        print(f"First text after {metrics.elapsed():.2f}s", flush=True)
+
+def transcribe_stream(audio_file):
+    """
+    Streaming variant of transcribe_audio. After every STREAM_WINDOW_S
+    seconds of audio it yields the segments added since the previous
+    message, with "start_index" giving their position in the transcript.
+    Once diarization (running in the background) has finished, the next
+    message resends everything from index 0 with speaker labels. The last
+    message ("done") holds the complete result.
+
+    Whisper sees the audio in different 30 s windows than transcribe_audio
+    does (overlapping, stitched at their midpoints), so segment boundaries
+    and counts can differ slightly for the same file; verify_stream.py
+    checks that the two stay within a tolerance. The results are cached
+    apart ("stream" vs "result") for that reason.
+    """
+    if audio_file is None:
+        yield {"error": "Ingen fil uppladdad", "done": True}
+        return
+
+    metrics = RequestMetrics("transcribe_stream")
+    try:
+        cache_key = None
+        if result_cache:
+            with metrics.stage("cache"):
+                cache_key = result_cache.audio_key(audio_file)
+                # A full transcribe_audio result is as good as a streamed one
+                cached = (result_cache.get(cache_key, "result", RESULT_PARAMS)
+                          or result_cache.get(cache_key, "stream", STREAM_PARAMS))
+            if cached is not None:
+                print(f"Cache hit for {audio_file}", flush=True)
+                metrics.cache = "result"
+                yield finish_request(metrics, {**cached, "result_id": cache_key, "done": True, "progress": 1.0})
+                return
+
+        with metrics.stage("wait_for_models"):
+            not_ready = wait_for_models()
+        if not_ready:
+            yield finish_request(metrics, {**not_ready, "done": True}, "warming_up")
+            return
+
+        with metrics.stage("decode"):
+            waveform = load_audio(audio_file)
+        total_s = len(waveform) / SAMPLE_RATE
+        metrics.audio_s = total_s
+
+        turns = result_cache.get(cache_key, "diarization", DIARIZATION_PARAMS) if cache_key else None
+        dia_future = None
+        if turns is None and diarization_pipe:
+            print("Starting Speaker Diarization...", flush=True)
+            dia_future = submit_stage(diarization_executor, "diarization", metrics, run_diarization, waveform)
+
+        regions = speech_regions(waveform, **VAD_PARAMS) if VAD_ENABLED else None
+        chunks = []
+        sent = 0          # chunks already yielded
+        labelled = turns is not None
+        asr_s = 0.0
+        bounds = shard_bounds(total_s, STREAM_WINDOW_S - STREAM_OVERLAP_S, STREAM_OVERLAP_S)
+        for n, (window_start, window_end, keep_from, keep_to) in enumerate(bounds):
+            # Windows without any speech are skipped entirely
+            if regions is None or any(s < window_end and e > window_start for s, e in regions):
+                t0 = time.perf_counter()
+                # Slicing gives a view into the decoded buffer, no copy
+                window = waveform[int(window_start * SAMPLE_RATE):int(window_end * SAMPLE_RATE)]
+                result = submit_stage(asr_executor, "asr", metrics, pipe, window, return_timestamps=True).result()
+                asr_s += time.perf_counter() - t0
+                window_chunks = shift_chunks(result.get("chunks", []), window_start)
+                # An open end runs to the end of the window, not start + 2 s
+                if window_chunks and window_chunks[-1]["timestamp"][1] is None:
+                    window_chunks[-1]["timestamp"] = (window_chunks[-1]["timestamp"][0], window_end)
+                stitch_shards([(keep_from, keep_to, window_chunks)], chunks)
+
+            if turns is None and dia_future and dia_future.done():
+                diarization = dia_future.result()
+                turns = extract_turns(diarization) if diarization is not None else []
+            # Diarization just finished: relabel what the client already has
+            if turns is not None and not labelled:
+                labelled = True
+                sent = 0
+
+            if n + 1 < len(bounds):
+                message = {
+                    **merge_transcription(chunks[sent:], turns),
+                    "start_index": sent,
+                    "done": False,
+                    "progress": min(1.0, window_end / total_s),
+                }
+                sent = len(chunks)
+                if any(seg["text"] for seg in message["segments"]):
+                    _first_text(metrics)
+                yield message
+        # Summed over the windows, without the time they queued (asr_wait)
+        metrics.record("asr", asr_s - metrics.stages.get("asr_wait", {}).get("wall_s", 0.0))
+
+        # Final result waits for diarization
+        if dia_future:
+            diarization = dia_future.result()
+            turns = extract_turns(diarization) if diarization is not None else None
+            if cache_key and turns is not None:
+                result_cache.put(cache_key, "diarization", DIARIZATION_PARAMS, turns)
+
+        if not any(chunk["text"].strip() for chunk in chunks):
+            yield finish_request(metrics, {"error": "Ingen text kunde identifieras", "done": True}, "no_text")
+            return
+
+        with metrics.stage("merge"):
+            result_json = merge_transcription(chunks, turns)
+        if cache_key and (turns is not None or diarization_pipe is None):
+            result_cache.put(cache_key, "stream", STREAM_PARAMS, result_json)
+            result_json = {**result_json, "result_id": cache_key}
+        _first_text(metrics)
+        yield finish_request(metrics, {**result_json, "done": True, "progress": 1.0})
+
+    except Exception as e:
+        print(f"Error: {e}", flush=True)
+        yield finish_request(metrics, {"error": str(e), "done": True}, "error")
+
+def transcribe_batch(audio_files):
+    """
+    Transcribe many files in one request. The Whisper chunks of all files
+    share batches; each file gets the same JSON as transcribe_audio.
+    """
+    if not audio_files:
+        return {"error": "Ingen fil uppladdad"}
+
+    metrics = RequestMetrics("transcribe_batch")
+    with metrics.stage("wait_for_models"):
+        not_ready = wait_for_models()
+    if not_ready:
+        return finish_request(metrics, not_ready, "warming_up")
+
+    results = [{"file": os.path.basename(path)} for path in audio_files]
+
+    # 0. Decode every file once; files that fail to decode get their own error
+    decoded = []
+    with metrics.stage("decode"):
+        for i, path in enumerate(audio_files):
+            try:
+                decoded.append((i, load_audio(path)))
+            except Exception as e:
+                print(f"Decode failed for {path}: {e}", flush=True)
+                results[i]["error"] = str(e)
+
+    if decoded:
+        waveforms = [waveform for _, waveform in decoded]
+        metrics.audio_s = sum(len(w) for w in waveforms) / SAMPLE_RATE
+        try:
+            # 1 + 2. One batched Whisper pass over all files, diarization alongside
+            with metrics.stage("asr+diarization"):
+                print(f"Starting batched Whisper transcription of {len(waveforms)} files...", flush=True)
+                asr_future = submit_stage(asr_executor, "asr", metrics, run_asr, waveforms)
+
+                dia_future = None
+                if diarization_pipe:
+                    dia_future = submit_stage(diarization_executor, "diarization", metrics, run_diarization_all, waveforms)
+
+                whisper_results = asr_future.result()
+                diarizations = dia_future.result() if dia_future else [None] * len(waveforms)
+        except Exception as e:
+            print(f"Error: {e}", flush=True)
+            return finish_request(metrics, {"error": str(e)}, "error")
+
+        # 3. Merge per file
+        with metrics.stage("merge"):
+            for (i, _), whisper_result, diarization in zip(decoded, whisper_results, diarizations):
+                if not whisper_result.get("text", ""):
+                    results[i]["error"] = "Ingen text kunde identifieras"
+                    continue
+                results[i].update(merge_transcription(whisper_result.get("chunks", []), diarization))
+
+    print(f"Batch of {len(audio_files)} files done", flush=True)
+    return finish_request(metrics, {"results": results})
+
+def _live_asr(audio, **kwargs):
+    # Live passes queue with the other Whisper passes, within the same thread budget
+    return asr_executor.submit(pipe, audio, **kwargs).result()
+
+def _live_diarize(waveform):
+    # Called from the session's background thread; queues with the other diarization passes
+    return diarization_executor.submit(run_diarization, waveform).result()
+
+def transcribe_live(chunk, session):
+    """
+    One microphone chunk (sample rate, samples) of a live session.
+    Returns the session, which the UI keeps between chunks, and the
+    transcript so far with the not yet committed text as "tentative".
+    """
+    if chunk is None:
+        return session, session.result() if session else {}
+    if session is None:
+        not_ready = wait_for_models(timeout=0)
+        if not_ready:
+            return None, not_ready
+        session = LiveSession(_live_asr, _live_diarize if diarization_pipe else None,
+                              buffer_s=LIVE_BUFFER_S, window_s=LIVE_WINDOW_S, step_s=LIVE_STEP_S,
+                              latency_target_s=LIVE_LATENCY_TARGET_S,
+                              diarization_every_s=LIVE_DIARIZATION_EVERY_S,
+                              max_segments=LIVE_MAX_SEGMENTS)
+        session.metrics = RequestMetrics("transcribe_live")
+        print("Live session started", flush=True)
+    rate, samples = chunk
+    return session, session.feed(rate, samples)
+
+def finish_live(session):
+    # Recording stopped: commit the rest and label it with a last diarization run
+    if session is None:
+        return None, {}
+    result = session.finish()
+    session.metrics.audio_s = result["stats"]["audio_s"]
+    return None, finish_request(session.metrics, result)
+
+def close_live(session):
+    # Gradio dropped the session's state without a stop (tab closed, or idle
+    # past its time to live): end its metrics sampler and diarization thread
+    if session is None:
+        return
+    session.close()
+    session.metrics.audio_s = session.buffer.end / SAMPLE_RATE
+    session.metrics.finish("abandoned")
+    print("Live session closed without a stop", flush=True)
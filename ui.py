@@ -0,0 +1,368 @@
+import time
+t_import = time.perf_counter()
+import gradio as gr
+import os
+import imageio_ffmpeg
+# Add ffmpeg to path
+os.environ["PATH"] += os.pathsep + os.path.dirname(imageio_ffmpeg.get_ffmpeg_exe())
+
+import transcriber
+from jobs import JobManager
+from metrics import REGISTRY, start_metrics_server
+from transcriber import (close_live, finish_live, get_refined, get_segments, transcribe_audio,
+                         transcribe_batch, transcribe_compact, transcribe_live, transcribe_refine,
+                         transcribe_stream)
+
+# Requests per endpoint that Gradio runs at once (its default is 1); the
+# rest wait in Gradio's queue, at most GRADIO_QUEUE_MAX (0 = unbounded)
+GRADIO_CONCURRENCY = int(os.environ.get("GRADIO_CONCURRENCY", 1))
+GRADIO_QUEUE_MAX = int(os.environ.get("GRADIO_QUEUE_MAX", 0))
+# Live sessions hold their worker for as long as the microphone is on, so
+# they get their own limit instead of blocking the other endpoints
+LIVE_CONCURRENCY = int(os.environ.get("LIVE_CONCURRENCY", 2))
+# A live session that has not had a chunk for this long is closed
+LIVE_IDLE_S = float(os.environ.get("LIVE_IDLE_S", 600))
+
+# Background jobs: worker processes and how many jobs may wait before new ones are rejected
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 1))
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", 8))
+job_manager = JobManager(JOB_WORKERS, JOB_QUEUE_MAX)
+
+# Models load in the background so the UI and API come up right away;
+# /model_status reports progress and requests wait for readiness.
+transcriber.start_background_loading()
+
+# Prometheus scrape endpoint on its own port (Gradio owns the main one)
+METRICS_PORT = os.environ.get("METRICS_PORT")
+if METRICS_PORT:
+    start_metrics_server(int(METRICS_PORT))
+
+# Custom CSS with Apple Siri gradient and glassmorphism
+custom_css = """
+@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
+
+:root {
+    --siri-gradient: linear-gradient(90deg, #D6249F 0%, #FD5949 33%, #285AEB 66%, #0071E3 100%);
+    --siri-glow: radial-gradient(circle at 50% 50%, rgba(40, 90, 235, 0.15), transparent 70%);
+    --glass-bg: rgba(255, 255, 255, 0.7);
+    --glass-border: rgba(0, 0, 0, 0.1);
+    --primary-color: #0071E3;
+    --success-color: #34C759;
+}
+
+* {
+    font-family: 'Inter', -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif !important;
+}
+
+.gradio-container {
+    background: linear-gradient(135deg, #f5f7fa 0%, #c3cfe2 100%) !important;
+    font-family: 'Inter', sans-serif !important;
+}
+
+.gradio-container::before {
+    content: '';
+    position: fixed;
+    top: -50%;
+    left: -50%;
+    width: 200%;
+    height: 200%;
+    background: var(--siri-glow);
+    pointer-events: none;
+    z-index: 0;
+    opacity: 0.6;
+}
+
+h1, .gr-markdown h1 {
+    background: var(--siri-gradient) !important;
+    -webkit-background-clip: text !important;
+    -webkit-text-fill-color: transparent !important;
+    background-clip: text !important;
+    font-weight: 700 !important;
+    letter-spacing: -0.02em !important;
+    font-size: 3rem !important;
+    margin-bottom: 0.5rem !important;
+}
+
+.gr-box {
+    background: var(--glass-bg) !important;
+    backdrop-filter: blur(20px) !important;
+    -webkit-backdrop-filter: blur(20px) !important;
+    border: 1px solid var(--glass-border) !important;
+    border-radius: 20px !important;
+    box-shadow: 0 8px 32px rgba(0, 0, 0, 0.08) !important;
+}
+
+.gr-button-primary {
+    background: var(--primary-color) !important;
+    border: none !important;
+    border-radius: 980px !important;
+    font-weight: 600 !important;
+    padding: 16px 24px !important;
+    box-shadow: 0 4px 12px rgba(0, 113, 227, 0.2) !important;
+    transition: all 0.2s ease !important;
+}
+
+.gr-button-primary:hover {
+    background: #0077ED !important;
+    transform: translateY(-2px) !important;
+    box-shadow: 0 6px 20px rgba(0, 113, 227, 0.3) !important;
+}
+
+.gr-input, .gr-textbox {
+    border-radius: 12px !important;
+    border: 1.5px solid var(--glass-border) !important;
+    transition: all 0.2s ease !important;
+}
+
+.gr-input:focus, .gr-textbox:focus {
+    border-color: var(--primary-color) !important;
+    box-shadow: 0 0 0 4px rgba(0, 113, 227, 0.1) !important;
+}
+
+.gr-file-upload {
+    border: 2px dashed var(--glass-border) !important;
+    border-radius: 20px !important;
+    background: rgba(255, 255, 255, 0.9) !important;
+    transition: all 0.3s ease !important;
+}
+
+.gr-file-upload:hover {
+    border-color: var(--primary-color) !important;
+    background: rgba(0, 113, 227, 0.03) !important;
+    transform: translateY(-2px) !important;
+}
+
+@keyframes fadeIn {
+    from {
+        opacity: 0;
+        transform: scale(0.96) translateY(10px);
+    }
+    to {
+        opacity: 1;
+        transform: scale(1) translateY(0);
+    }
+}
+
+.gradio-container > div {
+    animation: fadeIn 0.6s ease-out !important;
+}
+"""
+
+# Create Gradio interface with premium design
+with gr.Blocks(title="Svensk Transkribering", theme=gr.themes.Soft(), css=custom_css) as demo:
+    gr.Markdown(
+        """
+        # 🎙️ Svensk Transkribering
+        
+        AI-driven tal-till-text med **KBLab Whisper** - optimerad för svenska!
+        
+        ### Hur man använder:
+        1. Ladda upp en ljudfil
+        2. Klicka "Transkribera"
+        3. Vänta på resultatet (första gången kan ta 20-30 sekunder)
+        """
+    )
+    
+    with gr.Row():
+        with gr.Column():
+            audio_input = gr.Audio(
+                label="🎵 Ljudfil",
+                type="filepath",
+                sources=["upload"]
+            )
+            transcribe_btn = gr.Button("🚀 Transkribera", variant="primary", size="lg")
+            stream_btn = gr.Button("⚡ Transkribera med direktvisning", size="lg")
+            refine_btn = gr.Button("🔬 Utkast + förfining med större modell", size="lg")
+            refine_id_box = gr.Textbox(label="Förfinings-id")
+            refined_btn = gr.Button("Hämta förfinat resultat")
+        
+        with gr.Column():
+            # Changed to JSON output for frontend compatibility
+            output_json = gr.JSON(
+                label="📝 Resultat Data"
+            )
+    
+    gr.Markdown(
+        """
+        ---
+        **Tips:** 
+        - Första gången kan ta 20-30 sekunder (modellen startas)
+        - Bäst resultat med tydligt tal på svenska
+        - Stöder mp3, wav, m4a och andra ljudformat
+        """
+    )
+    
+    # Connect button to function (no token input needed)
+    transcribe_btn.click(
+        fn=transcribe_audio,
+        inputs=[audio_input],
+        outputs=output_json,
+        api_name="/transcribe_v2"
+    )
+
+    # Generator endpoint: yields partial results while the file is processed
+    stream_btn.click(
+        fn=transcribe_stream,
+        inputs=[audio_input],
+        outputs=output_json,
+        api_name="/transcribe_stream"
+    )
+
+    # Draft from the small model right away; the refined result is fetched later
+    def refine(audio_file):
+        result = transcribe_refine(audio_file)
+        return result.get("refine_id", ""), result
+
+    refine_btn.click(
+        fn=refine,
+        inputs=[audio_input],
+        outputs=[refine_id_box, output_json],
+        api_name="/transcribe_refine"
+    )
+    refined_btn.click(
+        fn=get_refined,
+        inputs=[refine_id_box],
+        outputs=output_json,
+        api_name="/refined"
+    )
+
+    with gr.Tab("Jobb"):
+        gr.Markdown("Långa filer: skicka in som jobb och hämta resultatet när det är klart.")
+        job_audio = gr.Audio(
+            label="🎵 Ljudfil",
+            type="filepath",
+            sources=["upload"]
+        )
+        job_submit_btn = gr.Button("📨 Skicka jobb")
+        job_id_box = gr.Textbox(label="Jobb-id")
+        with gr.Row():
+            job_status_btn = gr.Button("Status")
+            job_result_btn = gr.Button("Hämta resultat")
+        job_out = gr.JSON(label="📝 Jobb")
+
+        def submit_job(audio_file):
+            info = job_manager.submit(audio_file)
+            return info.get("job_id", ""), info
+
+        job_submit_btn.click(
+            fn=submit_job,
+            inputs=[job_audio],
+            outputs=[job_id_box, job_out],
+            api_name="/job_submit"
+        )
+        job_status_btn.click(
+            fn=lambda job_id: job_manager.status(job_id.strip()),
+            inputs=[job_id_box],
+            outputs=job_out,
+            api_name="/job_status"
+        )
+        job_result_btn.click(
+            fn=lambda job_id: job_manager.result(job_id.strip()),
+            inputs=[job_id_box],
+            outputs=job_out,
+            api_name="/job_result"
+        )
+
+    with gr.Tab("Segment"):
+        gr.Markdown("Kompakt format för långa filer och sidvis hämtning av segment (via resultat-id).")
+        compact_audio = gr.Audio(
+            label="🎵 Ljudfil",
+            type="filepath",
+            sources=["upload"]
+        )
+        compact_btn = gr.Button("🚀 Transkribera (kompakt)")
+        result_id_box = gr.Textbox(label="Resultat-id")
+        with gr.Row():
+            seg_start_index = gr.Number(label="Från segment", value=0, precision=0)
+            seg_count = gr.Number(label="Antal", value=transcriber.SEGMENT_PAGE_SIZE, precision=0)
+            seg_start_s = gr.Number(label="Från tid (s)", value=None)
+            seg_end_s = gr.Number(label="Till tid (s)", value=None)
+        segments_btn = gr.Button("Hämta segment")
+        segments_out = gr.JSON(label="📝 Segment")
+
+        compact_btn.click(
+            fn=transcribe_compact,
+            inputs=[compact_audio],
+            outputs=segments_out,
+            api_name="/transcribe_compact"
+        )
+        segments_btn.click(
+            fn=get_segments,
+            inputs=[result_id_box, seg_start_index, seg_count, seg_start_s, seg_end_s],
+            outputs=segments_out,
+            api_name="/segments"
+        )
+
+    with gr.Tab("Live"):
+        gr.Markdown("Tala i mikrofonen; texten visas medan du pratar. Texten under \"tentative\" kan fortfarande ändras.")
+        live_audio = gr.Audio(
+            label="🎙️ Mikrofon",
+            sources=["microphone"],
+            streaming=True,
+            type="numpy"
+        )
+        # Closing the tab or going idle drops the state; close_live frees the session
+        live_state = gr.State(None, time_to_live=LIVE_IDLE_S, delete_callback=close_live)
+        live_out = gr.JSON(label="📝 Transkription")
+
+        live_audio.stream(
+            fn=transcribe_live,
+            inputs=[live_audio, live_state],
+            outputs=[live_state, live_out],
+            show_progress="hidden",
+            api_name="/transcribe_live",
+            concurrency_limit=LIVE_CONCURRENCY,
+            concurrency_id="live"
+        )
+        live_audio.stop_recording(
+            fn=finish_live,
+            inputs=[live_state],
+            outputs=[live_state, live_out],
+            api_name="/finish_live",
+            concurrency_limit=LIVE_CONCURRENCY,
+            concurrency_id="live"
+        )
+
+    with gr.Tab("Batch"):
+        batch_input = gr.File(
+            label="🎵 Ljudfiler",
+            file_count="multiple",
+            type="filepath"
+        )
+        batch_btn = gr.Button("🚀 Transkribera alla")
+        batch_out = gr.JSON(label="📝 Resultat per fil")
+
+        batch_btn.click(
+            fn=transcribe_batch,
+            inputs=[batch_input],
+            outputs=batch_out,
+            api_name="/transcribe_batch"
+        )
+
+    with gr.Tab("System Check (Debug)"):
+        sys_btn = gr.Button("Check FFmpeg")
+        sys_out = gr.Textbox(label="System Info")
+        
+        def check_system():
+            import subprocess
+            try:
+                # Check ffmpeg
+                cmd = "ffmpeg -version"
+                output = subprocess.check_output(cmd.split(), stderr=subprocess.STDOUT).decode()
+                return f"✅ FFmpeg found:\n{output[:200]}..."
+            except Exception as e:
+                return f"❌ FFmpeg error: {str(e)}\n\nPATH: {os.environ.get('PATH')}"
+        
+        sys_btn.click(check_system, outputs=sys_out, api_name="/sys_info")
+
+        status_btn = gr.Button("Model Status")
+        status_out = gr.JSON(label="Model Status")
+        status_btn.click(transcriber.get_model_status, outputs=status_out, api_name="/model_status")
+
+        metrics_btn = gr.Button("Metrics")
+        metrics_out = gr.Textbox(label="Metrics (Prometheus)", lines=20)
+        metrics_btn.click(REGISTRY.render, outputs=metrics_out, api_name="/metrics")
+
+demo.queue(default_concurrency_limit=GRADIO_CONCURRENCY, max_size=GRADIO_QUEUE_MAX or None)
+
+print(f"[startup] UI ready after {time.perf_counter() - t_import:.2f}s (models loading in background)", flush=True)
@@ -0,0 +1,174 @@
+"""
+Checks the proxy's hedging, failover, timeouts and circuit breaker
+(server.py) against local stand-in backends.
+
+Each stand-in answers POSTs after a configurable delay with a fixed
+status and counts the requests it got. The proxy runs in this process
+with several backends and short hedge/timeout settings. The last checks
+use the in-process "local" backend with stub models.
+
+Usage: python verify_hedging.py
+"""
+import http.client
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Short settings so the checks run in seconds; read by server.py at import
+os.environ.update({
+    "HEDGE_MIN_DELAY_S": "0.3",
+    "HEDGE_DEFAULT_DELAY_S": "0.3",
+    "CIRCUIT_FAILURES": "3",
+    "CIRCUIT_OPEN_S": "2",
+    "STUB_MODELS": "1",
+    "STUB_ASR_RTF": "0.01",
+    "CACHE_DIR": "",
+    "SHARD_WORKERS": "0",
+})
+
+import server
+from bench_pipeline import synthetic_meeting_audio, write_wav
+from loadtest_proxy import free_port, wait_for_port
+
+class StandIn:
+    # A backend that answers every POST with `status` after `delay_s`
+    def __init__(self, name, delay_s=0.0, status=200):
+        self.name = name
+        self.delay_s = delay_s
+        self.status = status
+        self.requests = 0
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stand_in.requests += 1
+                time.sleep(stand_in.delay_s)
+                body = json.dumps({"text": stand_in.name} if stand_in.status == 200
+                                  else {"error": "Model is currently loading"}).encode()
+                try:
+                    self.send_response(stand_in.status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass  # the proxy hung up on a lost or timed-out attempt
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(("localhost", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.url = f"http://localhost:{self.httpd.server_address[1]}/models/{name}"
+
+def start_proxy(urls, timeouts=()):
+    port = free_port()
+    httpd = server.make_server(port, target_urls=urls, timeouts=list(timeouts), transcode=False)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    wait_for_port(port)
+    return httpd, port
+
+def post(port, body=b"audio" * 1000, content_type="application/octet-stream"):
+    conn = http.client.HTTPConnection("localhost", port, timeout=60)
+    t0 = time.perf_counter()
+    conn.request("POST", "/api/transcribe", body=body, headers={"Content-Type": content_type})
+    response = conn.getresponse()
+    data = json.loads(response.read())
+    conn.close()
+    return response.status, data, time.perf_counter() - t0
+
+failures = 0
+
+def check(name, ok, detail):
+    global failures
+    print(f"{'PASS' if ok else 'FAIL'}: {name} ({detail})", flush=True)
+    if not ok:
+        failures += 1
+
+def main():
+    # 1. A slow primary is hedged after the delay; the fast secondary wins
+    slow, fast = StandIn("slow", delay_s=3.0), StandIn("fast", delay_s=0.1)
+    httpd, port = start_proxy([slow.url, fast.url])
+    status, data, seconds = post(port)
+    check("hedge on a slow backend", status == 200 and data.get("text") == "fast" and seconds < 1.5,
+          f"{status} {data} in {seconds:.2f}s")
+    httpd.shutdown()
+
+    # 2. A 503 ("model loading") fails over right away, without waiting for the hedge delay
+    loading, fast = StandIn("loading", status=503), StandIn("fast")
+    httpd, port = start_proxy([loading.url, fast.url])
+    status, data, seconds = post(port)
+    check("failover on 503", status == 200 and data.get("text") == "fast" and seconds < 0.3,
+          f"{status} {data} in {seconds:.2f}s")
+
+    # 3. Repeated failures open the circuit: the failing backend is skipped, then retried
+    for _ in range(4):
+        post(port)
+    before = loading.requests
+    post(port)
+    post(port)
+    check("circuit opens after repeated failures", loading.requests == before == 3,
+          f"{loading.requests} requests reached the failing backend")
+    time.sleep(2.1)
+    loading.status = 200
+    post(port)
+    status, data, _ = post(port)
+    check("circuit closes after a good trial", data.get("text") == "loading" and loading.requests == 5,
+          f"{data}, {loading.requests} requests reached it")
+    httpd.shutdown()
+
+    # 4. Per-backend timeouts: hung backends give a 504, not an endless wait
+    hung, hung2 = StandIn("hung", delay_s=5.0), StandIn("hung2", delay_s=5.0)
+    httpd, port = start_proxy([hung.url, hung2.url], timeouts=[0.5, 0.5])
+    status, data, seconds = post(port)
+    check("timeout per backend", status == 504 and seconds < 2.0, f"{status} {data} in {seconds:.2f}s")
+    httpd.shutdown()
+
+    # 5. The in-process backend (stub models) takes over when the remote one is down
+    down = f"http://localhost:{free_port()}/models/down"
+    httpd, port = start_proxy([down, server.LOCAL_BACKEND])
+    waveform, _ = synthetic_meeting_audio(20)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "meeting.wav")
+        write_wav(path, waveform)
+        with open(path, "rb") as f:
+            status, data, seconds = post(port, f.read(), "audio/wav")
+    check("local fallback", status == 200 and data.get("text", "").strip().startswith("ord") and data.get("chunks"),
+          f"{status} text={data.get('text', '')[:30]!r} in {seconds:.2f}s")
+
+    # Stats for every backend are exported
+    conn = http.client.HTTPConnection("localhost", port)
+    conn.request("GET", "/api/metrics")
+    metrics = conn.getresponse().read().decode()
+    check("per-backend metrics", 'proxy_backend_requests_total{backend="local",outcome="ok"} 1' in metrics,
+          "proxy_backend_* in /api/metrics")
+    httpd.shutdown()
+
+    # 6. The local backend warming up answers 503 but does not open its circuit
+    class WarmingUp(server.LocalBackend):
+        def __init__(self):
+            server.Backend.__init__(self, "warming", 1.0)
+
+        def send(self, attempt, headers, body):
+            return 503, "application/json", b'{"status": "warming_up"}'
+
+    warming = WarmingUp()
+    results = server.queue.Queue()
+    for _ in range(server.CIRCUIT_FAILURES + 1):
+        server._run_attempt(server.Attempt(warming), {}, [], 0, results)
+    check("warm-up does not open the circuit", warming.state() == "closed" and results.qsize() == server.CIRCUIT_FAILURES + 1,
+          f"{warming.state()}, outcomes {warming.outcomes}")
+
+    print("All checks passed" if not failures else f"{failures} check(s) failed")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
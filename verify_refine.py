@@ -0,0 +1,55 @@
+"""
+Checks the two-tier refinement (refine.py) with the stub models: low
+confidence segments get the larger model's text over their whole length,
+also when they are longer than one 30 s Whisper window.
+
+Usage: python verify_refine.py
+"""
+import sys
+
+import numpy as np
+
+from audio import SAMPLE_RATE
+from refine import MAX_SEGMENT_S, low_confidence, refine_segments, score_segments
+from stub_models import StubASRPipeline
+
+failures = 0
+
+def check(name, ok, detail):
+    global failures
+    print(f"{'PASS' if ok else 'FAIL'}: {name} ({detail})", flush=True)
+    if not ok:
+        failures += 1
+
+def main():
+    waveform = np.zeros(int(90 * SAMPLE_RATE), dtype=np.float32)
+    refine_asr = StubASRPipeline(rtf=0.0, word="stor")
+    draft = {"segments": [
+        {"start": 0.0, "end": 8.0, "speaker": "SPEAKER_00", "text": "hej hej hej hej hej hej hej hej hej hej"},
+        {"start": 8.0, "end": 20.0, "speaker": "SPEAKER_01", "text": "det här gick bra"},
+        {"start": 20.0, "end": 65.0, "speaker": "SPEAKER_00", "text": "igen " * 40},
+    ], "unique_speakers": ["SPEAKER_00", "SPEAKER_01"]}
+
+    scores = score_segments(None, waveform, draft["segments"], "compression")
+    indices = [i for i, score in enumerate(scores) if low_confidence(score)]
+    check("repetition loops are low confidence", indices == [0, 2], f"indices {indices}, scores {scores}")
+
+    refined = refine_segments(refine_asr, waveform, draft, indices, batch_size=4)
+    segments = refined["segments"]
+    check("confident segment kept", segments[1]["text"] == draft["segments"][1]["text"] and not segments[1].get("refined"),
+          repr(segments[1]["text"]))
+
+    # The stub emits one word per 4 s of audio it was given
+    long_s = draft["segments"][2]["end"] - draft["segments"][2]["start"]
+    expected = " ".join(f"stor{i}" for i in range(int(np.ceil(long_s / refine_asr.chunk_s))))
+    check(f"segment longer than {MAX_SEGMENT_S:g} s refined in full",
+          segments[2]["text"] == expected and segments[2].get("refined"), repr(segments[2]["text"]))
+    check("timestamps and speakers unchanged",
+          [(s["start"], s["end"], s["speaker"]) for s in segments]
+          == [(s["start"], s["end"], s["speaker"]) for s in draft["segments"]], "3 segments")
+
+    print("All checks passed" if not failures else f"{failures} check(s) failed")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
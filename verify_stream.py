@@ -0,0 +1,92 @@
+"""
+Checks that /transcribe_stream (transcriber.transcribe_stream) agrees
+with /transcribe_v2 (transcribe_audio) on the same file, with the stub
+models. The stream decodes overlapping 30 s windows and stitches them, so
+the segmentation may differ a little; the segment count must stay within
+--tolerance of the non-streaming one, the segments must be in order
+without overlaps, cover the same stretch of audio and name the same
+speakers. The partial messages must add up to the final transcript, and
+the time to first text must be recorded.
+
+Usage: python verify_stream.py [--durations 60 200 600] [--tolerance 0.1]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+# Read by transcriber at import
+os.environ.update({
+    "STUB_MODELS": "1",
+    "STUB_ASR_RTF": "0.002",
+    "STUB_DIARIZATION_RTF": "0.001",
+    "CACHE_DIR": "",
+    "ATTACH_METRICS": "1",
+    "SHARD_WORKERS": "0",
+})
+
+import transcriber
+from bench_pipeline import synthetic_meeting_audio, write_wav
+
+failures = 0
+
+def check(name, ok, detail):
+    global failures
+    print(f"{'PASS' if ok else 'FAIL'}: {name} ({detail})", flush=True)
+    if not ok:
+        failures += 1
+
+def stream(path):
+    # The final message, and the transcript rebuilt from the partial ones
+    rebuilt = []
+    for message in transcriber.transcribe_stream(path):
+        if message.get("done"):
+            return message, rebuilt
+        del rebuilt[message["start_index"]:]
+        rebuilt.extend(message["segments"])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[60, 200, 600])
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed relative difference in segment count")
+    args = parser.parse_args()
+
+    transcriber.load_models()
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration_s in args.durations:
+            path = os.path.join(tmp, f"meeting_{int(duration_s)}s.wav")
+            waveform, _ = synthetic_meeting_audio(duration_s)
+            write_wav(path, waveform)
+
+            full = transcriber.transcribe_audio(path)
+            final, rebuilt = stream(path)
+            label = f"{duration_s:g}s"
+            if "error" in full or "error" in final:
+                check(f"{label}: both transcribe", False, f"{full.get('error')} / {final.get('error')}")
+                continue
+
+            a, b = full["segments"], final["segments"]
+            allowed = max(1, round(args.tolerance * len(a)))
+            check(f"{label}: segment count", abs(len(a) - len(b)) <= allowed,
+                  f"{len(b)} streamed vs {len(a)}, allowed ±{allowed}")
+            check(f"{label}: in order, no overlaps",
+                  all(s["end"] <= t["start"] + 1e-6 for s, t in zip(b, b[1:])), f"{len(b)} segments")
+            check(f"{label}: same stretch of audio",
+                  abs(a[0]["start"] - b[0]["start"]) <= 1.0 and abs(a[-1]["end"] - b[-1]["end"]) <= 1.0,
+                  f"{b[0]['start']:.1f}-{b[-1]['end']:.1f}s vs {a[0]['start']:.1f}-{a[-1]['end']:.1f}s")
+            check(f"{label}: same speakers", full["unique_speakers"] == final["unique_speakers"],
+                  f"{final['unique_speakers']}")
+            # The last window only arrives with the final message, and labels
+            # may still change there if diarization finished last
+            check(f"{label}: partial messages add up",
+                  [(s["start"], s["text"]) for s in rebuilt] == [(s["start"], s["text"]) for s in b[:len(rebuilt)]],
+                  f"{len(rebuilt)} segments streamed before the final message")
+            first_text = final["metrics"]["stages"].get("first_text", {}).get("wall_s")
+            check(f"{label}: first text recorded", first_text is not None and first_text <= final["metrics"]["wall_s"],
+                  f"{first_text}s of {final['metrics']['wall_s']}s")
+
+    print("All checks passed" if not failures else f"{failures} check(s) failed")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Memory-bounded diarization of long recordings.
+
+pyannote's memory use grows with the length of the input, so multi-hour
+recordings are diarized in fixed windows instead. Each window returns
+its turns plus one embedding per local speaker; the local speakers of all
+windows are then clustered on those embeddings (average linkage, cosine
+distance) so one person keeps the same label for the whole recording.
+Windows overlap like the ASR shards (sharding.shard_bounds), so no turn
+is cut off at a window edge; each overlap is split at its midpoint.
+"""
+import numpy as np
+
+from audio import SAMPLE_RATE, diarization_input
+from merge import extract_turns
+from sharding import shard_bounds
+
+def _diarize_window(pipeline, waveform):
+    # Returns (turns, {local label: embedding})
+    diarization, embeddings = pipeline(diarization_input(waveform), return_embeddings=True)
+    turns = extract_turns(diarization)
+    labels = diarization.labels() if hasattr(diarization, "labels") else sorted({s for _, _, s in turns})
+    return turns, dict(zip(labels, embeddings))
+
+def link_speakers(embeddings, windows, threshold):
+    """
+    Average-linkage agglomerative clustering on cosine distance.
+    `windows[i]` is the window of embedding i; speakers from the same
+    window were already told apart by pyannote and are never merged.
+    Returns one cluster id per embedding.
+    """
+    vectors = np.asarray(embeddings, dtype=np.float64)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    distance = 1.0 - vectors @ vectors.T
+    windows = np.asarray(windows)
+    distance[windows[:, None] == windows[None, :]] = np.inf
+
+    members = [[i] for i in range(len(vectors))]
+    while True:
+        a, b = np.unravel_index(np.argmin(distance), distance.shape)
+        if distance[a, b] >= threshold:
+            break
+        # Lance-Williams update for average linkage; inf (same window) stays inf
+        size_a, size_b = len(members[a]), len(members[b])
+        merged = (size_a * distance[a] + size_b * distance[b]) / (size_a + size_b)
+        distance[a, :] = distance[:, a] = merged
+        distance[a, a] = np.inf
+        distance[b, :] = distance[:, b] = np.inf
+        members[a] += members[b]
+        members[b] = []
+
+    labels = [0] * len(vectors)
+    for cluster_id, cluster in enumerate(m for m in members if m):
+        for i in cluster:
+            labels[i] = cluster_id
+    return labels
+
+def diarize_windowed(pipeline, waveform, window_s, threshold, overlap_s=0.0, min_last_s=0.0):
+    """
+    Diarize `waveform` in windows of `window_s` seconds that overlap by
+    `overlap_s` and relabel the speakers globally. A last window shorter
+    than `min_last_s` (too little audio for pyannote to cluster) is merged
+    into the previous one. Returns (start, end, speaker) turns on the full
+    timeline, with speakers numbered in order of first appearance.
+    """
+    bounds = shard_bounds(len(waveform) / SAMPLE_RATE, window_s, overlap_s, min_last_s)
+    turns = []         # (start, end, index into keys)
+    keys = []          # (window, local label)
+    embeddings = []
+    for w, (start_s, end_s, keep_from, keep_to) in enumerate(bounds):
+        # Slices are views; only one window is in pyannote at a time
+        window = waveform[int(start_s * SAMPLE_RATE):int(end_s * SAMPLE_RATE)]
+        local_turns, local_embeddings = _diarize_window(pipeline, window)
+        index = {}
+        for label, embedding in local_embeddings.items():
+            # pyannote returns NaN for speakers with too little speech to embed;
+            # their few turns are dropped rather than given a label of their own
+            if np.all(np.isfinite(embedding)):
+                index[label] = len(keys)
+                keys.append((w, label))
+                embeddings.append(embedding)
+        # Each window keeps only its part of the overlaps
+        for start, end, label in local_turns:
+            start, end = max(start + start_s, keep_from), min(end + start_s, keep_to)
+            if label in index and end > start:
+                turns.append((start, end, index[label]))
+        print(f"Diarized window {w + 1}: {len(index)} speakers", flush=True)
+
+    if not keys:
+        return []
+    clusters = link_speakers(embeddings, [w for w, _ in keys], threshold)
+
+    # Number the global speakers by their first turn
+    names = {}
+    for _, _, i in sorted(turns):
+        names.setdefault(clusters[i], f"SPEAKER_{len(names):02d}")
+    print(f"Linked {len(keys)} window speakers into {len(names)} speakers", flush=True)
+    return [(start, end, names[clusters[i]]) for start, end, i in turns]